@@ -70,6 +70,22 @@ def create_app():
     app.register_blueprint(dashboard_bp, url_prefix='/dashboard')
     app.register_blueprint(stocks_bp, url_prefix='/stocks')
     app.register_blueprint(api_bp)
+
+    # Second cache tier shared by every worker process
+    if app.config.get('SHARED_CACHE_PATH'):
+        from app.utils.cache import attach_shared_store
+        attach_shared_store(app.config['SHARED_CACHE_PATH'])
+
+    # Web processes follow the change log so their caches drop outdated entries,
+    # and warm their caches for the symbols users hold or watch
+    from app.services.change_events import change_subscriber
+    from app.services.cache_warmup import cache_warmup
+
+    @app.before_request
+    def start_background_services():
+        change_subscriber.ensure_started(app)
+        cache_warmup.ensure_started(app)
+
     # Register error handlers
     @app.errorhandler(500)
     def internal_error(error):
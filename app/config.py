@@ -9,5 +9,27 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.getenv('SECRET_KEY')
 
+    # Symbol search index: optional CSV (symbol,name,type,exchange) with the full listed universe
+    SYMBOL_UNIVERSE_FILE = os.getenv('SYMBOL_UNIVERSE_FILE')
+    SYMBOL_INDEX_REFRESH_SECONDS = int(os.getenv('SYMBOL_INDEX_REFRESH_SECONDS', 3600))
+
+    # Overall deadline in seconds for requests that fetch several symbols at once
+    PROVIDER_FANOUT_TIMEOUT = float(os.getenv('PROVIDER_FANOUT_TIMEOUT', 8))
+    # Timeout per provider call, and the total a single request may spend on provider calls
+    PROVIDER_CALL_TIMEOUT = float(os.getenv('PROVIDER_CALL_TIMEOUT', 5))
+    PROVIDER_REQUEST_BUDGET = float(os.getenv('PROVIDER_REQUEST_BUDGET', 10))
+
+    # How often each web process polls the change_events table (0 disables it)
+    CHANGE_EVENT_POLL_SECONDS = float(os.getenv('CHANGE_EVENT_POLL_SECONDS', 5))
+
+    # SQLite file shared by all workers as the second cache tier (empty disables it)
+    SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH', 'cache/shared_cache.sqlite')
+    # Preload and prefetch the symbols users hold or watch when a worker starts
+    CACHE_WARMUP = os.getenv('CACHE_WARMUP', 'true').lower() in ('1', 'true', 'yes')
+
+    # Storage precision of feature matrices, indicator columns and symbol panels
+    # (float32 or float64); indicators are always computed in float64
+    FEATURE_DTYPE = os.getenv('FEATURE_DTYPE', 'float32')
+
     # Logging
     LOG_LEVEL = logging.DEBUG
\ No newline at end of file
@@ -104,4 +104,171 @@ class Watchlist(db.Model):
     )
 
     def __repr__(self):
-        return f'<Watchlist {self.stock_id} for User {self.user_id}>'
\ No newline at end of file
+        return f'<Watchlist {self.stock_id} for User {self.user_id}>'
+
+class PortfolioSnapshot(db.Model):
+    """Precomputed portfolio summary per user, read by the dashboard"""
+    __tablename__ = 'portfolio_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, unique=True)
+    total_value = db.Column(db.Float, nullable=False, default=0)
+    total_cost = db.Column(db.Float, nullable=False, default=0)
+    total_return = db.Column(db.Float, nullable=False, default=0)  # Absolute gain
+    total_return_pct = db.Column(db.Float, nullable=False, default=0)
+    daily_change = db.Column(db.Float, nullable=False, default=0)  # Percent change since previous close
+    daily_change_value = db.Column(db.Float, nullable=False, default=0)
+    holdings = db.Column(db.JSON, nullable=False, default=list)  # Per-holding metrics
+    computed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    stale = db.Column(db.Boolean, nullable=False, default=False)  # Holdings or prices changed since computed_at
+
+    def to_summary(self):
+        return {
+            'total_value': self.total_value,
+            'total_cost': self.total_cost,
+            'total_return': self.total_return,
+            'total_return_pct': self.total_return_pct,
+            'daily_change': self.daily_change,
+            'daily_change_value': self.daily_change_value,
+            'computed_at': self.computed_at.isoformat()
+        }
+
+    def __repr__(self):
+        return f'<PortfolioSnapshot {self.user_id}:{self.computed_at}>'
+
+
+class PortfolioValueDaily(db.Model):
+    """Daily portfolio value per user, built from holdings and daily closes"""
+    __tablename__ = 'portfolio_value_daily'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    value = db.Column(db.Float, nullable=False)  # Market value of the positions held that day
+    cost = db.Column(db.Float, nullable=False)  # Purchase cost of the same positions
+    positions = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'date', name='idx_user_value_date'),  # Range scans per user
+    )
+
+    def __repr__(self):
+        return f'<PortfolioValueDaily {self.user_id}:{self.date}>'
+
+
+class ChangeEvent(db.Model):
+    """Append-only log of data changes, polled by web processes to invalidate their caches"""
+    __tablename__ = 'change_events'
+
+    id = db.Column(db.Integer, primary_key=True)  # Monotonic cursor for subscribers
+    symbol = db.Column(db.String(10), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'quote' or 'history'
+    last_bar_ts = db.Column(db.DateTime)  # Newest bar stored by the change, if any
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<ChangeEvent {self.id} {self.kind}:{self.symbol}>'
+
+
+class IndicatorState(db.Model):
+    """Streaming indicator state per stock, indicator and parameters, advanced as bars are stored"""
+    __tablename__ = 'indicator_states'
+
+    id = db.Column(db.Integer, primary_key=True)
+    stock_id = db.Column(db.Integer, db.ForeignKey('stocks.id'), nullable=False)
+    indicator = db.Column(db.String(30), nullable=False)
+    params = db.Column(db.String(100), nullable=False)  # Canonical JSON of the parameters
+    state = db.Column(db.JSON, nullable=False)  # State after the last bar
+    previous_state = db.Column(db.JSON, nullable=False)  # State before the last bar, for revised bars
+    value = db.Column(db.JSON, nullable=False)  # Latest outputs
+    last_bar_ts = db.Column(db.DateTime)
+    bars = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('stock_id', 'indicator', 'params', name='idx_stock_indicator_params'),
+    )
+
+    def __repr__(self):
+        return f'<IndicatorState {self.stock_id}:{self.indicator}{self.params}>'
+
+
+class IndicatorSnapshot(db.Model):
+    """Latest daily indicator values per stock, refreshed for the whole universe in one batch"""
+    __tablename__ = 'indicator_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    stock_id = db.Column(db.Integer, db.ForeignKey('stocks.id'), nullable=False, unique=True)
+    bar_date = db.Column(db.Date)  # Day of the stock's last bar
+    values = db.Column(db.JSON, nullable=False)  # Indicator name -> value, None when undefined
+    computed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<IndicatorSnapshot {self.stock_id}:{self.bar_date}>'
+
+
+class RefreshJob(db.Model):
+    """Background price refresh of a user's holdings, readable from every web process"""
+    __tablename__ = 'refresh_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    items = db.relationship(
+        'RefreshJobItem', backref='job', lazy=True, order_by='RefreshJobItem.id', cascade='all, delete-orphan'
+    )
+
+    def to_dict(self):
+        results = []
+        errors = {}
+        completed = 0
+
+        for item in self.items:
+            if item.status == 'pending':
+                continue
+            completed += 1
+            if item.status == 'error':
+                errors[item.symbol] = item.error
+            else:
+                results.append({'symbol': item.symbol, 'price': item.price})
+
+        total = len(self.items)
+        if completed < total:
+            status = 'running' if completed else 'queued'
+        else:
+            status = 'failed' if total and len(errors) == total else 'completed'
+
+        return {
+            'job_id': self.id,
+            'status': status,
+            'total': total,
+            'completed': completed,
+            'progress': round(completed / total * 100, 1) if total else 100.0,
+            'results': results,
+            'errors': errors,
+            'created_at': self.created_at.isoformat()
+        }
+
+    @property
+    def finished(self):
+        return all(item.status != 'pending' for item in self.items)
+
+    def __repr__(self):
+        return f'<RefreshJob {self.id}>'
+
+
+class RefreshJobItem(db.Model):
+    """One symbol of a refresh job, written by the worker when its refresh finishes"""
+    __tablename__ = 'refresh_job_items'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(32), db.ForeignKey('refresh_jobs.id'), nullable=False, index=True)
+    symbol = db.Column(db.String(10), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # 'pending', 'done' or 'error'
+    price = db.Column(db.Float)
+    error = db.Column(db.Text)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<RefreshJobItem {self.job_id}:{self.symbol} {self.status}>'
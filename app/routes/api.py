@@ -1,14 +1,26 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app, url_for
 from flask_login import login_required, current_user
 from app.database.models import Stock, UserStock, StockHistory, Watchlist
 from app.database import db
-import yfinance as yf
 from datetime import datetime, timedelta
 import pandas as pd
-from app.utils.stock_plotter import StockPlotter
-from app.utils.stock_utils import get_stock_history
+from app.utils.stock_plotter import StockPlotter, DEFAULT_MAX_POINTS
+from app.utils.downsampling import downsample_ohlc
+from app.utils.stock_utils import get_latest_quotes, get_or_update_stocks
+from app.utils.validators import validate_stock_symbol
+from app.services.refresh_job_service import refresh_jobs
+from app.services.portfolio_snapshot_service import portfolio_snapshots
+from app.services.portfolio_ledger_service import portfolio_ledger
+from app.services.indicator_state_service import indicator_states
+from app.services.symbol_index import symbol_index, rank_key
+from app.services.screener_service import screener
+from app.utils.filter_expressions import ExpressionError
+from app.utils.market_data import (
+    get_history, get_ticker_info, search_symbols, yahoo_breaker, InvalidSymbolError, ProviderUnavailableError
+)
+from app.utils.cache import provider_cache
+from app.utils.indicator_engine import indicator_cache
 import json
-import requests
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -21,41 +33,12 @@ def get_portfolio_value():
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days)
         
-        # Get user's stocks with their quantities
-        user_stocks = (
-            db.session.query(UserStock, Stock)
-            .join(Stock, UserStock.stock_id == Stock.id)
-            .filter(UserStock.user_id == current_user.id)
-            .all()
-        )
-        
-        if not user_stocks:
-            return jsonify({'dates': [], 'values': []})
-
-        # Initialize data structure for portfolio values
-        portfolio_values = {}
-        
-        for user_stock, stock in user_stocks:
-            # Get historical data for each stock
-            history_data, success, _ = get_stock_history(stock.symbol, period=f'{days}d')
-            
-            if success and history_data:
-                for date, close_price in zip(history_data['dates'], history_data['close']):
-                    date = date.split()[0]  # Get just the date part
-                    value = close_price * user_stock.quantity
-                    
-                    if date in portfolio_values:
-                        portfolio_values[date] += value
-                    else:
-                        portfolio_values[date] = value
-
-        # Convert to sorted lists
-        sorted_dates = sorted(portfolio_values.keys())
-        values = [portfolio_values[date] for date in sorted_dates]
+        # One range scan over the materialized daily ledger
+        rows = portfolio_ledger.get_series(current_user.id, start_date.date(), end_date.date())
 
         return jsonify({
-            'dates': sorted_dates,
-            'values': [round(v, 2) for v in values]
+            'dates': [row.date.strftime('%Y-%m-%d') for row in rows],
+            'values': [round(row.value, 2) for row in rows]
         })
     
     except Exception as e:
@@ -104,78 +87,82 @@ def get_stocks_performance():
 @login_required
 def update_stock_prices():
     try:
-        user_stocks = UserStock.query.filter_by(user_id=current_user.id).all()
-        updated_stocks = []
-        
-        for user_stock in user_stocks:
-            stock = Stock.query.get(user_stock.stock_id)
-            if stock:
-                # Get latest data from yfinance
-                ticker = yf.Ticker(stock.symbol)
-                current_price = ticker.history(period='1d')['Close'].iloc[-1]
-                
-                # Update stock price
-                stock.current_price = current_price
-                
-                # Add to history
-                history = StockHistory(
-                    stock_id=stock.id,
-                    date=datetime.now(),
-                    close_price=current_price,
-                    volume=ticker.history(period='1d')['Volume'].iloc[-1]
-                )
-                db.session.add(history)
-                
-                updated_stocks.append({
-                    'symbol': stock.symbol,
-                    'price': current_price
-                })
-        
-        db.session.commit()
-        return jsonify({'updated': updated_stocks})
+        symbols = [
+            stock.symbol for stock in (
+                db.session.query(Stock)
+                .join(UserStock, UserStock.stock_id == Stock.id)
+                .filter(UserStock.user_id == current_user.id)
+                .all()
+            )
+        ]
+
+        wait = request.args.get('wait', type=float)
+        if wait:
+            # Synchronous mode: refresh every holding in parallel, answer by the deadline
+            deadline = min(wait, current_app.config.get('PROVIDER_FANOUT_TIMEOUT', 8))
+            results = get_or_update_stocks(symbols, force_update=True, timeout=deadline)
+            # Every holder of a refreshed stock, not just this user, was valued at the old price
+            for stock, status, _ in results.values():
+                if status == 'updated':
+                    portfolio_snapshots.mark_stale(stock_id=stock.id)
+            db.session.commit()
+            return jsonify({
+                'complete': all(status == 'updated' for _, status, _ in results.values()),
+                'results': {
+                    symbol: {
+                        'status': status,
+                        'price': stock.current_price if stock else None,
+                        'error': error
+                    }
+                    for symbol, (stock, status, error) in results.items()
+                }
+            })
+
+        job = refresh_jobs.submit(current_app._get_current_object(), current_user.id, symbols)
+        return jsonify({
+            'job_id': job.id,
+            'status_url': url_for('api.get_refresh_job', job_id=job.id)
+        }), 202
     
     except Exception as e:
-        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_refresh_job(job_id):
+    job = refresh_jobs.get_job(job_id, user_id=current_user.id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
 @api_bp.route('/portfolio/stats', methods=['GET'])
 @login_required
 def get_portfolio_stats():
     try:
-        user_stocks = UserStock.query.filter_by(user_id=current_user.id).all()
-        total_value = 0
-        total_gain = 0
-        daily_change = 0
-        
-        for user_stock in user_stocks:
-            stock = Stock.query.get(user_stock.stock_id)
-            if stock and stock.current_price:
-                current_value = stock.current_price * user_stock.quantity
-                purchase_value = user_stock.purchase_price * user_stock.quantity
-                
-                total_value += current_value
-                total_gain += (current_value - purchase_value)
-                
-                # Calculate daily change
-                yesterday = datetime.now() - timedelta(days=1)
-                yesterday_history = StockHistory.query.filter(
-                    StockHistory.stock_id == stock.id,
-                    StockHistory.date >= yesterday
-                ).first()
-                
-                if yesterday_history:
-                    daily_change += ((stock.current_price - yesterday_history.close_price) / 
-                                   yesterday_history.close_price * 100)
+        summary, _ = portfolio_snapshots.get_summary(current_user.id)
         
         return jsonify({
-            'total_value': round(total_value, 2),
-            'total_gain': round(total_gain, 2),
-            'daily_change': round(daily_change, 2)
+            'total_value': round(summary['total_value'], 2),
+            'total_gain': round(summary['total_return'], 2),
+            'daily_change': round(summary['daily_change'], 2),
+            'computed_at': summary['computed_at']
         })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Fewest points a downsampled series can have: first, last and one bucket
+MIN_MAX_POINTS = 3
+
+def _parse_since(since):
+    """The since query parameter as a Timestamp, None when absent; raises ValueError"""
+    if not since:
+        return None
+    timestamp = pd.Timestamp(since)
+    if pd.isna(timestamp):
+        raise ValueError(since)
+    return timestamp
+
 @api_bp.route('/stock/<symbol>/data', methods=['GET'])
 @login_required
 def get_stock_data(symbol):
@@ -183,10 +170,30 @@ def get_stock_data(symbol):
         # Get date range from query parameters
         interval = request.args.get('interval', default='1d')
         period = request.args.get('period', default='1mo')
+        max_points = request.args.get('max_points', type=int)
+        if max_points is not None and max_points < MIN_MAX_POINTS:
+            return jsonify({'error': f'max_points must be at least {MIN_MAX_POINTS}'}), 400
+        try:
+            since = _parse_since(request.args.get('since'))
+        except ValueError:
+            return jsonify({'error': 'since must be a date or timestamp'}), 400
         
         # Get stock data from yfinance
-        ticker = yf.Ticker(symbol)
-        hist = ticker.history(period=period, interval=interval)
+        hist = get_history(symbol, period=period, interval=interval)
+        if hist.empty:
+            return jsonify({'error': f'No historical data available for {symbol}'}), 404
+        
+        if since is not None:
+            # Incremental mode: bars at or after the client's last bar
+            if hist.index.tz is not None and since.tz is None:
+                since = since.tz_localize(hist.index.tz)
+            elif hist.index.tz is None and since.tz is not None:
+                since = since.tz_convert(None)
+            hist = hist[hist.index >= since]
+        
+        if max_points:
+            # Bound the payload for long ranges with OHLC-preserving buckets
+            hist = downsample_ohlc(hist, max_points)
         
         # Format data for plotting
         data = {
@@ -199,6 +206,10 @@ def get_stock_data(symbol):
         }
         
         return jsonify(data)
+    except InvalidSymbolError as e:
+        return jsonify({'error': str(e)}), 404
+    except ProviderUnavailableError as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500 
 
@@ -220,12 +231,145 @@ def get_stock_chart(symbol):
     except Exception as e:
         return str(e), 500 
 
+@api_bp.route('/stock/<symbol>/chart/data')
+@login_required
+def get_stock_chart_data(symbol):
+    try:
+        period = request.args.get('period', '1mo')
+        indicators = json.loads(request.args.get('indicators', '[]'))
+        include_base = request.args.get('base', '1') != '0'
+        max_points = request.args.get('max_points', default=DEFAULT_MAX_POINTS, type=int)
+        if max_points < MIN_MAX_POINTS:
+            return jsonify({'error': f'max_points must be at least {MIN_MAX_POINTS}'}), 400
+        try:
+            since = _parse_since(request.args.get('since'))
+        except ValueError:
+            return jsonify({'error': 'since must be a date or timestamp'}), 400
+        
+        plotter = StockPlotter(symbol, period, max_points=max_points)
+        
+        for indicator in indicators:
+            plotter.add_indicator(indicator['category'], indicator['name'])
+        
+        if since is not None:
+            # Incremental refresh: only bars from the client's last bar onwards
+            body = plotter.chart_delta(since)
+        else:
+            body = plotter.chart_data(include_base=include_base)
+        
+        return current_app.response_class(body, mimetype='application/json')
+    except ProviderUnavailableError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/stock/<symbol>/indicators', methods=['GET'])
+@login_required
+def get_stock_indicators(symbol):
+    """Latest values of the streamed indicators, read from their stored state"""
+    try:
+        stock = Stock.query.filter_by(symbol=symbol.upper()).first()
+        if not stock:
+            return jsonify({'error': f'Unknown symbol {symbol}'}), 404
+        return jsonify({
+            'symbol': stock.symbol,
+            'indicators': indicator_states.latest(stock.id)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _stored_price(symbol):
+    """Last stored price of symbol flagged as stale, or None"""
+    stock = Stock.query.filter_by(symbol=symbol).first()
+    if stock and stock.current_price:
+        return jsonify({
+            'price': stock.current_price,
+            'stale': True,
+            'updated': stock.last_updated.isoformat() if stock.last_updated else None
+        })
+    return None
+
 @api_bp.route('/stock/<symbol>/price', methods=['GET'])
 @login_required
 def get_stock_price(symbol):
     try:
-        ticker = yf.Ticker(symbol)
-        return jsonify({'price': ticker.history(period='1d')['Close'].iloc[-1]})
+        hist = get_history(symbol, period='1d')
+        if hist.empty:
+            # No bar today yet (outside trading hours) or a provider gap
+            return _stored_price(symbol) or (jsonify({'error': f'No price data for {symbol}'}), 404)
+        return jsonify({'price': hist['Close'].iloc[-1]})
+    except InvalidSymbolError as e:
+        return jsonify({'error': str(e)}), 404
+    except ProviderUnavailableError as e:
+        # Upstream is down: answer with the last stored price rather than waiting
+        return _stored_price(symbol) or (jsonify({'error': str(e)}), 503)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+MAX_QUOTE_SYMBOLS = 50
+
+@api_bp.route('/quotes', methods=['GET'])
+@login_required
+def get_quotes():
+    """Latest prices for several symbols, e.g. /api/quotes?symbols=AAPL,MSFT"""
+    raw_symbols = request.args.get('symbols', '')
+    symbols = []
+    invalid = []
+    for raw in raw_symbols.split(','):
+        raw = raw.strip()
+        if not raw:
+            continue
+        symbol, is_valid = validate_stock_symbol(raw)
+        if is_valid:
+            symbols.append(symbol)
+        else:
+            invalid.append(raw)
+
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return jsonify({'error': 'At least one valid symbol is required'}), 400
+    if len(symbols) > MAX_QUOTE_SYMBOLS:
+        return jsonify({'error': f'At most {MAX_QUOTE_SYMBOLS} symbols per request'}), 400
+
+    try:
+        quotes = get_latest_quotes(symbols)
+        return jsonify({
+            'quotes': {symbol: quote for symbol, quote in quotes.items() if quote},
+            'missing': [symbol for symbol, quote in quotes.items() if not quote] + invalid
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+MAX_SCREENER_RESULTS = 500
+MAX_EXPRESSION_LENGTH = 500
+
+@api_bp.route('/screener', methods=['GET'])
+@login_required
+def screen_stocks():
+    """
+    Stocks whose latest indicators match a filter expression, e.g.
+    /api/screener?q=RSI(14) < 30 and close > SMA(200) and volume > 2 * SMA(volume, 20)&sort=RSI()&order=asc
+    """
+    expression = request.args.get('q', '').strip()
+    sort = request.args.get('sort', '').strip() or None
+    order = request.args.get('order', 'desc').lower()
+    if not expression:
+        return jsonify({'error': 'A filter expression (q) is required'}), 400
+    if len(expression) > MAX_EXPRESSION_LENGTH or len(sort or '') > MAX_EXPRESSION_LENGTH:
+        return jsonify({'error': f'Expressions are limited to {MAX_EXPRESSION_LENGTH} characters'}), 400
+    if order not in ('asc', 'desc'):
+        return jsonify({'error': "order must be 'asc' or 'desc'"}), 400
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'error': 'limit must be a whole number'}), 400
+    if not 1 <= limit <= MAX_SCREENER_RESULTS:
+        return jsonify({'error': f'limit must be between 1 and {MAX_SCREENER_RESULTS}'}), 400
+
+    try:
+        return jsonify(screener.screen(expression, sort, descending=order == 'desc', limit=limit))
+    except ExpressionError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -237,60 +381,46 @@ def search_stocks():
         return jsonify([])
     
     try:
-        # First check our database
-        db_results = Stock.query.filter(
-            db.or_(
-                Stock.symbol.ilike(f'%{query}%'),
-                Stock.name.ilike(f'%{query}%')
-            )
-        ).limit(10).all()
-        
-        db_results = [{'symbol': s.symbol, 'name': s.name, 'type': s.type} for s in db_results]
+        symbol_index.ensure_started(current_app._get_current_object())
+
+        if symbol_index.ready:
+            db_results = symbol_index.search(query, limit=10)
+            if db_results:
+                # Already ranked by the index
+                return jsonify(db_results)
+        else:
+            # Index still loading: fall back to the database
+            db_results = Stock.query.filter(
+                db.or_(
+                    Stock.symbol.ilike(f'%{query}%'),
+                    Stock.name.ilike(f'%{query}%')
+                )
+            ).limit(10).all()
+            
+            db_results = [{'symbol': s.symbol, 'name': s.name, 'type': s.type} for s in db_results]
         
         # If we have less than 10 results, fetch from Yahoo Finance
         if len(db_results) < 10:
-            url = f"https://query2.finance.yahoo.com/v1/finance/search"
-            params = {
-                'q': query,
-                'quotesCount': 10,
-                'newsCount': 0,
-                'enableFuzzyQuery': True,
-                'quotesQueryId': 'tss_match_phrase_query'
-            }
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            
-            response = requests.get(url, params=params, headers=headers)
+            try:
+                yf_results = search_symbols(query)
+            except Exception as e:
+                # Local matches are still useful when Yahoo is slow or down
+                print(f"Yahoo search unavailable: {str(e)}")
+                yf_results = []
             
-            if response.status_code == 200:
-                yf_results = response.json().get('quotes', [])
-                
-                # Filter and format Yahoo Finance results
-                for result in yf_results:
-                    symbol = result.get('symbol')
-                    if symbol and not any(r['symbol'] == symbol for r in db_results):
-                        db_results.append({
-                            'symbol': symbol,
-                            'name': result.get('shortname', result.get('longname', '')),
-                            'type': 'stock' if result.get('quoteType') == 'EQUITY' else result.get('quoteType', '').lower(),
-                            'exchange': result.get('exchange', '')
-                        })
+            # Filter and format Yahoo Finance results
+            for result in yf_results:
+                symbol = result.get('symbol')
+                if symbol and not any(r['symbol'] == symbol for r in db_results):
+                    db_results.append({
+                        'symbol': symbol,
+                        'name': result.get('shortname', result.get('longname', '')),
+                        'type': 'stock' if result.get('quoteType') == 'EQUITY' else result.get('quoteType', '').lower(),
+                        'exchange': result.get('exchange', '')
+                    })
         
         # Sort results: exact matches first, then by symbol length
-        def sort_key(item):
-            symbol_match = item['symbol'].lower() == query.lower()
-            name_match = item['name'].lower() == query.lower()
-            symbol_starts = item['symbol'].lower().startswith(query.lower())
-            name_starts = item['name'].lower().startswith(query.lower())
-            return (
-                not symbol_match,  # Exact symbol matches first
-                not name_match,    # Exact name matches second
-                not symbol_starts, # Symbol starts with query third
-                not name_starts,   # Name starts with query fourth
-                len(item['symbol']),  # Shorter symbols preferred
-                item['symbol'].lower()  # Alphabetical order
-            )
-
-        sorted_results = sorted(db_results, key=sort_key)
+        sorted_results = sorted(db_results, key=lambda item: rank_key(item, query))
         return jsonify(sorted_results[:10])
         
     except Exception as e:
@@ -312,8 +442,7 @@ def add_to_watchlist():
     if not stock:
         # If the stock does not exist, add it to the stocks table
         try:
-            ticker = yf.Ticker(symbol)
-            stock_info = ticker.info
+            stock_info = get_ticker_info(symbol)
             
             stock = Stock(
                 symbol=symbol,
@@ -324,6 +453,10 @@ def add_to_watchlist():
             )
             db.session.add(stock)
             db.session.commit()
+        except InvalidSymbolError as e:
+            return jsonify({'error': str(e)}), 404
+        except ProviderUnavailableError as e:
+            return jsonify({'error': f'Failed to fetch stock data: {str(e)}'}), 503
         except Exception as e:
             return jsonify({'error': f'Failed to fetch stock data: {str(e)}'}), 500
 
@@ -337,4 +470,13 @@ def add_to_watchlist():
     db.session.add(watchlist_item)
     db.session.commit()
 
-    return jsonify({'message': f'Stock {symbol} added to watchlist'}), 200
\ No newline at end of file
+    return jsonify({'message': f'Stock {symbol} added to watchlist'}), 200
+
+@api_bp.route('/cache/stats', methods=['GET'])
+@login_required
+def get_cache_stats():
+    return jsonify({
+        'provider': provider_cache.stats(),
+        'indicators': indicator_cache.stats(),
+        'circuit': yahoo_breaker.stats()
+    })
@@ -6,6 +6,8 @@ from app.utils import validate_stock_symbol, validate_name, validate_price
 import logging
 from app.utils.stock_plotter import StockPlotter
 from app.utils.indicators import AVAILABLE_INDICATORS
+from app.services.portfolio_snapshot_service import portfolio_snapshots
+from app.services.portfolio_ledger_service import portfolio_ledger
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -98,7 +100,9 @@ def create_stock():
             )
             db.session.add(user_stock)
         
+        portfolio_snapshots.mark_stale(user_id=current_user.id)
         db.session.commit()
+        portfolio_ledger.invalidate(current_user.id, datetime.utcnow().date())
         logger.info(f"Stock {data['symbol']} added for user {current_user.id}")
         return jsonify({"message": "Stock added successfully!"}), 201
         
@@ -123,7 +127,10 @@ def delete_stock(stock_id):
             return jsonify({"error": "Stock not found in your portfolio"}), 404
             
         db.session.delete(user_stock)
+        portfolio_snapshots.mark_stale(user_id=current_user.id)
         db.session.commit()
+        # Past rows keep the position, it was held on those days
+        portfolio_ledger.invalidate(current_user.id, datetime.utcnow().date())
         logger.info(f"Stock {stock_id} deleted for user {current_user.id}")
         return jsonify({"message": "Stock deleted successfully!"}), 200
         
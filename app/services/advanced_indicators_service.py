@@ -1,196 +1,190 @@
+from typing import NamedTuple
 import numpy as np
 import pandas as pd
 from scipy import stats
-from sklearn.linear_model import LinearRegression
+from app.utils.indicator_engine import IndicatorEngine, node
+from app.utils import rolling
 import logging
 
 logger = logging.getLogger(__name__)
 
+class VolumeDelta(NamedTuple):
+    volume_delta: np.ndarray
+    cum_volume_delta: np.ndarray
+    volume_delta_momentum: np.ndarray
+    volume_delta_divergence: np.ndarray
+
+class AVSO(NamedTuple):
+    avso: np.ndarray
+    avso_ma: np.ndarray
+    avso_upper: np.ndarray
+    avso_lower: np.ndarray
+    avso_signal: np.ndarray  # -1 overbought, 1 oversold, 0 otherwise
+
+class LRO(NamedTuple):
+    lro: np.ndarray
+    r2: np.ndarray
+    slope: np.ndarray
+    signal: np.ndarray  # -1 overbought, 1 oversold, 0 otherwise
+    upper: np.ndarray
+    lower: np.ndarray
+
+def _band_signal(values, upper, lower):
+    return np.where(values > upper, -1,  # Overbought
+                    np.where(values < lower, 1, 0))  # Oversold
+
 class AdvancedIndicatorsService:
+    """
+    Indicators read their inputs as read-only arrays from an IndicatorEngine
+    and return NamedTuples of arrays, one value per bar; the caller's frame
+    is never modified
+    """
     def __init__(self):
         self.lookback_period = 20
         self.volatility_window = 14
         self.regression_period = 30
 
-    def calculate_volume_delta(self, df, window=20):
+    def calculate_volume_delta(self, df, window=20, engine=None, symbol=None, resolution='1d'):
         """
         Calculate Volume Delta (Buying vs Selling Pressure)
         Args:
             df: DataFrame with OHLCV data
             window: Rolling window for volume analysis
+            engine: IndicatorEngine over df shared with the other analyses
+            symbol: When given (and no engine), indicator outputs are read through the indicator cache
+            resolution: Bar size of df, part of the cache key
+        Returns a VolumeDelta
         """
         try:
-            # Calculate price changes
-            df['price_change'] = df['close_price'] - df['open_price']
-            
-            # Calculate volume delta
-            df['volume_delta'] = np.where(df['price_change'] > 0, 
-                                        df['volume'], 
-                                        np.where(df['price_change'] < 0, 
-                                                -df['volume'], 0))
-            
-            # Calculate cumulative volume delta
-            df['cum_volume_delta'] = df['volume_delta'].cumsum()
-            
-            # Calculate volume delta momentum
-            df['volume_delta_ma'] = df['volume_delta'].rolling(window=window).mean()
-            df['volume_delta_momentum'] = df['volume_delta'] - df['volume_delta_ma']
-            
-            # Calculate volume delta divergence
-            df['price_ma'] = df['close_price'].rolling(window=window).mean()
-            df['volume_delta_divergence'] = (
-                (df['close_price'] - df['price_ma']) * 
-                (df['volume_delta'] - df['volume_delta_ma'])
-            )
-            
-            return {
-                'volume_delta': df['volume_delta'],
-                'cum_volume_delta': df['cum_volume_delta'],
-                'volume_delta_momentum': df['volume_delta_momentum'],
-                'volume_delta_divergence': df['volume_delta_divergence']
-            }
-            
+            engine = engine or IndicatorEngine(df, symbol=symbol, resolution=resolution)
+            flow = engine.arrays({
+                'close': node('close'),
+                'volume_delta': node('volume_delta'),
+                'volume_delta_ma': node('sma', source='volume_delta', period=window),
+                'price_ma': node('sma', period=window)
+            })
+            volume_delta = flow['volume_delta']
+
+            # Cumulative volume delta; bars without a delta stay missing, as pandas cumsum
+            cum_volume_delta = np.nancumsum(volume_delta)
+            cum_volume_delta[np.isnan(volume_delta)] = np.nan
+
+            # Volume delta momentum
+            volume_delta_momentum = volume_delta - flow['volume_delta_ma']
+
+            # Volume delta divergence
+            volume_delta_divergence = (flow['close'] - flow['price_ma']) * volume_delta_momentum
+
+            return VolumeDelta(volume_delta, cum_volume_delta, volume_delta_momentum, volume_delta_divergence)
+
         except Exception as e:
             logger.error(f"Error calculating Volume Delta: {str(e)}")
             return None
 
-    def calculate_avso(self, df, alpha=0.1):
+    def calculate_avso(self, df, alpha=0.1, engine=None, symbol=None, resolution='1d'):
         """
         Calculate Adaptive Volatility Scaled Oscillator
         Args:
             df: DataFrame with OHLCV data
             alpha: Smoothing factor for adaptive calculation
+            engine: IndicatorEngine over df shared with the other analyses
+            symbol: When given (and no engine), indicator outputs are read through the indicator cache
+            resolution: Bar size of df, part of the cache key
+        Returns an AVSO
         """
         try:
-            # Calculate price returns
-            df['returns'] = df['close_price'].pct_change()
-            
-            # Calculate adaptive volatility
-            df['volatility'] = df['returns'].rolling(window=self.volatility_window).std()
-            
-            # Calculate adaptive bands
-            df['upper_band'] = df['close_price'] + (df['volatility'] * df['close_price'])
-            df['lower_band'] = df['close_price'] - (df['volatility'] * df['close_price'])
-            
-            # Calculate AVSO
-            df['avso'] = (df['close_price'] - df['lower_band']) / (df['upper_band'] - df['lower_band'])
-            
-            # Calculate adaptive thresholds
-            df['avso_ma'] = df['avso'].ewm(alpha=alpha).mean()
-            df['avso_std'] = df['avso'].rolling(window=self.volatility_window).std()
-            
-            df['avso_upper'] = df['avso_ma'] + (2 * df['avso_std'])
-            df['avso_lower'] = df['avso_ma'] - (2 * df['avso_std'])
-            
-            # Generate signals
-            df['avso_signal'] = np.where(df['avso'] > df['avso_upper'], -1,  # Overbought
-                                       np.where(df['avso'] < df['avso_lower'], 1, 0))  # Oversold
-            
-            return {
-                'avso': df['avso'],
-                'avso_ma': df['avso_ma'],
-                'avso_upper': df['avso_upper'],
-                'avso_lower': df['avso_lower'],
-                'avso_signal': df['avso_signal']
-            }
-            
+            engine = engine or IndicatorEngine(df, symbol=symbol, resolution=resolution)
+            inputs = engine.arrays({
+                'close': node('close'),
+                # Adaptive volatility of price returns
+                'volatility': node('rolling_std', source='returns', period=self.volatility_window)
+            })
+            close = inputs['close']
+
+            # Adaptive bands
+            upper_band = close + inputs['volatility'] * close
+            lower_band = close - inputs['volatility'] * close
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                avso = (close - lower_band) / (upper_band - lower_band)
+
+            # Adaptive thresholds
+            avso_ma = rolling.ewm_mean(avso, alpha=alpha)
+            avso_std = rolling.rolling_std(avso, self.volatility_window)
+            avso_upper = avso_ma + 2 * avso_std
+            avso_lower = avso_ma - 2 * avso_std
+
+            return AVSO(avso, avso_ma, avso_upper, avso_lower, _band_signal(avso, avso_upper, avso_lower))
+
         except Exception as e:
             logger.error(f"Error calculating AVSO: {str(e)}")
             return None
 
-    def calculate_lro(self, df, period=None):
+    def calculate_lro(self, df, period=None, engine=None, symbol=None, resolution='1d'):
         """
         Calculate Linear Regression Oscillator
         Args:
             df: DataFrame with OHLCV data
             period: Regression period (optional)
+            engine: IndicatorEngine over df shared with the other analyses
+            symbol: When given (and no engine), indicator outputs are read through the indicator cache
+            resolution: Bar size of df, part of the cache key
+        Returns an LRO
         """
         try:
+            engine = engine or IndicatorEngine(df, symbol=symbol, resolution=resolution)
             if period is None:
                 period = self.regression_period
-                
-            # Initialize arrays for results
-            lro_values = []
-            r2_values = []
-            slope_values = []
-            
-            # Calculate for each window
-            for i in range(len(df) - period + 1):
-                window = df['close_price'].iloc[i:i+period]
-                
-                # Prepare data for regression
-                X = np.arange(len(window)).reshape(-1, 1)
-                y = window.values.reshape(-1, 1)
-                
-                # Fit linear regression
-                model = LinearRegression()
-                model.fit(X, y)
-                
-                # Calculate regression values
-                y_pred = model.predict(X)
-                
-                # Calculate R-squared
-                r2 = model.score(X, y)
-                
-                # Calculate oscillator value
-                last_price = window.iloc[-1]
-                regression_value = y_pred[-1][0]
-                oscillator_value = (last_price - regression_value) / regression_value
-                
-                # Store values
-                lro_values.append(oscillator_value)
-                r2_values.append(r2)
-                slope_values.append(model.coef_[0][0])
-            
-            # Add padding for initial periods
-            padding = [np.nan] * (period - 1)
-            
-            # Create Series for results
-            df['LRO'] = padding + lro_values
-            df['LRO_R2'] = padding + r2_values
-            df['LRO_SLOPE'] = padding + slope_values
-            
-            # Calculate signals
-            df['LRO_MA'] = df['LRO'].rolling(window=period//2).mean()
-            df['LRO_STD'] = df['LRO'].rolling(window=period//2).std()
-            
-            df['LRO_UPPER'] = df['LRO_MA'] + (2 * df['LRO_STD'])
-            df['LRO_LOWER'] = df['LRO_MA'] - (2 * df['LRO_STD'])
-            
-            # Generate trading signals
-            df['LRO_SIGNAL'] = np.where(df['LRO'] > df['LRO_UPPER'], -1,  # Overbought
-                                      np.where(df['LRO'] < df['LRO_LOWER'], 1, 0))  # Oversold
-            
-            return {
-                'lro': df['LRO'],
-                'r2': df['LRO_R2'],
-                'slope': df['LRO_SLOPE'],
-                'signal': df['LRO_SIGNAL'],
-                'upper': df['LRO_UPPER'],
-                'lower': df['LRO_LOWER']
-            }
-            
+
+            # Fit every window at once from running sums instead of one model per window
+            inputs = engine.arrays({
+                'close': node('close'),
+                'regression': node('linregress', period=period)
+            })
+            regression = inputs['regression']
+
+            # Oscillator: distance of the last price from the regression line's endpoint
+            with np.errstate(divide='ignore', invalid='ignore'):
+                lro = (inputs['close'] - regression.endpoint) / regression.endpoint
+
+            # Signal bands
+            lro_ma = rolling.rolling_mean(lro, period//2)
+            lro_std = rolling.rolling_std(lro, period//2)
+            upper = lro_ma + 2 * lro_std
+            lower = lro_ma - 2 * lro_std
+
+            return LRO(lro, regression.r2, regression.slope, _band_signal(lro, upper, lower), upper, lower)
+
         except Exception as e:
             logger.error(f"Error calculating LRO: {str(e)}")
             return None
 
-    def get_combined_signals(self, df):
-        """Get combined signals from all indicators"""
+    def get_combined_signals(self, df, engine=None, symbol=None, resolution='1d'):
+        """
+        Get combined signals from all indicators
+        Args:
+            df: DataFrame with OHLCV data
+            engine: IndicatorEngine over df shared with the other analyses
+            symbol: When given (and no engine), indicator outputs are read through the indicator cache
+            resolution: Bar size of df, part of the cache key
+        """
         try:
+            engine = engine or IndicatorEngine(df, symbol=symbol, resolution=resolution)
+
             # Calculate all indicators
-            volume_delta = self.calculate_volume_delta(df)
-            avso = self.calculate_avso(df)
-            lro = self.calculate_lro(df)
+            volume_delta = self.calculate_volume_delta(df, engine=engine)
+            avso = self.calculate_avso(df, engine=engine)
+            lro = self.calculate_lro(df, engine=engine)
             
-            if all([volume_delta, avso, lro]):
+            if all(result is not None for result in (volume_delta, avso, lro)):
                 # Combine signals
                 signals = {
-                    'volume_pressure': np.sign(volume_delta['volume_delta_momentum'].iloc[-1]),
-                    'volume_trend': np.sign(volume_delta['cum_volume_delta'].diff().iloc[-1]),
-                    'avso_signal': avso['avso_signal'].iloc[-1],
-                    'lro_signal': lro['signal'].iloc[-1],
-                    'trend_strength': abs(lro['r2'].iloc[-1]),
-                    'trend_direction': np.sign(lro['slope'].iloc[-1])
+                    'volume_pressure': np.sign(volume_delta.volume_delta_momentum[-1]),
+                    'volume_trend': np.sign(volume_delta.cum_volume_delta[-1] - volume_delta.cum_volume_delta[-2]),
+                    'avso_signal': avso.avso_signal[-1],
+                    'lro_signal': lro.signal[-1],
+                    'trend_strength': abs(lro.r2[-1]),
+                    'trend_direction': np.sign(lro.slope[-1])
                 }
                 
                 # Calculate composite signal
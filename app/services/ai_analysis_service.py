@@ -8,6 +8,8 @@ from datetime import datetime, timedelta
 import logging
 from app.services.ml_indicators_service import MLIndicatorsService
 from app.services.advanced_indicators_service import AdvancedIndicatorsService
+from app.utils.indicator_engine import IndicatorEngine, node
+from app.utils.precision import compact, compact_frame, feature_dtype
 
 logger = logging.getLogger(__name__)
 
@@ -19,55 +21,70 @@ class AIAnalysisService:
         self.ml_indicators = MLIndicatorsService()
         self.advanced_indicators = AdvancedIndicatorsService()
         
-    def prepare_data(self, stock_history):
-        """Prepare data for AI analysis"""
+    def prepare_data(self, stock_history, engine=None, symbol=None, resolution='1d'):
+        """
+        Prepare data for AI analysis
+        engine: IndicatorEngine over stock_history shared with the other analyses
+        symbol: when given (and no engine), indicator outputs are read through
+        the indicator cache; resolution is the bar size of stock_history
+        """
         try:
             # Convert to DataFrame if not already
             df = pd.DataFrame(stock_history)
+            engine = engine or IndicatorEngine(df, symbol=symbol, resolution=resolution)
             
             # Add ML-enhanced RSI
-            ml_rsi_signals = self.ml_indicators.calculate_ml_rsi(df)
+            ml_rsi_signals = self.ml_indicators.calculate_ml_rsi(df, engine=engine)
             if ml_rsi_signals:
                 df['ML_RSI_SIGNAL'] = ml_rsi_signals['ml_rsi_signal']
                 df['ML_RSI_CONFIDENCE'] = ml_rsi_signals['ml_confidence']
             
             # Calculate technical indicators
-            df['SMA_20'] = df['close_price'].rolling(window=20).mean()
-            df['SMA_50'] = df['close_price'].rolling(window=50).mean()
-            df['RSI'] = self.calculate_rsi(df['close_price'])
-            
-            # Enhanced MACD
-            df['MACD'], df['MACD_signal'], df['MACD_hist'] = self.calculate_macd(df['close_price'])
-            
-            # OBV
-            df['OBV'] = self.calculate_obv(df['close_price'], df['volume'])
-            df['OBV_EMA'] = df['OBV'].ewm(span=20).mean()
-            
-            df['BB_upper'], df['BB_lower'] = self.calculate_bollinger_bands(df['close_price'])
+            indicators = engine.compute({
+                'SMA_20': node('sma', period=20),
+                'SMA_50': node('sma', period=50),
+                'RSI': node('rsi', period=14),
+                # Enhanced MACD
+                'MACD': node('macd'),
+                'MACD_signal': node('macd_signal'),
+                'MACD_hist': node('macd_hist'),
+                # OBV
+                'OBV': node('obv'),
+                'OBV_EMA': node('ema', source='obv', span=20, adjust=True),
+                'BB_upper': node('bollinger_upper', period=20),
+                'BB_lower': node('bollinger_lower', period=20)
+            })
+            for column, values in indicators.items():
+                df[column] = compact(values)
             
             # Add advanced indicators
-            advanced_signals = self.advanced_indicators.get_combined_signals(df)
+            advanced_signals = self.advanced_indicators.get_combined_signals(df, engine=engine)
             if advanced_signals:
                 df['VOLUME_PRESSURE'] = advanced_signals['volume_pressure']
                 df['AVSO_SIGNAL'] = advanced_signals['avso_signal']
                 df['LRO_SIGNAL'] = advanced_signals['lro_signal']
                 df['TREND_STRENGTH'] = advanced_signals['trend_strength']
+            # The frame is returned to callers; keep its columns compact too
+            compact_frame(df)
             
-            # Create feature set
-            features = np.column_stack((
-                df['close_price'],
-                df['volume'],
-                df['SMA_20'],
-                df['SMA_50'],
-                df['RSI'],
-                df['MACD'],
-                df['MACD_signal'],
-                df['MACD_hist'],
-                df['OBV'],
-                df['OBV_EMA'],
-                df['BB_upper'],
-                df['BB_lower']
-            ))
+            # Create feature set, filled column by column in the feature dtype
+            feature_columns = [
+                'close_price',
+                'volume',
+                'SMA_20',
+                'SMA_50',
+                'RSI',
+                'MACD',
+                'MACD_signal',
+                'MACD_hist',
+                'OBV',
+                'OBV_EMA',
+                'BB_upper',
+                'BB_lower'
+            ]
+            features = np.empty((len(df), len(feature_columns)), dtype=feature_dtype())
+            for i, column in enumerate(feature_columns):
+                features[:, i] = df[column]
             
             # Scale features
             scaled_features = self.scaler.fit_transform(features)
@@ -78,19 +95,18 @@ class AIAnalysisService:
             logger.error(f"Error preparing data: {str(e)}")
             return None, None
 
-    def train_model(self, stock_history):
+    def train_model(self, stock_history, engine=None, symbol=None, resolution='1d'):
         """Train the LSTM model"""
         try:
-            scaled_data, df = self.prepare_data(stock_history)
+            scaled_data, df = self.prepare_data(stock_history, engine=engine, symbol=symbol, resolution=resolution)
             if scaled_data is None:
                 return False
             
-            X, y = [], []
-            for i in range(self.prediction_days, len(scaled_data)):
-                X.append(scaled_data[i-self.prediction_days:i])
-                y.append(scaled_data[i, 0])  # Predict next day's closing price
-                
-            X, y = np.array(X), np.array(y)
+            # Windows of the previous prediction_days rows as views, not copies
+            X = np.lib.stride_tricks.sliding_window_view(
+                scaled_data[:-1], self.prediction_days, axis=0
+            ).transpose(0, 2, 1)
+            y = scaled_data[self.prediction_days:, 0]  # Predict next day's closing price
             
             # Create LSTM model
             self.model = Sequential([
@@ -112,10 +128,12 @@ class AIAnalysisService:
             logger.error(f"Error training model: {str(e)}")
             return False
 
-    def get_prediction(self, stock_history):
+    def get_prediction(self, stock_history, symbol=None, resolution='1d'):
         """Get prediction for next day"""
         try:
-            scaled_data, df = self.prepare_data(stock_history[-self.prediction_days:])
+            scaled_data, df = self.prepare_data(
+                stock_history[-self.prediction_days:], symbol=symbol, resolution=resolution
+            )
             if scaled_data is None:
                 return None
             
@@ -132,10 +150,10 @@ class AIAnalysisService:
             logger.error(f"Error making prediction: {str(e)}")
             return None
 
-    def get_trading_signals(self, stock_history):
+    def get_trading_signals(self, stock_history, engine=None, symbol=None, resolution='1d'):
         """Generate trading signals based on technical analysis"""
         try:
-            _, df = self.prepare_data(stock_history)
+            _, df = self.prepare_data(stock_history, engine=engine, symbol=symbol, resolution=resolution)
             if df is None:
                 return None
             
@@ -143,7 +161,7 @@ class AIAnalysisService:
                 'price_trend': self._analyze_price_trend(df),
                 'volume_analysis': self._analyze_volume(df),
                 'technical_indicators': self._analyze_technical_indicators(df),
-                'prediction': self.get_prediction(stock_history)
+                'prediction': self.get_prediction(stock_history, symbol=symbol, resolution=resolution)
             }
             
             # Generate final recommendation
@@ -318,58 +336,41 @@ class AIAnalysisService:
         return sum(confidence_factors) / len(confidence_factors)
 
     # Technical indicator calculations
+    @staticmethod
+    def _engine(prices, volumes=None):
+        """Engine over a bare price (and volume) series"""
+        columns = {'close_price': prices}
+        if volumes is not None:
+            columns['volume'] = volumes
+        return IndicatorEngine(pd.DataFrame(columns))
+
     def calculate_rsi(self, prices, period=14):
         """Calculate Relative Strength Index"""
-        delta = prices.diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-        rs = gain / loss
-        return 100 - (100 / (1 + rs))
+        return self._engine(prices).get('rsi', period=period)
 
     def calculate_macd(self, prices):
         """
         Calculate MACD (Moving Average Convergence Divergence)
         Returns: MACD line, Signal line, and Histogram
         """
-        exp1 = prices.ewm(span=12, adjust=False).mean()
-        exp2 = prices.ewm(span=26, adjust=False).mean()
-        macd_line = exp1 - exp2
-        signal_line = macd_line.ewm(span=9, adjust=False).mean()
-        macd_histogram = macd_line - signal_line
-        return macd_line, signal_line, macd_histogram
+        macd = self._engine(prices).compute({
+            'line': node('macd'),
+            'signal': node('macd_signal'),
+            'histogram': node('macd_hist')
+        })
+        return macd['line'], macd['signal'], macd['histogram']
 
     def calculate_obv(self, prices, volumes):
         """
         Calculate On-Balance Volume (OBV)
         OBV = Previous OBV +/- Current Volume
         """
-        df = pd.DataFrame({'close': prices, 'volume': volumes})
-        df['price_change'] = df['close'].diff()
-        
-        obv = []
-        prev_obv = 0
-        
-        for i in range(len(df)):
-            if i == 0:
-                obv.append(prev_obv)
-                continue
-                
-            if df['price_change'].iloc[i] > 0:
-                current_obv = prev_obv + df['volume'].iloc[i]
-            elif df['price_change'].iloc[i] < 0:
-                current_obv = prev_obv - df['volume'].iloc[i]
-            else:
-                current_obv = prev_obv
-                
-            obv.append(current_obv)
-            prev_obv = current_obv
-            
-        return pd.Series(obv, index=df.index)
+        return self._engine(prices, volumes).get('obv')
 
     def calculate_bollinger_bands(self, prices, period=20):
         """Calculate Bollinger Bands"""
-        sma = prices.rolling(window=period).mean()
-        std = prices.rolling(window=period).std()
-        upper_band = sma + (std * 2)
-        lower_band = sma - (std * 2)
-        return upper_band, lower_band 
\ No newline at end of file
+        bands = self._engine(prices).compute({
+            'upper': node('bollinger_upper', period=period),
+            'lower': node('bollinger_lower', period=period)
+        })
+        return bands['upper'], bands['lower'] 
\ No newline at end of file
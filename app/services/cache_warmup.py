@@ -0,0 +1,56 @@
+import threading
+import logging
+from app.database import db
+from app.database.models import Stock, UserStock, Watchlist
+from app.utils.cache import provider_cache, tiered_caches
+from app.utils.concurrency import fan_out
+from app.utils.market_data import get_ticker_info
+
+logger = logging.getLogger(__name__)
+
+class CacheWarmup:
+    """
+    Warms this worker's caches for the hot symbol set (held or watched by any user)
+    Entries other workers already stored in the shared tier are copied into
+    memory first; only symbols missing there are fetched from the provider
+    """
+    def __init__(self, prefetch_timeout=30):
+        self.prefetch_timeout = prefetch_timeout
+        self._started = False
+        self._lock = threading.Lock()
+        self.result = None
+
+    @staticmethod
+    def hot_symbols():
+        held = db.session.query(Stock.symbol).join(UserStock, UserStock.stock_id == Stock.id)
+        watched = db.session.query(Stock.symbol).join(Watchlist, Watchlist.stock_id == Stock.id)
+        return sorted({symbol.upper() for (symbol,) in held.union(watched).all()})
+
+    def ensure_started(self, app):
+        if self._started or not app.config.get('CACHE_WARMUP', True):
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self.run, args=(app,), name='cache-warmup', daemon=True).start()
+
+    def run(self, app):
+        try:
+            with app.app_context():
+                symbols = self.hot_symbols()
+
+            preloaded = sum(cache.preload(symbols) for cache in tiered_caches())
+            missing = [symbol for symbol in symbols if provider_cache.peek('info', symbol) is None]
+            fetched = fan_out(get_ticker_info, missing, timeout=self.prefetch_timeout)
+
+            self.result = {
+                'symbols': len(symbols),
+                'preloaded': preloaded,
+                'prefetched': sum(1 for result in fetched.values() if result.ok)
+            }
+            logger.info(f"Cache warmup done: {self.result}")
+        except Exception as e:
+            logger.error(f"Error warming caches: {str(e)}")
+
+cache_warmup = CacheWarmup()
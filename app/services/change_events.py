@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+import threading
+import time
+import logging
+from sqlalchemy import func
+from app.database import db
+from app.database.models import ChangeEvent
+
+logger = logging.getLogger(__name__)
+
+# Change kinds: a new price for an existing bar, or new/rewritten bars
+QUOTE = 'quote'
+HISTORY = 'history'
+
+def publish(symbol, kind, last_bar_ts=None):
+    """
+    Record a change in the current session; it becomes visible to other
+    processes when the caller commits the data change it belongs to
+    """
+    db.session.add(ChangeEvent(symbol=symbol.upper(), kind=kind, last_bar_ts=last_bar_ts))
+
+def prune(max_age=timedelta(days=1)):
+    """Delete events older than max_age, returns the count"""
+    deleted = ChangeEvent.query.filter(
+        ChangeEvent.created_at < datetime.utcnow() - max_age
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+class ChangeEventSubscriber:
+    """
+    Polls the change_events table from one background thread per process
+    and passes each (symbol, kind, last_bar_ts) to the registered handlers.
+    Only events published after the subscriber started are delivered, and
+    repeats of the same (symbol, kind) within one poll are coalesced to the
+    newest last_bar_ts. Modules owning a cache register their own handler
+
+    Ids are assigned at insert but become visible at commit, so a long
+    transaction can commit events below ids already read. Ids skipped below
+    the cursor are kept as gaps and read again on every poll until they
+    appear or gap_timeout seconds pass (a rolled-back insert never fills its id)
+    """
+    def __init__(self, batch_size=500, gap_timeout=10 * 60, max_gaps=10000):
+        self.batch_size = batch_size
+        self.gap_timeout = gap_timeout
+        self.max_gaps = max_gaps
+        self.cursor = None
+        self.gaps = {}  # Unseen id below the cursor -> monotonic time it was skipped
+        self.delivered = 0
+        self._handlers = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def register(self, handler):
+        """handler(symbol, kind, last_bar_ts) is called for every change"""
+        self._handlers.append(handler)
+
+    def ensure_started(self, app):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            interval = app.config.get('CHANGE_EVENT_POLL_SECONDS', 5)
+            if not interval:
+                return
+            with app.app_context():
+                self.cursor = db.session.query(func.max(ChangeEvent.id)).scalar() or 0
+            self._thread = threading.Thread(
+                target=self._poll_loop,
+                args=(app, interval),
+                name='change-events',
+                daemon=True
+            )
+            self._thread.start()
+
+    def poll(self, app):
+        """Deliver pending events once, returns the number of events read"""
+        now = time.monotonic()
+        self.gaps = {event_id: skipped for event_id, skipped in self.gaps.items() if now - skipped < self.gap_timeout}
+        with app.app_context():
+            pending = ChangeEvent.id > self.cursor
+            if self.gaps:
+                pending = db.or_(pending, ChangeEvent.id.in_(list(self.gaps)))
+            events = (
+                ChangeEvent.query
+                .filter(pending)
+                .order_by(ChangeEvent.id)
+                .limit(self.batch_size)
+                .all()
+            )
+            if not events:
+                return 0
+
+            changes = {}
+            for event in events:
+                latest = changes.get((event.symbol, event.kind))
+                if latest is None or (event.last_bar_ts and event.last_bar_ts > latest):
+                    changes[(event.symbol, event.kind)] = event.last_bar_ts
+                if event.id > self.cursor:
+                    # Ids between the cursor and this event may still be committed
+                    for missing in range(self.cursor + 1, event.id):
+                        self.gaps[missing] = now
+                    self.cursor = event.id
+                else:
+                    self.gaps.pop(event.id, None)
+            if len(self.gaps) > self.max_gaps:
+                self.gaps = dict(sorted(self.gaps.items())[-self.max_gaps:])
+
+        for (symbol, kind), last_bar_ts in changes.items():
+            for handler in self._handlers:
+                try:
+                    handler(symbol, kind, last_bar_ts)
+                except Exception as e:
+                    logger.error(f"Error handling {kind} change for {symbol}: {str(e)}")
+        self.delivered += len(changes)
+        return len(events)
+
+    def _poll_loop(self, app, interval):
+        while True:
+            try:
+                # Drain backlogs without waiting a full interval per batch
+                while self.poll(app) >= self.batch_size:
+                    pass
+            except Exception as e:
+                logger.error(f"Error polling change events: {str(e)}")
+            time.sleep(interval)
+
+change_subscriber = ChangeEventSubscriber()
@@ -0,0 +1,165 @@
+from bisect import bisect_left
+from datetime import datetime
+import json
+import logging
+import math
+from typing import NamedTuple, Optional
+from app.database import db
+from app.database.models import IndicatorState, StockHistory
+from app.utils.streaming_indicators import create_indicator
+
+logger = logging.getLogger(__name__)
+
+# Indicators kept up to date for every stock as bars are stored
+TRACKED_INDICATORS = [
+    ('sma', {'period': 20}),
+    ('sma', {'period': 50}),
+    ('sma', {'period': 100}),
+    ('ema', {'span': 20}),
+    ('bollinger', {'period': 20, 'std': 2}),
+    ('rsi', {'period': 14}),
+    ('macd', {'fast': 12, 'slow': 26, 'signal': 9}),
+    ('obv', {}),
+    ('avso', {'window': 14, 'alpha': 0.1})
+]
+
+def _params_key(params):
+    return json.dumps(params, sort_keys=True, separators=(',', ':'))
+
+def _bar_volume(volume):
+    return None if volume is None else float(volume)
+
+def _day(timestamp):
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+class _Bar(NamedTuple):
+    """One day of stored bars, as panel._daily_frame aggregates them"""
+    date: datetime  # Midnight of the day
+    close_price: float
+    volume: Optional[float]
+
+class IndicatorStateService:
+    """
+    Keeps streaming indicator state per (stock, indicator, params) in indicator_states
+    Each ingestion step feeds only the days stored since the last one, so the
+    latest values are read back rather than recomputed. stock_history mixes
+    daily bars, hourly bars and close-only quote rows, so the indicators
+    advance on one bar per day. The latest day is always fed again from the
+    state saved before it, because it can still be revised
+    """
+
+    def advance(self, stock_id, rewritten_from=None):
+        """
+        Feed the stock's new bars to its indicator states, creating missing ones
+        rewritten_from: earliest stored bar that was changed in place or
+        inserted behind newer ones; states past its day are rebuilt from the
+        full history. Changes are added to the session for the caller to
+        commit with the bars. Returns days applied
+        """
+        try:
+            rows = {
+                (row.indicator, row.params): row
+                for row in IndicatorState.query.filter_by(stock_id=stock_id).all()
+            }
+            plans = []
+            for name, params in TRACKED_INDICATORS:
+                row = rows.get((name, _params_key(params)))
+                rebuild = (
+                    row is None or row.last_bar_ts is None or
+                    # States saved before daily aggregation stopped at an intraday row
+                    row.last_bar_ts != _day(row.last_bar_ts) or
+                    (rewritten_from is not None and _day(rewritten_from) < row.last_bar_ts)
+                )
+                plans.append((name, params, row, None if rebuild else row.last_bar_ts))
+
+            starts = [start for _, _, _, start in plans]
+            bars = self._bars(stock_id, None if None in starts else min(starts))
+            if not bars:
+                return 0
+            dates = [bar.date for bar in bars]
+
+            # Compute every state first, so a failure leaves the stored states untouched
+            updates = []
+            applied = 0
+            for name, params, row, start in plans:
+                pending = bars if start is None else bars[bisect_left(dates, start):]
+                if not pending:
+                    continue
+                indicator = create_indicator(name, params, None if start is None else row.previous_state)
+                for bar in pending[:-1]:
+                    indicator.update(bar.close_price, bar.volume)
+                previous_state = indicator.state()
+                indicator.update(pending[-1].close_price, pending[-1].volume)
+                # The re-fed last bar was already counted
+                count = len(pending) if start is None else row.bars + len(pending) - 1
+                updates.append((name, params, row, indicator, previous_state, pending[-1].date, count))
+                applied = max(applied, len(pending) if start is None else len(pending) - 1)
+
+            now = datetime.utcnow()
+            for name, params, row, indicator, previous_state, last_bar_ts, count in updates:
+                if row is None:
+                    row = IndicatorState(stock_id=stock_id, indicator=name, params=_params_key(params))
+                    db.session.add(row)
+                row.state = indicator.state()
+                row.previous_state = previous_state
+                row.value = indicator.values()
+                row.last_bar_ts = last_bar_ts
+                row.bars = count
+                row.updated_at = now
+            return applied
+
+        except Exception as e:
+            logger.error(f"Error advancing indicator state for stock {stock_id}: {str(e)}")
+            return 0
+
+    def latest(self, stock_id):
+        """Stored latest values of the stock's indicators, built on first use"""
+        rows = IndicatorState.query.filter_by(stock_id=stock_id).all()
+        if not rows:
+            self.advance(stock_id)
+            db.session.commit()
+            rows = IndicatorState.query.filter_by(stock_id=stock_id).all()
+
+        order = {(name, _params_key(params)): i for i, (name, params) in enumerate(TRACKED_INDICATORS)}
+        rows.sort(key=lambda row: order.get((row.indicator, row.params), len(order)))
+        return [
+            {
+                'indicator': row.indicator,
+                'params': json.loads(row.params),
+                'values': row.value,
+                'last_bar_ts': row.last_bar_ts.isoformat() if row.last_bar_ts else None,
+                'bars': row.bars
+            }
+            for row in rows
+        ]
+
+    def reset(self, stock_id):
+        """Drop a stock's states; the next advance rebuilds them from its history"""
+        IndicatorState.query.filter_by(stock_id=stock_id).delete(synchronize_session=False)
+
+    @staticmethod
+    def _bars(stock_id, start=None):
+        """Stored bars from start's day on, one per day: its last close and largest volume"""
+        query = (
+            db.session.query(StockHistory.date, StockHistory.close_price, StockHistory.volume)
+            .filter(StockHistory.stock_id == stock_id, StockHistory.close_price.isnot(None))
+        )
+        if start is not None:
+            query = query.filter(StockHistory.date >= _day(start))
+        bars = []
+        for row in query.order_by(StockHistory.date).all():
+            if math.isnan(row.close_price):
+                continue
+            day = _day(row.date)
+            volume = _bar_volume(row.volume)
+            if bars and bars[-1].date == day:
+                volumes = [
+                    value for value in (bars[-1].volume, volume)
+                    if value is not None and not math.isnan(value)
+                ]
+                bars[-1] = _Bar(day, row.close_price, max(volumes) if volumes else None)
+            else:
+                bars.append(_Bar(day, row.close_price, volume))
+        return bars
+
+indicator_states = IndicatorStateService()
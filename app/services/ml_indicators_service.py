@@ -4,96 +4,106 @@ from sklearn.preprocessing import MinMaxScaler
 from sklearn.ensemble import RandomForestClassifier
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import LSTM, Dense, Dropout
-import ta
+from app.utils.indicator_engine import IndicatorEngine, node
+from app.utils.precision import feature_dtype
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Columns of the technical feature matrix, in order
+FEATURE_COLUMNS = [
+    'RSI', 'SMA_20', 'SMA_50', 'EMA_20',
+    'MOM', 'ROC', 'BB_high', 'BB_low',
+    'MFI', 'ADX'
+]
+
 class MLIndicatorsService:
     def __init__(self):
         self.rf_model = RandomForestClassifier(n_estimators=100, random_state=42)
         self.scaler = MinMaxScaler(feature_range=(0, 1))
         self.prediction_threshold = 0.6
 
-    def calculate_ml_rsi(self, df, period=14, lookback=5):
-        """Calculate ML-enhanced RSI with predictive capabilities"""
+    def calculate_ml_rsi(self, df, period=14, lookback=5, engine=None, symbol=None, resolution='1d'):
+        """
+        Calculate ML-enhanced RSI with predictive capabilities
+        engine: IndicatorEngine over df shared with the other analyses
+        symbol: when given (and no engine), indicator outputs are read through
+        the indicator cache; resolution is the bar size of df
+        df is not modified
+        """
         try:
-            # Calculate traditional RSI using 'ta' library
-            df['RSI'] = ta.momentum.RSIIndicator(df['close_price'], window=period).rsi()
-            
-            # Create additional features
-            self._add_technical_features(df)
-            
+            engine = engine or IndicatorEngine(df, symbol=symbol, resolution=resolution)
+
+            # Indicator features, traditional RSI first
+            features = self._add_technical_features(engine, period)
+            close = engine.arrays({'close': node('close')})['close']
+
             # Prepare ML features
-            X, y = self._prepare_ml_features(df, lookback)
-            
+            X, y = self._prepare_ml_features(features, close, lookback)
+
             # Train ML model
             self._train_ml_model(X, y)
-            
+
             # Generate ML-enhanced RSI signals
-            signals = self._generate_ml_rsi_signals(df, lookback)
-            
+            signals = self._generate_ml_rsi_signals(features, lookback)
+
             return signals
-            
+
         except Exception as e:
             logger.error(f"Error calculating ML RSI: {str(e)}")
             return None
 
-    def _add_technical_features(self, df):
-        """Add technical indicators as features using 'ta' library"""
-        # Price-based indicators
-        df['SMA_20'] = ta.trend.sma_indicator(df['close_price'], window=20)
-        df['SMA_50'] = ta.trend.sma_indicator(df['close_price'], window=50)
-        df['EMA_20'] = ta.trend.ema_indicator(df['close_price'], window=20)
-        
-        # Momentum indicators
-        df['MOM'] = ta.momentum.momentum_indicator(df['close_price'], window=10)
-        df['ROC'] = ta.momentum.roc(df['close_price'], window=10)
-        
-        # Volatility indicators
-        df['BB_high'] = ta.volatility.bollinger_hband(df['close_price'])
-        df['BB_low'] = ta.volatility.bollinger_lband(df['close_price'])
-        
-        # Volume indicators
-        df['MFI'] = ta.volume.money_flow_index(
-            df['high_price'], 
-            df['low_price'], 
-            df['close_price'], 
-            df['volume']
-        )
-        
-        # Trend indicators
-        df['ADX'] = ta.trend.adx(
-            df['high_price'], 
-            df['low_price'], 
-            df['close_price']
-        )
-
-    def _prepare_ml_features(self, df, lookback):
+    def _add_technical_features(self, engine, period=14):
+        """
+        Technical indicators as a (bars, len(FEATURE_COLUMNS)) matrix in the
+        feature dtype, computed by the shared indicator engine
+        """
+        values = engine.arrays({
+            # Traditional RSI with Wilder smoothing, as the 'ta' library
+            'RSI': node('rsi', period=period, smoothing='wilder'),
+            # Price-based indicators
+            'SMA_20': node('sma', period=20),
+            'SMA_50': node('sma', period=50),
+            'EMA_20': node('ema', span=20, min_periods=20),
+            # Momentum indicators
+            'MOM': node('momentum', period=10),
+            'ROC': node('roc', period=10),
+            # Volatility indicators (population std, as 'ta')
+            'BB_high': node('bollinger_upper', period=20, ddof=0),
+            'BB_low': node('bollinger_lower', period=20, ddof=0),
+            # Volume indicators
+            'MFI': node('mfi', period=14),
+            # Trend indicators
+            'ADX': node('adx', period=14)
+        })
+        features = np.empty((len(values['RSI']), len(FEATURE_COLUMNS)), dtype=feature_dtype())
+        for i, column in enumerate(FEATURE_COLUMNS):
+            features[:, i] = values[column]
+        return features
+
+    @staticmethod
+    def _lagged(features, lookback):
+        """
+        Row t holds every feature at bars t-1 .. t-lookback (feature-major:
+        each feature's lags 1..lookback in turn); NaN before the first bar
+        """
+        n_bars, n_features = features.shape
+        lagged = np.full((n_bars, n_features, lookback), np.nan, dtype=features.dtype)
+        for lag in range(1, min(lookback, n_bars - 1) + 1):
+            lagged[lag:, :, lag - 1] = features[:-lag]
+        return lagged.reshape(n_bars, n_features * lookback)
+
+    def _prepare_ml_features(self, features, close, lookback):
         """Prepare features and labels for ML model"""
-        feature_columns = [
-            'RSI', 'SMA_20', 'SMA_50', 'EMA_20', 
-            'MOM', 'ROC', 'BB_high', 'BB_low', 
-            'MFI', 'ADX'
-        ]
-        
-        # Create rolling features
-        for col in feature_columns:
-            for i in range(1, lookback + 1):
-                df[f'{col}_lag_{i}'] = df[col].shift(i)
-        
-        # Create target variable
-        df['target'] = (df['close_price'].shift(-1) > df['close_price']).astype(int)
-        
-        # Remove rows with NaN values
-        df = df.dropna()
-        
-        # Prepare features and target
-        X = df[[col for col in df.columns if col.endswith(f'lag_{i}') 
-               for i in range(1, lookback + 1)]]
-        y = df['target']
-        
-        return X, y
+        X = self._lagged(features, lookback)
+
+        # Target: whether the next close is higher; the last bar has no next close
+        y = (close[1:] > close[:-1]).astype(np.int8)
+        X = X[:-1]
+
+        # Remove rows with missing features
+        complete = ~np.isnan(X).any(axis=1)
+        return X[complete], y[complete]
 
     def _train_ml_model(self, X, y):
         """Train the Random Forest model"""
@@ -111,27 +121,26 @@ class MLIndicatorsService:
         except Exception as e:
             logger.error(f"Error training ML RSI model: {str(e)}")
 
-    def _generate_ml_rsi_signals(self, df, lookback):
+    def _generate_ml_rsi_signals(self, features, lookback):
         """Generate trading signals using ML-enhanced RSI"""
         try:
-            # Prepare features for prediction
-            X_pred = df[[col for col in df.columns if col.endswith(f'lag_{i}') 
-                        for i in range(1, lookback + 1)]].tail(1)
+            # Lag features of the latest bar, whose next close is not known yet
+            X_pred = self._lagged(features[-(lookback + 1):], lookback)[-1:]
             X_pred_scaled = self.scaler.transform(X_pred)
-            
+
             # Get prediction probabilities
             pred_proba = self.rf_model.predict_proba(X_pred_scaled)[0]
-            
+
             # Get traditional RSI value
-            current_rsi = df['RSI'].iloc[-1]
-            
+            current_rsi = float(features[-1, FEATURE_COLUMNS.index('RSI')])
+
             return {
                 'ml_rsi_signal': 'BUY' if pred_proba[1] > self.prediction_threshold else 'SELL',
                 'traditional_rsi': current_rsi,
                 'ml_confidence': pred_proba[1],
                 'prediction_proba': pred_proba.tolist()
             }
-            
+
         except Exception as e:
             logger.error(f"Error generating ML RSI signals: {str(e)}")
-            return None 
\ No newline at end of file
+            return None
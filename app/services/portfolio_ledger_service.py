@@ -0,0 +1,161 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+import logging
+import pandas as pd
+from sqlalchemy import func
+from app.database import db
+from app.database.models import PortfolioValueDaily, StockHistory, UserStock
+
+logger = logging.getLogger(__name__)
+
+# Calendar days read before a window so the first day has a close to carry forward
+CLOSE_CARRY_DAYS = 10
+
+class PortfolioLedgerService:
+    """
+    Maintains the portfolio_value_daily ledger, one row per user and trading day
+    A position counts from its purchase date onwards. Each update cycle only
+    rewrites the user's latest row and appends the days after it, so reading
+    a window is a single range scan on (user_id, date)
+    """
+
+    def get_series(self, user_id, start, end=None):
+        """Ledger rows for user_id between start and end (dates), oldest first"""
+        end = end or datetime.now().date()
+        rows = self._range(user_id, start, end)
+        if not rows and not PortfolioValueDaily.query.filter_by(user_id=user_id).first():
+            # First read for this user, build the ledger once
+            self.extend_users([user_id])
+            rows = self._range(user_id, start, end)
+        return rows
+
+    def extend_users(self, user_ids=None):
+        """
+        Bring the ledger of user_ids (default: every user with holdings) up to date
+        Returns the number of rows written
+        """
+        try:
+            positions = defaultdict(list)
+            query = UserStock.query
+            if user_ids is not None:
+                query = query.filter(UserStock.user_id.in_(user_ids))
+            for user_stock in query.all():
+                positions[user_stock.user_id].append(user_stock)
+            if not positions:
+                return 0
+
+            # Each user restarts at their latest row, which may still be today's partial day
+            last_dates = dict(
+                db.session.query(PortfolioValueDaily.user_id, func.max(PortfolioValueDaily.date))
+                .filter(PortfolioValueDaily.user_id.in_(list(positions)))
+                .group_by(PortfolioValueDaily.user_id)
+                .all()
+            )
+            starts = {
+                user_id: last_dates.get(user_id) or min(user_stock.purchase_date for user_stock in holdings).date()
+                for user_id, holdings in positions.items()
+            }
+
+            stock_ids = {user_stock.stock_id for holdings in positions.values() for user_stock in holdings}
+            closes = self._daily_closes(stock_ids, min(starts.values()), datetime.now().date())
+
+            written = 0
+            for user_id, holdings in positions.items():
+                rows = self._build_rows(user_id, holdings, closes, starts[user_id])
+                PortfolioValueDaily.query.filter(
+                    PortfolioValueDaily.user_id == user_id,
+                    PortfolioValueDaily.date >= starts[user_id]
+                ).delete(synchronize_session=False)
+                db.session.bulk_save_objects(rows)
+                written += len(rows)
+
+            db.session.commit()
+            return written
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error extending portfolio ledger: {str(e)}")
+            raise
+
+    def invalidate(self, user_id, since):
+        """
+        Drop a user's rows from since onwards after a holdings change and rebuild them
+        Failures are logged only, the next update cycle catches the ledger up
+        """
+        try:
+            PortfolioValueDaily.query.filter(
+                PortfolioValueDaily.user_id == user_id,
+                PortfolioValueDaily.date >= since
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            self.extend_users([user_id])
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error rebuilding portfolio ledger for user {user_id}: {str(e)}")
+
+    @staticmethod
+    def _range(user_id, start, end):
+        return (
+            PortfolioValueDaily.query
+            .filter(
+                PortfolioValueDaily.user_id == user_id,
+                PortfolioValueDaily.date >= start,
+                PortfolioValueDaily.date <= end
+            )
+            .order_by(PortfolioValueDaily.date)
+            .all()
+        )
+
+    @staticmethod
+    def _daily_closes(stock_ids, start, end):
+        """Trading day x stock_id frame of the last close each day, carried forward over gaps"""
+        rows = (
+            db.session.query(StockHistory.stock_id, StockHistory.date, StockHistory.close_price)
+            .filter(
+                StockHistory.stock_id.in_(stock_ids),
+                StockHistory.date >= start - timedelta(days=CLOSE_CARRY_DAYS),
+                StockHistory.date < end + timedelta(days=1)
+            )
+            .order_by(StockHistory.date)
+            .all()
+        )
+        if not rows:
+            return pd.DataFrame()
+
+        df = pd.DataFrame(rows, columns=['stock_id', 'date', 'close']).dropna(subset=['close'])
+        df['day'] = pd.to_datetime(df['date']).dt.normalize()
+        closes = df.groupby(['day', 'stock_id'])['close'].last().unstack().sort_index().ffill()
+        return closes[closes.index >= pd.Timestamp(start)]
+
+    @staticmethod
+    def _build_rows(user_id, holdings, closes, start):
+        if closes.empty:
+            return []
+
+        days = closes.index[closes.index >= pd.Timestamp(start)]
+        value = pd.Series(0.0, index=days)
+        cost = pd.Series(0.0, index=days)
+        count = pd.Series(0, index=days)
+
+        for user_stock in holdings:
+            if user_stock.stock_id not in closes.columns:
+                continue
+            held = days >= pd.Timestamp(user_stock.purchase_date).normalize()
+            price = closes.loc[days, user_stock.stock_id]
+            held &= price.notna().to_numpy()
+            value += (price * user_stock.quantity).where(held, 0.0)
+            cost += pd.Series(user_stock.purchase_price * user_stock.quantity, index=days).where(held, 0.0)
+            count += held.astype(int)
+
+        return [
+            PortfolioValueDaily(
+                user_id=user_id,
+                date=day.date(),
+                value=float(value[day]),
+                cost=float(cost[day]),
+                positions=int(count[day])
+            )
+            for day in days if count[day]
+        ]
+
+portfolio_ledger = PortfolioLedgerService()
@@ -0,0 +1,150 @@
+from collections import defaultdict
+from datetime import datetime
+import logging
+from sqlalchemy import func
+from app.database import db
+from app.database.models import PortfolioSnapshot, Stock, StockHistory, UserStock
+
+logger = logging.getLogger(__name__)
+
+class PortfolioSnapshotService:
+    """
+    Maintains one precomputed PortfolioSnapshot row per user
+    Snapshots are rebuilt for every user in one batched pass after each price
+    update; holding changes only flag the user's snapshot as stale, and it is
+    rebuilt on the next read
+    """
+
+    def get_summary(self, user_id):
+        """Return (portfolio_summary, holdings) for user_id, rebuilding a missing or stale snapshot"""
+        snapshot = PortfolioSnapshot.query.filter_by(user_id=user_id).first()
+        if snapshot is None or snapshot.stale:
+            snapshot = self.refresh_users([user_id]).get(user_id)
+        return snapshot.to_summary(), list(snapshot.holdings or [])
+
+    def refresh_all(self):
+        """Rebuild the snapshots of every user holding stocks, returns the number written"""
+        user_ids = [user_id for (user_id,) in db.session.query(UserStock.user_id).distinct().all()]
+        # Users who sold everything keep an empty snapshot rather than a stale one
+        user_ids += [
+            user_id for (user_id,) in db.session.query(PortfolioSnapshot.user_id)
+            .filter(PortfolioSnapshot.user_id.notin_(user_ids)).all()
+        ]
+        return len(self.refresh_users(user_ids))
+
+    def refresh_users(self, user_ids):
+        """Recompute and store the snapshots of user_ids, returns dict user_id -> snapshot"""
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return {}
+
+        try:
+            rows = (
+                db.session.query(UserStock, Stock)
+                .join(Stock, Stock.id == UserStock.stock_id)
+                .filter(UserStock.user_id.in_(user_ids))
+                .all()
+            )
+            previous_closes = self._previous_closes({stock.id for _, stock in rows})
+
+            positions = defaultdict(list)
+            for user_stock, stock in rows:
+                positions[user_stock.user_id].append((user_stock, stock))
+
+            existing = {
+                snapshot.user_id: snapshot
+                for snapshot in PortfolioSnapshot.query.filter(PortfolioSnapshot.user_id.in_(user_ids)).all()
+            }
+
+            now = datetime.utcnow()
+            snapshots = {}
+            for user_id in user_ids:
+                snapshot = existing.get(user_id) or PortfolioSnapshot(user_id=user_id)
+                self._fill(snapshot, positions.get(user_id, []), previous_closes)
+                snapshot.computed_at = now
+                snapshot.stale = False
+                db.session.add(snapshot)
+                snapshots[user_id] = snapshot
+
+            db.session.commit()
+            return snapshots
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error refreshing portfolio snapshots: {str(e)}")
+            raise
+
+    def mark_stale(self, user_id=None, stock_id=None):
+        """
+        Flag snapshots for a lazy rebuild: one user's after a holdings change,
+        or every holder's after one stock's price changed outside the batch refresh
+        """
+        query = PortfolioSnapshot.query
+        if user_id is not None:
+            query = query.filter(PortfolioSnapshot.user_id == user_id)
+        if stock_id is not None:
+            holders = db.session.query(UserStock.user_id).filter(UserStock.stock_id == stock_id)
+            query = query.filter(PortfolioSnapshot.user_id.in_(holders))
+        query.update({PortfolioSnapshot.stale: True}, synchronize_session=False)
+
+    @staticmethod
+    def _previous_closes(stock_ids):
+        """Last stored close before today for each stock, in one query"""
+        if not stock_ids:
+            return {}
+
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        latest = (
+            db.session.query(StockHistory.stock_id, func.max(StockHistory.date).label('date'))
+            .filter(StockHistory.stock_id.in_(stock_ids), StockHistory.date < today)
+            .group_by(StockHistory.stock_id)
+            .subquery()
+        )
+        rows = (
+            db.session.query(StockHistory.stock_id, StockHistory.close_price)
+            .join(latest, (StockHistory.stock_id == latest.c.stock_id) & (StockHistory.date == latest.c.date))
+            .all()
+        )
+        return {stock_id: close for stock_id, close in rows if close}
+
+    @staticmethod
+    def _fill(snapshot, positions, previous_closes):
+        holdings = []
+        total_value = 0
+        total_cost = 0
+        previous_value = 0
+
+        for user_stock, stock in positions:
+            price = stock.current_price or 0
+            current_value = user_stock.quantity * price
+            cost = user_stock.quantity * user_stock.purchase_price
+            return_pct = ((price - user_stock.purchase_price) / user_stock.purchase_price) * 100 if user_stock.purchase_price else 0
+
+            # Holdings without a stored previous close count as unchanged today
+            previous_close = previous_closes.get(stock.id, price)
+            daily_change = ((price - previous_close) / previous_close) * 100 if previous_close else 0
+
+            holdings.append({
+                'stock_id': stock.id,
+                'symbol': stock.symbol,
+                'name': stock.name,
+                'quantity': user_stock.quantity,
+                'purchase_price': user_stock.purchase_price,
+                'current_price': price,
+                'total_value': current_value,
+                'return_pct': return_pct,
+                'daily_change': daily_change
+            })
+            total_value += current_value
+            total_cost += cost
+            previous_value += user_stock.quantity * previous_close
+
+        snapshot.holdings = holdings
+        snapshot.total_value = total_value
+        snapshot.total_cost = total_cost
+        snapshot.total_return = total_value - total_cost
+        snapshot.total_return_pct = (snapshot.total_return / total_cost) * 100 if total_cost else 0
+        snapshot.daily_change_value = total_value - previous_value
+        snapshot.daily_change = (snapshot.daily_change_value / previous_value) * 100 if previous_value else 0
+
+portfolio_snapshots = PortfolioSnapshotService()
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+import uuid
+import logging
+from app.database import db
+from app.database.models import RefreshJob, RefreshJobItem, Stock
+from app.utils import stock_utils
+
+logger = logging.getLogger(__name__)
+
+class RefreshJobService:
+    """
+    Runs user-triggered price refreshes in the background
+    Symbols are refreshed through stock_utils' single-flight refresh, so jobs
+    from different users, page loads and background revalidations that share
+    a symbol wait on the same provider call. Job progress is kept in
+    refresh_jobs, so any web process can answer for a job
+    """
+    def __init__(self, job_ttl=timedelta(hours=1)):
+        self.job_ttl = job_ttl
+
+    def submit(self, app, user_id, symbols):
+        """Enqueue a refresh of symbols and return the job at once"""
+        self._prune()
+
+        job = RefreshJob(id=uuid.uuid4().hex, user_id=user_id)
+        symbols = list(dict.fromkeys(symbols))
+        job.items = [RefreshJobItem(symbol=symbol) for symbol in symbols]
+        db.session.add(job)
+        db.session.commit()
+
+        for symbol in symbols:
+            # max_age=0: a user-triggered refresh skips cached provider responses
+            future, started = stock_utils._stock_refreshes.submit(
+                symbol, stock_utils._refresh_stock, app, symbol, 0
+            )
+            if not started:
+                logger.info(f"Refresh for {symbol} already in flight, job {job.id} joins it")
+            future.add_done_callback(
+                lambda future, symbol=symbol: self._record(app, job.id, symbol, future)
+            )
+        return job
+
+    def get_job(self, job_id, user_id=None):
+        job = RefreshJob.query.get(job_id)
+        if job is None or (user_id is not None and job.user_id != user_id):
+            return None
+        return job
+
+    @staticmethod
+    def _record(app, job_id, symbol, future):
+        """Store one symbol's outcome on its job"""
+        with app.app_context():
+            try:
+                item = RefreshJobItem.query.filter_by(job_id=job_id, symbol=symbol).first()
+                if item is None:
+                    return
+                try:
+                    item.price = db.session.get(Stock, future.result()).current_price
+                    item.status = 'done'
+                except Exception as e:
+                    item.error = str(e)
+                    item.status = 'error'
+                item.finished_at = datetime.utcnow()
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error recording refresh of {symbol} for job {job_id}: {str(e)}")
+
+    def _prune(self):
+        cutoff = datetime.utcnow() - self.job_ttl
+        try:
+            for job in RefreshJob.query.filter(RefreshJob.created_at < cutoff).all():
+                if job.finished:
+                    db.session.delete(job)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error pruning refresh jobs: {str(e)}")
+
+refresh_jobs = RefreshJobService()
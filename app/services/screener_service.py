@@ -0,0 +1,197 @@
+from dataclasses import dataclass, field
+from typing import Dict, List
+import logging
+import threading
+import time
+import numpy as np
+from app.database import db
+from app.database.models import IndicatorSnapshot, Stock
+from app.services.universe_indicator_service import universe_indicators
+from app.utils import panel as batch
+from app.utils.filter_expressions import ExpressionError, compile_expression
+from app.utils.panel import iter_daily_panels
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SORT = 'volume'  # Most traded matches first
+
+# Bars loaded beyond an indicator's window when it is not in the snapshot
+WARMUP_BARS = 60
+
+def _snapshot_column(term):
+    """indicator_snapshots value holding term, None when it is not stored"""
+    params = dict(term.params)
+    if term.name in ('close', 'volume'):
+        return term.name
+    if term.name == 'sma':
+        if params['source'] == 'volume':
+            return 'volume_sma_20' if params['period'] == 20 else None
+        return f"sma_{params['period']}" if params['period'] in (20, 50, 100, 200) else None
+    if term.name == 'rsi':
+        return 'rsi_14' if params['period'] == 14 else None
+    if term.name.startswith('macd'):
+        return term.name if (params['fast'], params['slow'], params['signal']) == (12, 26, 9) else None
+    if term.name.startswith('bb_'):
+        return term.name if (params['period'], params['std']) == (20, 2) else None
+    return None
+
+def _panel_values(panel, term):
+    """term over every bar of a packed panel, (n_symbols, n_bars)"""
+    params = dict(term.params)
+    if term.name == 'sma':
+        return batch.rolling_mean(panel.fields[params['source']], params['period'])
+    if term.name == 'rsi':
+        return batch.rsi(panel.close, params['period'])
+    if term.name.startswith('macd'):
+        line, signal, hist = batch.macd(panel.close, params['fast'], params['slow'], params['signal'])
+        return {'macd': line, 'macd_signal': signal, 'macd_hist': hist}[term.name]
+    upper, _, lower = batch.bollinger(panel.close, params['period'], params['std'])
+    return upper if term.name == 'bb_upper' else lower
+
+def _window(term):
+    params = dict(term.params)
+    return max(params.get('period', 0), params.get('slow', 0) + params.get('signal', 0))
+
+def _json_value(value):
+    return float(value) if np.isfinite(value) else None
+
+@dataclass
+class ScreenTable:
+    """indicator_snapshots as one array per value, rows ordered by stock id"""
+    version: tuple  # (row count, latest computed_at) the table was loaded at
+    stock_ids: np.ndarray
+    symbols: List[str]
+    names: List[str]
+    bar_dates: List
+    columns: Dict[str, np.ndarray]
+    computed: Dict = field(default_factory=dict)  # Term -> values computed from stock_history
+    computing: Dict = field(default_factory=dict)  # Term -> lock held while it is computed
+
+class ScreenerService:
+    """
+    Screens the whole stock universe with a filter expression, e.g.
+        RSI(14) < 30 and close > SMA(200) and volume > 2 * SMA(volume, 20)
+    Expressions compile to numpy operations over one array per indicator, so
+    a screen costs a few vector operations whatever the universe size. Values
+    come from the nightly indicator_snapshots table, loaded once per refresh;
+    indicators it does not store (e.g. SMA(150)) are computed for the whole
+    universe from stock_history panels on first use and kept until the next
+    refresh
+    """
+    def __init__(self):
+        self._table = None
+        self._lock = threading.Lock()
+
+    def screen(self, expression, sort=None, descending=True, limit=50):
+        """
+        Stocks matching expression, ranked by the sort expression (volume by default)
+        Raises ExpressionError for an invalid expression or sort
+        """
+        started = time.perf_counter()
+        condition = compile_expression(expression)
+        try:
+            ranking = compile_expression(sort or DEFAULT_SORT, boolean=False)
+        except ExpressionError as e:
+            raise ExpressionError(f"Invalid sort: {e}") from e
+        table = self._current_table()
+        size = len(table.stock_ids)
+
+        terms = list(dict.fromkeys(condition.terms + ranking.terms))
+        columns = {term: self._values(table, term) for term in terms}
+        matched = np.flatnonzero(np.broadcast_to(condition.evaluate(columns), (size,)))
+        scores = np.broadcast_to(ranking.evaluate(columns), (size,)).astype(np.float64)[matched]
+        # Missing scores rank last either way
+        order = np.argsort(-scores if descending else scores, kind='stable')
+        top = matched[order[:limit]]
+
+        return {
+            'expression': condition.text,
+            'sort': ranking.text,
+            'order': 'desc' if descending else 'asc',
+            'universe': size,
+            'count': len(matched),
+            'as_of': table.version[1].isoformat() if table.version[1] else None,
+            'matches': [
+                {
+                    'symbol': table.symbols[i],
+                    'name': table.names[i],
+                    'bar_date': table.bar_dates[i].isoformat() if table.bar_dates[i] else None,
+                    'score': _json_value(scores[rank]),
+                    'values': {term.label: _json_value(columns[term][i]) for term in terms}
+                }
+                for rank, i in zip(order[:limit], top)
+            ],
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    def _current_table(self):
+        version = tuple(db.session.query(
+            db.func.count(IndicatorSnapshot.id), db.func.max(IndicatorSnapshot.computed_at)
+        ).one())
+        with self._lock:
+            if self._table is None or self._table.version != version:
+                self._table = self._load_table(version)
+            return self._table
+
+    @staticmethod
+    def _load_table(version):
+        rows = (
+            db.session.query(
+                IndicatorSnapshot.stock_id, Stock.symbol, Stock.name, IndicatorSnapshot.bar_date,
+                IndicatorSnapshot.values
+            )
+            .join(Stock, Stock.id == IndicatorSnapshot.stock_id)
+            .order_by(IndicatorSnapshot.stock_id)
+            .all()
+        )
+        names = dict.fromkeys(name for row in rows for name in row.values)
+        # None (undefined) becomes NaN, which matches no comparison
+        columns = {name: np.array([row.values.get(name) for row in rows], dtype=np.float64) for name in names}
+        logger.info(f"Loaded indicator snapshots of {len(rows)} stocks for screening")
+        return ScreenTable(
+            version=version,
+            stock_ids=np.array([row.stock_id for row in rows], dtype=np.int64),
+            symbols=[row.symbol for row in rows],
+            names=[row.name for row in rows],
+            bar_dates=[row.bar_date for row in rows],
+            columns=columns
+        )
+
+    def _values(self, table, term):
+        column = _snapshot_column(term)
+        if column is not None and column in table.columns:
+            return table.columns[column]
+        values = table.computed.get(term)
+        if values is not None:
+            return values
+
+        # Computed under a lock of its own, so screens over other terms (and
+        # table reloads) do not wait behind it; concurrent screens needing the
+        # same term wait for the first computation
+        with self._lock:
+            term_lock = table.computing.setdefault(term, threading.Lock())
+        with term_lock:
+            values = table.computed.get(term)
+            if values is None:
+                values = self._compute(table, term)
+                with self._lock:
+                    table.computed[term] = values
+        return values
+
+    @staticmethod
+    def _compute(table, term):
+        """term's latest value for every stock of table, from stock_history"""
+        started = time.perf_counter()
+        values = np.full(len(table.stock_ids), np.nan)
+        stocks = Stock.query.filter(Stock.id.in_(table.stock_ids.tolist())).order_by(Stock.id).all()
+        bars = max(universe_indicators.bars, _window(term) + WARMUP_BARS)
+        for panel in iter_daily_panels(bars, universe_indicators.chunk_size, stocks):
+            if not panel.shape[1]:
+                continue
+            packed = panel.packed()
+            positions = np.searchsorted(table.stock_ids, panel.stock_ids)
+            values[positions] = packed.last_valid(_panel_values(packed, term))
+        logger.info(f"Computed {term.label} for {len(stocks)} stocks in {time.perf_counter() - started:.1f}s")
+        return values
+
+screener = ScreenerService()
@@ -1,6 +1,7 @@
 from app.services.ai_analysis_service import AIAnalysisService
 from app.services.ml_indicators_service import MLIndicatorsService
 from app.services.advanced_indicators_service import AdvancedIndicatorsService
+from app.utils.indicator_engine import IndicatorEngine
 import pandas as pd
 import logging
 
@@ -12,24 +13,29 @@ class StockAnalyzer:
         self.ml_indicators = MLIndicatorsService()
         self.advanced_indicators = AdvancedIndicatorsService()
 
-    def analyze_stock(self, stock_data):
+    def analyze_stock(self, stock_data, symbol=None, resolution='1d'):
         """
         Perform comprehensive stock analysis
         Args:
             stock_data: DataFrame with columns ['date', 'open_price', 'high_price', 'low_price', 'close_price', 'volume']
+            symbol: When given, indicator outputs are shared through the indicator cache
+            resolution: Bar size of stock_data, part of the cache key
         """
         try:
+            # Every analysis reads its indicators from one engine, so each is computed once
+            engine = IndicatorEngine(stock_data, symbol=symbol, resolution=resolution)
+
             # Train AI model
-            self.ai_service.train_model(stock_data)
+            self.ai_service.train_model(stock_data, engine=engine)
 
             # Get AI predictions and signals
-            analysis = self.ai_service.get_trading_signals(stock_data)
+            analysis = self.ai_service.get_trading_signals(stock_data, engine=engine, symbol=symbol, resolution=resolution)
             
             # Get ML-RSI signals
-            ml_rsi = self.ml_indicators.calculate_ml_rsi(stock_data)
+            ml_rsi = self.ml_indicators.calculate_ml_rsi(stock_data, engine=engine)
             
             # Get advanced indicators
-            advanced_signals = self.advanced_indicators.get_combined_signals(stock_data)
+            advanced_signals = self.advanced_indicators.get_combined_signals(stock_data, engine=engine)
 
             # Combine all analyses
             return self._compile_analysis(analysis, ml_rsi, advanced_signals, stock_data)
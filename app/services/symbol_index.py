@@ -0,0 +1,304 @@
+from bisect import bisect_left
+from collections import Counter
+from dataclasses import dataclass
+import csv
+import heapq
+import os
+import re
+import threading
+import time
+import logging
+from app.database.models import Stock
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+@dataclass(frozen=True)
+class SymbolEntry:
+    symbol: str
+    name: str
+    type: str = 'stock'
+    exchange: str = ''
+
+    def to_dict(self):
+        result = {'symbol': self.symbol, 'name': self.name, 'type': self.type}
+        if self.exchange:
+            result['exchange'] = self.exchange
+        return result
+
+def rank_key(item, query):
+    """Search ranking: exact matches first, then prefixes, then shorter symbols"""
+    query = query.lower()
+    symbol = item['symbol'].lower()
+    name = item['name'].lower()
+    return (
+        symbol != query,               # Exact symbol matches first
+        name != query,                 # Exact name matches second
+        not symbol.startswith(query),  # Symbol starts with query third
+        not name.startswith(query),    # Name starts with query fourth
+        len(symbol),                   # Shorter symbols preferred
+        symbol                         # Alphabetical order
+    )
+
+def _ngrams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+def _edit_distance(a, b, limit):
+    """Damerau-Levenshtein (optimal string alignment) distance, capped at limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    previous = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(current[j - 1] + 1, row[j] + 1, row[j - 1] + cost)
+            if (previous is not None and i > 1 and j > 1 and
+                    a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous, row = row, current
+    return row[-1]
+
+class _IndexState:
+    """
+    Immutable lookup structures, swapped in whole on every rebuild
+    Entries are stored in (symbol length, symbol) order, so an entry id is
+    also its tie-break rank and sorted postings yield the best matches first
+    """
+    def __init__(self, entries):
+        self.entries = sorted(entries, key=lambda entry: (len(entry.symbol), entry.symbol.lower()))
+        self.symbols = [entry.symbol.lower() for entry in self.entries]
+        self.names = [entry.name.lower() for entry in self.entries]
+
+        self.by_symbol = {}
+        self.by_name = {}
+        for i, (symbol, name) in enumerate(zip(self.symbols, self.names)):
+            self.by_symbol.setdefault(symbol, []).append(i)
+            self.by_name.setdefault(name, []).append(i)
+
+        # Sorted keys for prefix lookups with bisect
+        self.symbol_order = sorted(range(len(self.entries)), key=lambda i: self.symbols[i])
+        self.sorted_symbols = [self.symbols[i] for i in self.symbol_order]
+        self.name_order = sorted(range(len(self.entries)), key=lambda i: self.names[i])
+        self.sorted_names = [self.names[i] for i in self.name_order]
+
+        # N-gram postings over symbols and names, ascending by entry id
+        self.bigrams = {}
+        self.trigrams = {}
+        tokens = {}
+        for i, (symbol, name) in enumerate(zip(self.symbols, self.names)):
+            for gram in _ngrams(symbol, 2) | _ngrams(name, 2):
+                self.bigrams.setdefault(gram, []).append(i)
+            for gram in _ngrams(symbol, 3) | _ngrams(name, 3):
+                self.trigrams.setdefault(gram, []).append(i)
+            for token in set(TOKEN_PATTERN.findall(name)) | {symbol}:
+                tokens.setdefault(token, []).append(i)
+
+        self.sorted_tokens = sorted(tokens)
+        self.token_postings = [tokens[token] for token in self.sorted_tokens]
+
+        # Padded trigrams over the token vocabulary for typo tolerance
+        self.vocabulary_grams = {}
+        for v, token in enumerate(self.sorted_tokens):
+            for gram in _ngrams(f'${token}$', 3):
+                self.vocabulary_grams.setdefault(gram, []).append(v)
+
+    @staticmethod
+    def _prefix_range(sorted_keys, prefix):
+        start = bisect_left(sorted_keys, prefix)
+        end = bisect_left(sorted_keys, prefix + '\uffff', start)
+        return start, end
+
+    def symbol_prefix(self, prefix):
+        start, end = self._prefix_range(self.sorted_symbols, prefix)
+        return self.symbol_order[start:end]
+
+    def name_prefix(self, prefix):
+        start, end = self._prefix_range(self.sorted_names, prefix)
+        return self.name_order[start:end]
+
+    def token_prefix(self, prefix):
+        start, end = self._prefix_range(self.sorted_tokens, prefix)
+        ids = set()
+        for postings in self.token_postings[start:end]:
+            ids.update(postings)
+        return ids
+
+    def substring(self, query, exclude, limit):
+        """Best entries whose symbol or name contains query, like ilike '%query%'"""
+        grams = _ngrams(query, 3) if len(query) >= 3 else _ngrams(query, 2)
+        postings = self.trigrams if len(query) >= 3 else self.bigrams
+        lists = [postings.get(gram, ()) for gram in grams]
+        if not lists:
+            return []
+
+        matches = []
+        for i in min(lists, key=len):
+            if i in exclude:
+                continue
+            if query in self.symbols[i] or query in self.names[i]:
+                matches.append(i)
+                if len(matches) >= limit:
+                    break
+        return matches
+
+    def fuzzy(self, query, exclude, limit):
+        """Entries whose symbol or a name token is within a small edit distance"""
+        grams = _ngrams(f'${query}$', 3)
+        overlap = Counter()
+        for gram in grams:
+            overlap.update(self.vocabulary_grams.get(gram, ()))
+
+        max_distance = 1 if len(query) <= 4 else 2
+        matches = []
+        for v, count in overlap.items():
+            token = self.sorted_tokens[v]
+            # Dice coefficient pre-filter before the exact distance check
+            if 2 * count < 0.4 * (len(grams) + len(token)):
+                continue
+            distance = _edit_distance(query, token, max_distance)
+            if distance <= max_distance:
+                matches.extend((distance, i) for i in self.token_postings[v] if i not in exclude)
+
+        seen = set()
+        results = []
+        for _, i in sorted(matches):
+            if i not in seen:
+                seen.add(i)
+                results.append(i)
+                if len(results) >= limit:
+                    break
+        return results
+
+class SymbolSearchIndex:
+    """
+    In-process autocomplete index over the listed-symbol universe
+    Supports symbol prefixes, name tokens, substring and fuzzy matches
+    without touching the database or the network
+    """
+    def __init__(self):
+        self._state = _IndexState([])
+        self._lock = threading.Lock()
+        self._thread = None
+        self.loaded_at = None
+
+    @property
+    def ready(self):
+        return self.loaded_at is not None
+
+    def __len__(self):
+        return len(self._state.entries)
+
+    def build(self, entries):
+        """Replace the index contents, keeping the first entry seen per symbol"""
+        unique = {}
+        for entry in entries:
+            if entry.symbol and entry.symbol.upper() not in unique:
+                unique[entry.symbol.upper()] = entry
+        state = _IndexState(list(unique.values()))
+
+        with self._lock:
+            self._state = state
+            self.loaded_at = time.time()
+
+    def search(self, query, limit=10):
+        """Top matches ranked like rank_key, followed by fuzzy matches if room is left"""
+        query = query.strip().lower()
+        state = self._state
+        if not query or not state.entries:
+            return []
+
+        # Tiers in rank_key order; ids break ties by symbol length and name
+        taken = []
+        seen = set()
+
+        def take(ids):
+            for i in ids:
+                if len(taken) >= limit:
+                    return
+                if i not in seen:
+                    seen.add(i)
+                    taken.append(i)
+
+        take(sorted(state.by_symbol.get(query, ())))
+        take(sorted(state.by_name.get(query, ()), key=lambda i: (not state.symbols[i].startswith(query), i)))
+        if len(taken) < limit:
+            take(heapq.nsmallest(
+                limit,
+                (i for i in state.symbol_prefix(query) if i not in seen),
+                key=lambda i: (not state.names[i].startswith(query), i)
+            ))
+        if len(taken) < limit:
+            take(heapq.nsmallest(limit, (i for i in state.name_prefix(query) if i not in seen)))
+        if len(taken) < limit:
+            candidates = state.substring(query, seen, limit - len(taken))
+            tokens = TOKEN_PATTERN.findall(query)
+            if len(tokens) > 1:
+                # Every query word prefixes a name word, in any order
+                token_matches = state.token_prefix(tokens[0])
+                for token in tokens[1:]:
+                    token_matches &= state.token_prefix(token)
+                candidates = heapq.nsmallest(limit, set(candidates) | (token_matches - seen))
+            take(candidates)
+        if len(taken) < limit and ' ' not in query:
+            take(state.fuzzy(query, seen, limit - len(taken)))
+
+        return [state.entries[i].to_dict() for i in taken]
+
+    @staticmethod
+    def load_entries(path=None):
+        """Entries from the bulk symbol file (if any) followed by the stocks table"""
+        entries = []
+        if path and os.path.exists(path):
+            with open(path, newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    symbol = (row.get('symbol') or '').strip().upper()
+                    if not symbol:
+                        continue
+                    entries.append(SymbolEntry(
+                        symbol=symbol,
+                        name=(row.get('name') or '').strip(),
+                        type=(row.get('type') or 'stock').strip().lower(),
+                        exchange=(row.get('exchange') or '').strip()
+                    ))
+
+        for symbol, name, stock_type in Stock.query.with_entities(Stock.symbol, Stock.name, Stock.type).all():
+            entries.append(SymbolEntry(symbol=symbol, name=name or '', type=stock_type or 'stock'))
+
+        return entries
+
+    def refresh(self, app):
+        with app.app_context():
+            try:
+                self.build(self.load_entries(app.config.get('SYMBOL_UNIVERSE_FILE')))
+                logger.info(f"Symbol index loaded with {len(self)} symbols")
+            except Exception as e:
+                logger.error(f"Error loading symbol index: {str(e)}")
+
+    def ensure_started(self, app):
+        """Start the background loader on first use; searches fall back until it is ready"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            interval = app.config.get('SYMBOL_INDEX_REFRESH_SECONDS', 3600)
+            self._thread = threading.Thread(
+                target=self._refresh_loop,
+                args=(app, interval),
+                name='symbol-index',
+                daemon=True
+            )
+            self._thread.start()
+
+    def _refresh_loop(self, app, interval):
+        while True:
+            self.refresh(app)
+            time.sleep(interval)
+
+symbol_index = SymbolSearchIndex()
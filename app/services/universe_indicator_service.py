@@ -0,0 +1,92 @@
+from datetime import datetime
+import logging
+import numpy as np
+from app.database import db
+from app.database.models import IndicatorSnapshot
+from app.utils import panel as batch
+from app.utils.panel import iter_daily_panels
+
+logger = logging.getLogger(__name__)
+
+# Daily bars loaded per symbol: enough for the longest window below plus warm-up
+SNAPSHOT_BARS = 260
+
+def _snapshot_columns(panel):
+    """Every snapshot indicator for every symbol of panel, (n_symbols, n_bars) each"""
+    close, volume = panel.close, panel.volume
+    macd_line, macd_signal, macd_hist = batch.macd(close)
+    bb_upper, _, bb_lower = batch.bollinger(close, 20, 2)
+    return {
+        'close': close,
+        'volume': volume,
+        'sma_20': batch.rolling_mean(close, 20),
+        'sma_50': batch.rolling_mean(close, 50),
+        'sma_100': batch.rolling_mean(close, 100),
+        'sma_200': batch.rolling_mean(close, 200),
+        'ema_20': batch.ema(close, span=20),
+        'rsi_14': batch.rsi(close, 14),
+        'macd': macd_line,
+        'macd_signal': macd_signal,
+        'macd_hist': macd_hist,
+        'bb_upper': bb_upper,
+        'bb_lower': bb_lower,
+        'volume_sma_20': batch.rolling_mean(volume, 20),
+        'obv': batch.on_balance_volume(close, volume)
+    }
+
+def _json_value(value):
+    # Shortest decimal at the value's own precision, so float32 panel values
+    # are stored as e.g. 107.28 rather than 107.27999877929688
+    return float(str(value)) if np.isfinite(value) else None
+
+class UniverseIndicatorService:
+    """
+    Refreshes indicator_snapshots for the whole stock universe
+    Symbols are aligned into NaN-padded daily panels, chunk_size symbols at a
+    time, and each indicator is computed for the whole chunk in one array
+    operation instead of one pandas call per symbol
+    """
+    def __init__(self, chunk_size=500, bars=SNAPSHOT_BARS):
+        self.chunk_size = chunk_size
+        self.bars = bars
+
+    def refresh(self, stocks=None):
+        """Recompute the snapshot of every stock (or stocks), returns the number written"""
+        written = 0
+        for panel in iter_daily_panels(self.bars, self.chunk_size, stocks):
+            try:
+                written += self._store(panel)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error refreshing indicator snapshots for {panel.symbols[0]}..{panel.symbols[-1]}: {str(e)}")
+        return written
+
+    @staticmethod
+    def _store(panel):
+        if not panel.shape[1]:
+            return 0
+        # Each symbol's indicators run over its own bars, as the per-stock charts
+        packed = panel.packed()
+        latest = {name: packed.last_valid(values) for name, values in _snapshot_columns(packed).items()}
+
+        rows = {
+            row.stock_id: row
+            for row in IndicatorSnapshot.query.filter(IndicatorSnapshot.stock_id.in_(panel.stock_ids)).all()
+        }
+        now = datetime.utcnow()
+        written = 0
+        for i, (stock_id, bar_date) in enumerate(zip(panel.stock_ids, panel.last_dates())):
+            if bar_date is None:
+                continue
+            row = rows.get(stock_id)
+            if row is None:
+                row = IndicatorSnapshot(stock_id=stock_id)
+                db.session.add(row)
+            row.bar_date = bar_date
+            row.values = {name: _json_value(values[i]) for name, values in latest.items()}
+            row.computed_at = now
+            written += 1
+        return written
+
+universe_indicators = UniverseIndicatorService()
@@ -8,6 +8,7 @@ from datetime import datetime, timedelta
 from app import create_app
 from app.database import db
 from app.database.models import Stock, StockHistory
+from app.services.indicator_state_service import indicator_states
 import logging
 
 logger = logging.getLogger(__name__)
@@ -39,6 +40,13 @@ def load_historical_data(days=365*20):  # 20 years by default
                         )
                         db.session.add(history)
                     
+                    # Older bars were added, so rebuild the stock's indicator states over them
+                    if not hist.empty:
+                        indicator_states.advance(
+                            stock.id,
+                            rewritten_from=hist.index[0].to_pydatetime().replace(tzinfo=None)
+                        )
+                    
                     # Commit per stock to avoid huge transactions
                     db.session.commit()
                     logger.info(f"Loaded historical data for {stock.symbol}")
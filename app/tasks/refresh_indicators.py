@@ -0,0 +1,31 @@
+import sys
+import os
+# Add the project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from datetime import datetime
+from app import create_app
+from app.services.universe_indicator_service import universe_indicators
+import logging
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+)
+logger = logging.getLogger(__name__)
+
+def refresh_indicators():
+    """Recompute the latest daily indicator values of every stock in one batch"""
+    logger.info(f"Indicator refresh starting at {datetime.now()}")
+    app = create_app()
+
+    with app.app_context():
+        try:
+            written = universe_indicators.refresh()
+            logger.info(f"Refreshed indicator snapshots for {written} stocks")
+        except Exception as e:
+            logger.error(f"Error in refresh_indicators: {str(e)}")
+            logger.error("Traceback:", exc_info=True)
+
+if __name__ == "__main__":
+    refresh_indicators()
@@ -8,6 +8,10 @@ from datetime import datetime, timedelta
 from app import create_app
 from app.database import db
 from app.database.models import Stock, StockHistory
+from app.services.portfolio_snapshot_service import portfolio_snapshots
+from app.services.portfolio_ledger_service import portfolio_ledger
+from app.services import change_events
+from app.services.indicator_state_service import indicator_states
 import logging
 import pandas as pd
 
@@ -93,6 +97,7 @@ def update_stock_data():
                     )
                     
                     # Store historical data
+                    last_bar_ts = None
                     for index, row in hist.iterrows():
                         # Check if we already have this data point
                         existing_history = StockHistory.query.filter_by(
@@ -111,16 +116,40 @@ def update_stock_data():
                                 volume=row['Volume']
                             )
                             db.session.add(history)
+                            last_bar_ts = index
                             logger.info(f"Added historical data for {stock.symbol} at {index}")
                     
+                    # Feed the new bars to the stored indicator states
+                    indicator_states.advance(stock.id)
+                    
+                    # Tell the web processes which cached data is now outdated
+                    if last_bar_ts is not None:
+                        change_events.publish(stock.symbol, change_events.HISTORY, last_bar_ts=last_bar_ts.to_pydatetime().replace(tzinfo=None))
+                    else:
+                        change_events.publish(stock.symbol, change_events.QUOTE)
+                    
+                    # Commit per symbol so its change events become visible right away,
+                    # close to the ids they were given
+                    db.session.commit()
+                    
                 except Exception as e:
+                    db.session.rollback()
                     logger.error(f"Error updating {stock.symbol}: {str(e)}")
                     logger.error("Traceback:", exc_info=True)
                     continue
             
-            # Commit all updates
-            db.session.commit()
             logger.info("Stock data update completed successfully")
+            
+            # Rebuild every user's dashboard snapshot against the new prices
+            refreshed = portfolio_snapshots.refresh_all()
+            logger.info(f"Refreshed {refreshed} portfolio snapshots")
+            
+            # Extend the daily value ledger by the latest trading day
+            written = portfolio_ledger.extend_users()
+            logger.info(f"Wrote {written} portfolio ledger rows")
+            
+            pruned = change_events.prune()
+            logger.info(f"Pruned {pruned} old change events")
             logger.info("=" * 80)
             
         except Exception as e:
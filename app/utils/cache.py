@@ -0,0 +1,506 @@
+from collections import OrderedDict
+import ast
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL
+    Expired entries are dropped on read; the least recently used entry is
+    evicted once maxsize is reached
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None, max_age=None):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, stored_at, expires_at = entry
+                if (expires_at is None or expires_at > now) and (max_age is None or now - stored_at <= max_age):
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                if expires_at is not None and expires_at <= now:
+                    del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None, stored_at=None):
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, stored_at or now, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def invalidate(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def invalidate_where(self, predicate):
+        """Drop every entry whose key matches predicate, returns the count"""
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+class SQLiteStore:
+    """
+    Key/value store in a local SQLite file shared by every worker process
+    Values are pickled, and zlib-compressed above compress_min_bytes. Keys are
+    grouped by namespace and carry an optional tag (the symbol) so entries
+    for one symbol can be found without scanning the whole table. Storage
+    errors are logged and treated as misses
+    """
+    PURGE_EVERY = 500
+
+    def __init__(self, path, compress_min_bytes=1024):
+        self.path = path
+        self.compress_min_bytes = compress_min_bytes
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._execute(
+            'CREATE TABLE IF NOT EXISTS cache_entries ('
+            'namespace TEXT NOT NULL, key TEXT NOT NULL, tag TEXT, value BLOB NOT NULL, '
+            'stored_at REAL NOT NULL, expires_at REAL, PRIMARY KEY (namespace, key))'
+        )
+        self._execute('CREATE INDEX IF NOT EXISTS idx_cache_tag ON cache_entries (namespace, tag)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql, params=()):
+        return self._connection().execute(sql, params)
+
+    def _dumps(self, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) >= self.compress_min_bytes:
+            return b'z' + zlib.compress(data, 1)
+        return b'p' + data
+
+    @staticmethod
+    def _loads(blob):
+        blob = bytes(blob)
+        data = zlib.decompress(blob[1:]) if blob[:1] == b'z' else blob[1:]
+        return pickle.loads(data)
+
+    def get(self, namespace, key):
+        """(value, stored_at, expires_at) or None"""
+        try:
+            row = self._execute(
+                'SELECT value, stored_at, expires_at FROM cache_entries WHERE namespace = ? AND key = ?',
+                (namespace, key)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[2] is not None and row[2] <= time.time():
+                self.delete(namespace, key)
+                return None
+            return self._loads(row[0]), row[1], row[2]
+        except Exception as e:
+            logger.error(f"Shared cache read failed: {str(e)}")
+            return None
+
+    def set(self, namespace, key, value, stored_at, expires_at, tag=None):
+        try:
+            self._execute(
+                'INSERT OR REPLACE INTO cache_entries (namespace, key, tag, value, stored_at, expires_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (namespace, key, tag, self._dumps(value), stored_at, expires_at)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self.purge_expired()
+        except Exception as e:
+            logger.error(f"Shared cache write failed: {str(e)}")
+
+    def delete(self, namespace, key):
+        try:
+            self._execute('DELETE FROM cache_entries WHERE namespace = ? AND key = ?', (namespace, key))
+        except Exception as e:
+            logger.error(f"Shared cache delete failed: {str(e)}")
+
+    def keys(self, namespace, tag=None):
+        if tag is None:
+            rows = self._execute('SELECT key FROM cache_entries WHERE namespace = ?', (namespace,))
+        else:
+            rows = self._execute('SELECT key FROM cache_entries WHERE namespace = ? AND tag = ?', (namespace, tag))
+        return [row[0] for row in rows]
+
+    def entries(self, namespace, tags, limit):
+        """Newest unexpired (key, value, stored_at, expires_at) rows for the given tags"""
+        tags = list(tags)
+        if not tags:
+            return []
+        placeholders = ', '.join('?' for _ in tags)
+        rows = self._execute(
+            f'SELECT key, value, stored_at, expires_at FROM cache_entries '
+            f'WHERE namespace = ? AND tag IN ({placeholders}) AND (expires_at IS NULL OR expires_at > ?) '
+            f'ORDER BY stored_at DESC LIMIT ?',
+            (namespace, *tags, time.time(), limit)
+        ).fetchall()
+        return [(key, self._loads(value), stored_at, expires_at) for key, value, stored_at, expires_at in rows]
+
+    def clear(self, namespace):
+        self._execute('DELETE FROM cache_entries WHERE namespace = ?', (namespace,))
+
+    def purge_expired(self):
+        self._execute('DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?', (time.time(),))
+
+    def count(self, namespace):
+        return self._execute('SELECT COUNT(*) FROM cache_entries WHERE namespace = ?', (namespace,)).fetchone()[0]
+
+def _symbol_tag(key):
+    # Cache keys are (kind, symbol, ...) tuples
+    if isinstance(key, tuple) and len(key) > 1 and isinstance(key[1], str):
+        return key[1].upper()
+    return None
+
+_tiered_caches = []
+
+class TieredCache(LRUCache):
+    """
+    In-process LRU (first tier) in front of an optional SQLiteStore (second tier)
+    shared by all worker processes. A first-tier miss is answered from the
+    store and copied back, keeping its original age. Entries without a TTL
+    live in the store for store_ttl seconds. Until a store is attached with
+    attach_shared_store() this behaves exactly like LRUCache
+    """
+    def __init__(self, maxsize=1024, namespace='default', store_ttl=24 * 60 * 60):
+        super().__init__(maxsize)
+        self.namespace = namespace
+        self.store_ttl = store_ttl
+        self.store = None
+        self.store_hits = 0
+        _tiered_caches.append(self)
+
+    def get(self, key, default=None, max_age=None):
+        value = super().get(key, _MISSING, max_age=max_age)
+        if value is not _MISSING or self.store is None:
+            return default if value is _MISSING else value
+
+        entry = self.store.get(self.namespace, repr(key))
+        if entry is None:
+            return default
+        value, stored_at, expires_at = entry
+        if max_age is not None and time.time() - stored_at > max_age:
+            return default
+
+        self.store_hits += 1
+        ttl = expires_at - time.time() if expires_at is not None else None
+        super().set(key, value, ttl=ttl, stored_at=stored_at)
+        return value
+
+    def set(self, key, value, ttl=None, stored_at=None):
+        super().set(key, value, ttl=ttl, stored_at=stored_at)
+        if self.store is not None:
+            now = time.time()
+            expires_at = now + (ttl if ttl is not None else self.store_ttl)
+            self.store.set(self.namespace, repr(key), value, stored_at or now, expires_at, tag=_symbol_tag(key))
+
+    def invalidate(self, key):
+        removed = super().invalidate(key)
+        if self.store is not None:
+            self.store.delete(self.namespace, repr(key))
+        return removed
+
+    def invalidate_where(self, predicate, tag=None):
+        """Drop matching entries from both tiers; tag narrows the store scan to one symbol"""
+        count = super().invalidate_where(predicate)
+        if self.store is not None:
+            try:
+                for stored_key in self.store.keys(self.namespace, tag.upper() if tag else None):
+                    try:
+                        key = ast.literal_eval(stored_key)
+                    except (ValueError, SyntaxError):
+                        continue
+                    if predicate(key):
+                        self.store.delete(self.namespace, stored_key)
+            except Exception as e:
+                logger.error(f"Shared cache invalidation failed: {str(e)}")
+        return count
+
+    def clear(self):
+        super().clear()
+        if self.store is not None:
+            self.store.clear(self.namespace)
+
+    def preload(self, tags, limit=None):
+        """Copy the newest stored entries for tags into the first tier, returns the count"""
+        if self.store is None:
+            return 0
+        loaded = 0
+        for stored_key, value, stored_at, expires_at in self.store.entries(
+                self.namespace, [tag.upper() for tag in tags], limit or self.maxsize):
+            try:
+                key = ast.literal_eval(stored_key)
+            except (ValueError, SyntaxError):
+                continue
+            ttl = expires_at - time.time() if expires_at is not None else None
+            LRUCache.set(self, key, value, ttl=ttl, stored_at=stored_at)
+            loaded += 1
+        return loaded
+
+    def stats(self):
+        stats = super().stats()
+        stats['store_hits'] = self.store_hits
+        if self.store is not None:
+            try:
+                stats['store_size'] = self.store.count(self.namespace)
+            except Exception:
+                stats['store_size'] = None
+        return stats
+
+def attach_shared_store(path):
+    """Back every TieredCache with one SQLiteStore at path, returns the store"""
+    store = SQLiteStore(path)
+    for cache in _tiered_caches:
+        cache.store = store
+    return store
+
+def tiered_caches():
+    return list(_tiered_caches)
+
+class ArrayCache:
+    """
+    Thread-safe LRU of numeric arrays bounded by their total size in bytes
+    Values are sequences of arrays, stored as dtype (float32 halves their
+    footprint); get() returns them as stored. A value larger than max_bytes
+    is not kept
+    """
+    ENTRY_OVERHEAD = 256  # Approximate bytes per entry besides the array data
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, dtype=np.float32):
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, arrays):
+        arrays = tuple(np.asarray(array, dtype=self.dtype) for array in arrays)
+        size = sum(array.nbytes for array in arrays) + self.ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._data[key] = (arrays, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+        return True
+
+    def invalidate_where(self, predicate):
+        """Drop every entry whose key matches predicate, returns the count"""
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                self.bytes -= self._data.pop(key)[1]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+class InvalidSymbolError(ValueError):
+    """Raised for symbols the provider recently reported as unknown"""
+
+class ProviderCache:
+    """
+    Response cache for market data provider calls
+    Entries are keyed by (call type, symbol, params) and expire after a TTL
+    chosen per call type. Expired entries are kept (up to stale_max_age) and
+    served when a refetch fails. Symbols the provider does not know are
+    remembered in a separate negative cache so they are not retried on every
+    request
+    """
+    DEFAULT_TTLS = {
+        'quote': 60,
+        'history': 15 * 60,
+        'empty': 60,  # Responses without data: outside trading hours or a provider gap
+        'info': 60 * 60,
+        'search': 24 * 60 * 60
+    }
+
+    def __init__(self, maxsize=2048, ttls=None, negative_maxsize=4096, negative_ttl=6 * 60 * 60,
+                 stale_max_age=24 * 60 * 60):
+        self.ttls = dict(self.DEFAULT_TTLS, **(ttls or {}))
+        self.negative_ttl = negative_ttl
+        self.stale_max_age = stale_max_age
+        # Stale fallbacks need the store to keep entries past their TTL
+        self._entries = TieredCache(maxsize, namespace='provider', store_ttl=stale_max_age)
+        self._invalid = LRUCache(negative_maxsize)
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    @staticmethod
+    def make_key(call_type, symbol, params=None):
+        return (call_type, symbol.upper() if symbol else None, tuple(sorted((params or {}).items())))
+
+    def _max_age(self, call_type, max_age=None):
+        ttl = self.ttls.get(call_type)
+        if ttl is None:
+            return max_age
+        return ttl if max_age is None else min(ttl, max_age)
+
+    def get_or_fetch(self, call_type, symbol, fetch, params=None, max_age=None, is_invalid=None, is_empty=None):
+        """
+        Return the cached response or call fetch() and cache its result
+        is_invalid(result) marks the symbol as unknown instead of caching the result;
+        pass it only for answers that say so definitively. Results for which
+        is_empty(result) holds are cached with the short 'empty' TTL
+        If fetch() fails, an expired entry is returned instead when one is kept
+        """
+        if symbol and self.is_invalid(symbol):
+            self._count(call_type, 'negative_hits')
+            raise InvalidSymbolError(f"Unknown symbol: {symbol}")
+
+        key = self.make_key(call_type, symbol, params)
+        value = self._entries.get(key, _MISSING, max_age=self._max_age(call_type, max_age))
+        if value is not _MISSING and is_empty is not None and is_empty(value):
+            value = self._entries.get(key, _MISSING, max_age=self._max_age('empty', max_age))
+        if value is not _MISSING:
+            self._count(call_type, 'hits')
+            return value
+
+        self._count(call_type, 'misses')
+        try:
+            value = fetch()
+        except Exception as e:
+            stale = self._entries.get(key, _MISSING, max_age=self.stale_max_age)
+            if stale is _MISSING:
+                raise
+            self._count(call_type, 'stale_hits')
+            logger.warning(f"Serving stale {call_type} for {symbol}: {str(e)}")
+            return stale
+
+        if symbol and is_invalid is not None and is_invalid(value):
+            self.mark_invalid(symbol)
+            raise InvalidSymbolError(f"Unknown symbol: {symbol}")
+
+        # Freshness is checked on read, so the entry stays available as a stale fallback
+        self._entries.set(key, value)
+        return value
+
+    def peek(self, call_type, symbol, params=None):
+        """Cached response without fetching, or None"""
+        return self._entries.get(self.make_key(call_type, symbol, params), max_age=self._max_age(call_type))
+
+    def set(self, call_type, symbol, value, params=None):
+        self._entries.set(self.make_key(call_type, symbol, params), value)
+
+    def is_invalid(self, symbol):
+        return symbol.upper() in self._invalid
+
+    def mark_invalid(self, symbol):
+        self._invalid.set(symbol.upper(), True, ttl=self.negative_ttl)
+
+    def invalidate_symbol(self, symbol, call_types=None):
+        symbol = symbol.upper()
+        return self._entries.invalidate_where(
+            lambda key: key[1] == symbol and (call_types is None or key[0] in call_types),
+            tag=symbol
+        )
+
+    def clear(self):
+        self._entries.clear()
+        self._invalid.clear()
+
+    def _count(self, call_type, counter):
+        with self._lock:
+            calls = self._calls.setdefault(call_type, {'hits': 0, 'misses': 0, 'negative_hits': 0, 'stale_hits': 0})
+            calls[counter] += 1
+
+    def stats(self):
+        with self._lock:
+            calls = {call_type: dict(counts) for call_type, counts in self._calls.items()}
+        return {
+            'entries': self._entries.stats(),
+            'invalid_symbols': len(self._invalid),
+            'calls': calls
+        }
+
+provider_cache = ProviderCache()
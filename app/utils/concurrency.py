@@ -0,0 +1,141 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 8
+
+# Provider calls fan_out may have started at once, across all requests. A call
+# abandoned at a deadline keeps its slot until it returns, so a hanging
+# provider cannot hold every pool worker from refresh jobs and revalidations
+FANOUT_MAX_IN_FLIGHT = DEFAULT_MAX_WORKERS - 2
+
+_executor = None
+_executor_lock = threading.Lock()
+_fanout_slots = threading.BoundedSemaphore(FANOUT_MAX_IN_FLIGHT)
+
+def get_executor(max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Shared bounded thread pool for provider I/O
+    Created lazily so importing this module never starts threads
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=max_workers,
+                    thread_name_prefix='provider'
+                )
+    return _executor
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into one execution
+    Every caller asking for a key that is already in flight gets the same Future
+    """
+    def __init__(self, executor=None):
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Return (future, started) where started is False for a joined call"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+
+            executor = self._executor or get_executor()
+            future = executor.submit(fn, *args, **kwargs)
+            self._inflight[key] = future
+
+        future.add_done_callback(lambda f, key=key: self._forget(key, f))
+        return future, True
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._inflight
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+@dataclass
+class FanOutResult:
+    status: str  # 'ok', 'error' or 'timeout'
+    value: object = None
+    error: str = None
+    elapsed: float = None
+
+    @property
+    def ok(self):
+        return self.status == 'ok'
+
+def fan_out(fn, keys, timeout=None, executor=None, single_flight=None):
+    """
+    Run fn(key) for every key concurrently on the shared pool, at most
+    FANOUT_MAX_IN_FLIGHT at a time. Waits at most timeout seconds overall and
+    returns dict key -> FanOutResult in key order; keys still running (or not
+    started) at the deadline are reported as 'timeout' and their results are
+    discarded. With single_flight, keys already in
+    flight are joined instead of run again. Must not be called from a pool
+    worker, nested waits could exhaust the pool
+    """
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return {}
+
+    executor = executor or get_executor()
+    started = time.monotonic()
+    finished_at = {}
+
+    def remaining():
+        return None if timeout is None else max(0.0, started + timeout - time.monotonic())
+
+    def run(key):
+        try:
+            return fn(key)
+        finally:
+            finished_at[key] = time.monotonic() - started
+
+    futures = {}
+    for key in keys:
+        # At most FANOUT_MAX_IN_FLIGHT calls run at once; a key that gets no
+        # slot by the deadline is not started
+        if not _fanout_slots.acquire(timeout=remaining()):
+            continue
+        if single_flight is not None:
+            future, is_new = single_flight.submit(key, run, key)
+        else:
+            future, is_new = executor.submit(run, key), True
+        if is_new:
+            future.add_done_callback(lambda _: _fanout_slots.release())
+        else:
+            # Joined an existing call, which holds no slot of ours
+            _fanout_slots.release()
+        futures[key] = future
+    done, _ = wait(futures.values(), timeout=remaining())
+
+    results = {}
+    for key in keys:
+        future = futures.get(key)
+        if future is None:
+            results[key] = FanOutResult('timeout', error=f"No provider slot free within {timeout}s", elapsed=timeout)
+            logger.warning(f"Fan-out call for {key} not started, {FANOUT_MAX_IN_FLIGHT} calls already in flight")
+        elif future in done:
+            try:
+                results[key] = FanOutResult('ok', value=future.result(), elapsed=finished_at.get(key))
+            except Exception as e:
+                results[key] = FanOutResult('error', error=str(e), elapsed=finished_at.get(key))
+        else:
+            if single_flight is None:
+                # Not started yet: drop it; already running: let it finish unobserved
+                future.cancel()
+            results[key] = FanOutResult('timeout', error=f"No response within {timeout}s", elapsed=timeout)
+            logger.warning(f"Fan-out call for {key} missed the {timeout}s deadline")
+    return results
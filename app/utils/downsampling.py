@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+def _bucket_edges(n, n_buckets):
+    """Start offsets of n_buckets contiguous, near-equal buckets over n points"""
+    return np.linspace(0, n, n_buckets + 1).astype(np.int64)
+
+def lttb_indices(x, y, max_points):
+    """
+    Largest-Triangle-Three-Buckets point selection
+    Keeps the first and last points and, for every bucket in between, the
+    point forming the largest triangle with the previously kept point and
+    the average of the next bucket. Returns the sorted indices to keep
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if max_points is None or max_points >= n or n <= 2:
+        return np.arange(n)
+    max_points = max(int(max_points), 3)
+
+    # Interior points split into max_points - 2 buckets
+    edges = _bucket_edges(n - 2, max_points - 2) + 1
+    starts, ends = edges[:-1], edges[1:]
+
+    # Average of every bucket, computed at once; the last point closes the series
+    counts = ends - starts
+    avg_x = np.add.reduceat(x[1:-1], starts - 1) / counts
+    avg_y = np.add.reduceat(y[1:-1], starts - 1) / counts
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        bx = x[start:end]
+        by = y[start:end]
+        # Twice the triangle area, sign dropped
+        area = np.abs((x[a] - next_x[i]) * (by - y[a]) - (x[a] - bx) * (next_y[i] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return selected
+
+def lttb(x, y, max_points):
+    """Downsample a line series, NaN points are dropped first"""
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    valid = ~np.isnan(y)
+    if not valid.all():
+        x, y = x[valid], y[valid]
+
+    x_numeric = x.astype('datetime64[ns]').astype(np.int64) if np.issubdtype(x.dtype, np.datetime64) else x
+    keep = lttb_indices(x_numeric, y, max_points)
+    return x[keep], y[keep]
+
+def downsample_ohlc(df, max_points, open_col='Open', high_col='High', low_col='Low', close_col='Close', volume_col='Volume'):
+    """
+    Aggregate consecutive bars into at most max_points candles
+    Each bucket keeps the first open, highest high, lowest low, last close and
+    total volume, stamped with the time of its first bar
+    """
+    n = len(df)
+    if max_points is None or max_points >= n:
+        return df
+
+    edges = _bucket_edges(n, int(max_points))
+    starts, ends = edges[:-1], edges[1:]
+
+    data = {
+        open_col: df[open_col].to_numpy()[starts],
+        high_col: np.maximum.reduceat(df[high_col].to_numpy(), starts),
+        low_col: np.minimum.reduceat(df[low_col].to_numpy(), starts),
+        close_col: df[close_col].to_numpy()[ends - 1]
+    }
+    if volume_col in df.columns:
+        data[volume_col] = np.add.reduceat(df[volume_col].to_numpy(), starts)
+
+    return pd.DataFrame(data, index=df.index[starts])
@@ -0,0 +1,361 @@
+import re
+from typing import Callable, List, NamedTuple
+import numpy as np
+from app.utils.indicators import AVAILABLE_INDICATORS
+
+class ExpressionError(ValueError):
+    """Raised for filter expressions that cannot be parsed or type-checked"""
+
+class Term(NamedTuple):
+    """One value per symbol an expression reads, e.g. SMA(200) or volume"""
+    name: str  # close, volume, sma, rsi, macd, macd_signal, macd_hist, bb_upper, bb_lower
+    params: tuple  # Sorted (param, value) pairs
+    label: str  # Canonical spelling, used as the result key
+
+class FilterExpression(NamedTuple):
+    text: str
+    terms: List[Term]  # Distinct terms in order of appearance
+    evaluate: Callable  # evaluate({Term: values}) -> values, vectorized over symbols
+    boolean: bool
+
+FIELDS = ('close', 'volume')
+
+# Longest indicator window an expression may ask for, in daily bars
+MAX_PERIOD = 1000
+
+# Deepest nesting of parentheses, 'not' and unary minus, well inside Python's recursion limit
+MAX_DEPTH = 32
+
+class _Function(NamedTuple):
+    term: str
+    indicator_type: str  # Key of AVAILABLE_INDICATORS the defaults come from
+    indicator: str
+    params: tuple  # Positional parameter order
+
+# Expression functions over the indicators in AVAILABLE_INDICATORS; omitted
+# trailing arguments take that indicator's parameters
+FUNCTIONS = {
+    'SMA': _Function('sma', 'SMA', '20 SMA', ('period',)),
+    'RSI': _Function('rsi', 'RSI', 'RSI', ('period',)),
+    'MACD': _Function('macd', 'MACD', 'MACD', ('fast', 'slow', 'signal')),
+    'MACD_SIGNAL': _Function('macd_signal', 'MACD', 'MACD', ('fast', 'slow', 'signal')),
+    'MACD_HIST': _Function('macd_hist', 'MACD', 'MACD', ('fast', 'slow', 'signal')),
+    'BB_UPPER': _Function('bb_upper', 'Bollinger Bands', 'Bollinger', ('period', 'std')),
+    'BB_LOWER': _Function('bb_lower', 'Bollinger Bands', 'Bollinger', ('period', 'std'))
+}
+
+_TOKEN = re.compile(r'''
+    \s*(?:
+        (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<op><=|>=|==|!=|<|>|[-+*/(),])
+    )''', re.VERBOSE)
+
+_KEYWORDS = ('and', 'or', 'not')
+
+_COMPARISONS = {
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '==': np.equal,
+    '!=': np.not_equal
+}
+
+_ARITHMETIC = {
+    '+': np.add,
+    '-': np.subtract,
+    '*': np.multiply,
+    '/': np.divide
+}
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if not match or match.end() == position:
+            rest = text[position:].lstrip()
+            raise ExpressionError(f"Unexpected character {rest[:1]!r} at position {len(text) - len(rest)}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        start = match.start(kind)
+        if kind == 'name' and value.lower() in _KEYWORDS:
+            kind, value = 'keyword', value.lower()
+        tokens.append((kind, value, start))
+        position = match.end()
+    tokens.append(('end', '', len(text)))
+    return tokens
+
+def _binary(function, left, right):
+    def evaluate(columns):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return function(left(columns), right(columns))
+    return evaluate
+
+# Conditions evaluate to (matches, missing): missing marks symbols whose
+# outcome depends on a NaN value. Such a symbol never matches, and 'not'
+# keeps it unmatched, while 'and'/'or' drop the mark where the other side
+# decides the outcome (three-valued logic, as SQL's NULL)
+
+def _comparison(function, left, right):
+    def evaluate(columns):
+        a, b = left(columns), right(columns)
+        missing = np.isnan(a) | np.isnan(b)
+        with np.errstate(invalid='ignore'):
+            return function(a, b) & ~missing, missing
+    return evaluate
+
+def _conjunction(left, right):
+    def evaluate(columns):
+        (a, a_missing), (b, b_missing) = left(columns), right(columns)
+        false = (~a & ~a_missing) | (~b & ~b_missing)
+        return a & b, (a_missing | b_missing) & ~false
+    return evaluate
+
+def _disjunction(left, right):
+    def evaluate(columns):
+        (a, a_missing), (b, b_missing) = left(columns), right(columns)
+        matches = a | b
+        return matches, (a_missing | b_missing) & ~matches
+    return evaluate
+
+def _negation(operand):
+    def evaluate(columns):
+        matches, missing = operand(columns)
+        return ~matches & ~missing, missing
+    return evaluate
+
+class _Parser:
+    """
+    Recursive descent over the grammar, compiling each rule straight into a
+    closure over numpy operations:
+        expression := conjunction ('or' conjunction)*
+        conjunction := negation ('and' negation)*
+        negation := 'not' negation | comparison
+        comparison := sum (('<' | '<=' | '>' | '>=' | '==' | '!=') sum)*
+        sum := product (('+' | '-') product)*
+        product := unary (('*' | '/') unary)*
+        unary := '-' unary | NUMBER | FIELD | FUNCTION ['(' arguments ')'] | '(' expression ')'
+    Each rule returns (is_boolean, closure); boolean closures return
+    (matches, missing) arrays
+    """
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.index = 0
+        self.depth = 0
+        self.terms = {}
+
+    def peek(self):
+        return self.tokens[self.index]
+
+    def advance(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def expect(self, value):
+        kind, text, position = self.advance()
+        if text != value:
+            raise ExpressionError(f"Expected {value!r} at position {position}, found {text or 'end of expression'!r}")
+
+    def nested(self, rule, position):
+        """rule() one nesting level deeper"""
+        if self.depth >= MAX_DEPTH:
+            raise ExpressionError(f"Expression nested deeper than {MAX_DEPTH} levels at position {position}")
+        self.depth += 1
+        try:
+            return rule()
+        finally:
+            self.depth -= 1
+
+    def error(self, message):
+        raise ExpressionError(f"{message} at position {self.peek()[2]}")
+
+    def numeric(self, rule):
+        position = self.peek()[2]
+        boolean, evaluate = rule()
+        if boolean:
+            raise ExpressionError(f"Expected a number at position {position}, found a condition")
+        return evaluate
+
+    def condition(self, rule):
+        position = self.peek()[2]
+        boolean, evaluate = rule()
+        if not boolean:
+            raise ExpressionError(f"Expected a condition at position {position}, found a number")
+        return evaluate
+
+    def expression(self):
+        boolean, evaluate = self.conjunction()
+        while self.peek()[:2] == ('keyword', 'or'):
+            if not boolean:
+                self.error("Expected a condition before 'or'")
+            self.advance()
+            evaluate = _disjunction(evaluate, self.condition(self.conjunction))
+        return boolean, evaluate
+
+    def conjunction(self):
+        boolean, evaluate = self.negation()
+        while self.peek()[:2] == ('keyword', 'and'):
+            if not boolean:
+                self.error("Expected a condition before 'and'")
+            self.advance()
+            evaluate = _conjunction(evaluate, self.condition(self.negation))
+        return boolean, evaluate
+
+    def negation(self):
+        if self.peek()[:2] == ('keyword', 'not'):
+            position = self.advance()[2]
+            operand = self.nested(lambda: self.condition(self.negation), position)
+            return True, _negation(operand)
+        return self.comparison()
+
+    def comparison(self):
+        boolean, left = self.sum()
+        if self.peek()[1] not in _COMPARISONS or self.peek()[0] != 'op':
+            return boolean, left
+        if boolean:
+            self.error("Expected a number before a comparison")
+        result = None
+        # Chained comparisons, as 30 < RSI() < 70, hold pairwise
+        while self.peek()[0] == 'op' and self.peek()[1] in _COMPARISONS:
+            function = _COMPARISONS[self.advance()[1]]
+            right = self.numeric(self.sum)
+            pair = _comparison(function, left, right)
+            result = pair if result is None else _conjunction(result, pair)
+            left = right
+        return True, result
+
+    def sum(self):
+        boolean, evaluate = self.product()
+        while self.peek()[0] == 'op' and self.peek()[1] in ('+', '-'):
+            if boolean:
+                self.error("Expected a number before an arithmetic operator")
+            function = _ARITHMETIC[self.advance()[1]]
+            evaluate = _binary(function, evaluate, self.numeric(self.product))
+        return boolean, evaluate
+
+    def product(self):
+        boolean, evaluate = self.unary()
+        while self.peek()[0] == 'op' and self.peek()[1] in ('*', '/'):
+            if boolean:
+                self.error("Expected a number before an arithmetic operator")
+            function = _ARITHMETIC[self.advance()[1]]
+            evaluate = _binary(function, evaluate, self.numeric(self.unary))
+        return boolean, evaluate
+
+    def unary(self):
+        kind, text, position = self.advance()
+        if kind == 'op' and text == '-':
+            operand = self.nested(lambda: self.numeric(self.unary), position)
+            return False, lambda columns: np.negative(operand(columns))
+        if kind == 'op' and text == '(':
+            result = self.nested(self.expression, position)
+            self.expect(')')
+            return result
+        if kind == 'number':
+            value = float(text)
+            return False, lambda columns: value
+        if kind == 'name':
+            return False, self.term(text, position)
+        raise ExpressionError(f"Unexpected {text or 'end of expression'!r} at position {position}")
+
+    def arguments(self):
+        """Optional parenthesized arguments: numbers or field names"""
+        if self.peek()[1] != '(':
+            return []
+        self.advance()
+        arguments = []
+        if self.peek()[1] == ')':
+            self.advance()
+            return arguments
+        while True:
+            kind, text, position = self.advance()
+            if kind == 'number':
+                arguments.append(float(text))
+            elif kind == 'name' and text.lower() in FIELDS:
+                arguments.append(text.lower())
+            else:
+                raise ExpressionError(f"Expected a number or field at position {position}, found {text or 'end of expression'!r}")
+            kind, text, position = self.advance()
+            if text == ')':
+                return arguments
+            if text != ',':
+                raise ExpressionError(f"Expected ',' or ')' at position {position}, found {text or 'end of expression'!r}")
+
+    def term(self, name, position):
+        if name.lower() in FIELDS:
+            if self.peek()[1] == '(':
+                self.error(f"Field {name.lower()} takes no arguments")
+            return self.reference(Term(name.lower(), (), name.lower()))
+
+        function = FUNCTIONS.get(name.upper())
+        if function is None:
+            raise ExpressionError(
+                f"Unknown name {name!r} at position {position}; "
+                f"available: {', '.join(list(FIELDS) + list(FUNCTIONS))}"
+            )
+        arguments = self.arguments()
+        source = 'close'
+        if function.term == 'sma' and arguments and isinstance(arguments[0], str):
+            # SMA(volume, 20): average of another field
+            source = arguments.pop(0)
+        if any(isinstance(argument, str) for argument in arguments):
+            raise ExpressionError(f"{name.upper()} takes numeric arguments (position {position})")
+        if len(arguments) > len(function.params):
+            raise ExpressionError(f"{name.upper()} takes at most {len(function.params)} arguments (position {position})")
+
+        params = dict(AVAILABLE_INDICATORS[function.indicator_type][function.indicator].params)
+        params.update(zip(function.params, arguments))
+        params = {
+            param: _deviations(value, name, position) if param == 'std' else _window(value, name, position)
+            for param, value in params.items() if param in function.params
+        }
+        spelled = [f'{value:g}' for value in (params[param] for param in function.params)]
+        if function.term == 'sma':
+            params['source'] = source
+            if source != 'close':
+                spelled.insert(0, source)
+        label = f"{name.upper()}({', '.join(spelled)})"
+        return self.reference(Term(function.term, tuple(sorted(params.items())), label))
+
+    def reference(self, term):
+        term = self.terms.setdefault(term, term)
+        return lambda columns: columns[term]
+
+def _window(value, name, position):
+    if value != int(value) or not 1 <= value <= MAX_PERIOD:
+        raise ExpressionError(
+            f"{name.upper()} periods must be whole numbers from 1 to {MAX_PERIOD} (position {position})"
+        )
+    return int(value)
+
+def _deviations(value, name, position):
+    if not value > 0:
+        raise ExpressionError(f"{name.upper()} standard deviations must be positive (position {position})")
+    return float(value)
+
+def compile_expression(text, boolean=True):
+    """
+    Compile a filter (boolean=True) such as
+        RSI(14) < 30 and close > SMA(200) and volume > 2 * SMA(volume, 20)
+    or a ranking value (boolean=False) such as RSI() or close / SMA(50).
+    The result evaluates against {Term: array of one value per symbol};
+    a comparison with a missing (NaN) value does not match, negated or not
+    """
+    if not text or not text.strip():
+        raise ExpressionError("Expression is empty")
+    parser = _Parser(text)
+    position = parser.peek()[2]
+    is_boolean, evaluate = parser.expression()
+    if parser.peek()[0] != 'end':
+        parser.error(f"Unexpected {parser.peek()[1]!r}")
+    if is_boolean != boolean:
+        expected = 'a condition' if boolean else 'a number'
+        raise ExpressionError(f"Expected {expected} at position {position}")
+    if boolean:
+        condition = evaluate
+        evaluate = lambda columns: condition(columns)[0]
+    return FilterExpression(text.strip(), list(parser.terms), evaluate, boolean)
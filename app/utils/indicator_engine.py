@@ -0,0 +1,343 @@
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Any, NamedTuple
+import numpy as np
+import pandas as pd
+import ta
+from app.utils.kernels import RollingRegression, rolling_linregress, obv, volume_delta, mfi
+from app.utils import rolling
+from app.utils.cache import ArrayCache
+from app.utils.precision import feature_dtype
+from app.services.change_events import HISTORY, change_subscriber
+
+# Engine inputs and the frame columns they are read from, in order of preference
+# (database history uses *_price names, provider history capitalised ones)
+SOURCE_COLUMNS = {
+    'open': ('open_price', 'Open'),
+    'high': ('high_price', 'High'),
+    'low': ('low_price', 'Low'),
+    'close': ('close_price', 'Close'),
+    'volume': ('volume', 'Volume')
+}
+
+class NodeKey(NamedTuple):
+    name: str
+    params: tuple  # Sorted (param, value) pairs
+
+@dataclass
+class NodeSpec:
+    name: str
+    function: Callable  # function(*input values, **params without 'source')
+    inputs: Callable  # inputs(**params) -> list of NodeKey
+    defaults: Dict[str, Any] = field(default_factory=dict)
+    result: Callable = None  # Builds multi-array results from their arrays; None for a Series
+
+NODES: Dict[str, NodeSpec] = {}
+
+def _source_input(source, **params):
+    return [_source_key(source)]
+
+def indicator_node(name, inputs=_source_input, result=None, **defaults):
+    """Register function as the node name; defaults are its parameters"""
+    def register(function):
+        NODES[name] = NodeSpec(name, function, inputs, defaults, result)
+        return function
+    return register
+
+def node(name, **params):
+    """Key of the node name with params, missing params filled from its defaults"""
+    if name in SOURCE_COLUMNS:
+        if params:
+            raise ValueError(f"Input {name} takes no parameters")
+        return NodeKey(name, ())
+    if name not in NODES:
+        raise ValueError(f"Unknown indicator node: {name}")
+    spec = NODES[name]
+    unknown = set(params) - set(spec.defaults)
+    if unknown:
+        raise ValueError(f"Unknown parameters for {name}: {sorted(unknown)}")
+    merged = {**spec.defaults, **params}
+    if 'source' in merged:
+        merged['source'] = _source_key(merged['source'])
+    return NodeKey(name, tuple(sorted(merged.items())))
+
+def _source_key(source):
+    # A source is a node key or the name of an input / parameterless node
+    return source if isinstance(source, NodeKey) else node(source)
+
+# Requested indicator outputs, shared by every engine over the same bars
+indicator_cache = ArrayCache(max_bytes=64 * 1024 * 1024, dtype=feature_dtype())
+
+def _invalidate_indicators(symbol, kind, last_bar_ts=None):
+    # Rewritten bars keep their timestamps, so drop the symbol's outputs outright
+    if kind == HISTORY:
+        indicator_cache.invalidate_where(lambda key: key[0] == symbol)
+
+change_subscriber.register(_invalidate_indicators)
+
+def _timestamp(value):
+    return pd.Timestamp(value).isoformat()
+
+def _read_only(value):
+    if isinstance(value, tuple):
+        return type(value)(*(_read_only(array) for array in value))
+    view = np.asarray(value).view()
+    view.flags.writeable = False
+    return view
+
+class IndicatorEngine:
+    """
+    Computes indicators over one OHLCV frame as a dependency graph
+    Every node is identified by its name and parameters and computed at most
+    once per engine, so indicators asked for by several consumers (and the
+    intermediates they share: differences, returns, rolling means, EMAs)
+    are computed once per request. Results are shared between consumers and
+    must be treated as read-only.
+
+    With a symbol, requested outputs are also read through indicator_cache,
+    keyed by (symbol, resolution, indicator, params, window) where the window
+    is the first and last bar timestamps and the bar count, so other engines
+    over the same bars reuse them until a new bar is stored. Cached outputs
+    come back from feature dtype (FEATURE_DTYPE) storage
+    """
+    def __init__(self, df, symbol=None, resolution='1d', cache=indicator_cache):
+        self.index = df.index
+        self.computed = 0
+        self.cache_hits = 0
+        self._values = {}
+        for name, columns in SOURCE_COLUMNS.items():
+            column = next((column for column in columns if column in df.columns), None)
+            if column is not None:
+                # Copied, so consumers adding or changing frame columns cannot affect results
+                values = np.array(df[column], dtype=np.float64)
+                self._values[NodeKey(name, ())] = pd.Series(values, index=df.index, name=name)
+
+        self.cache = None
+        self._cache_prefix = None
+        self._window = None
+        timestamps = pd.Index(df['date']) if 'date' in df.columns else df.index
+        if symbol and cache is not None and len(df) and pd.api.types.is_datetime64_any_dtype(timestamps):
+            self.cache = cache
+            self._cache_prefix = (symbol.upper(), resolution)
+            self._window = (_timestamp(timestamps[0]), _timestamp(timestamps[-1]), len(df))
+
+    def plan(self, keys):
+        """Keys still to compute for keys, dependencies first"""
+        order = []
+        seen = set(self._values)
+        stack = [(key, False) for key in reversed(list(keys))]
+        while stack:
+            key, expanded = stack.pop()
+            if expanded:
+                order.append(key)
+                continue
+            if key in seen:
+                continue
+            seen.add(key)
+            if key.name in SOURCE_COLUMNS:
+                raise KeyError(f"Frame has no {key.name} column")
+            stack.append((key, True))
+            params = dict(key.params)
+            for dependency in reversed(NODES[key.name].inputs(**params)):
+                if dependency not in seen:
+                    stack.append((dependency, False))
+        return order
+
+    def compute(self, requests):
+        """
+        requests maps labels to node keys; every missing node of the combined
+        graph is computed once, then {label: value} is returned
+        """
+        requested = set(requests.values())
+        if self.cache is not None:
+            # Cached outputs need none of their dependencies
+            for key in requested - set(self._values):
+                arrays = self.cache.get(self._cache_key(key))
+                if arrays is not None:
+                    self._values[key] = self._unpack(key, arrays)
+                    self.cache_hits += 1
+
+        for key in self.plan(requested):
+            params = dict(key.params)
+            spec = NODES[key.name]
+            inputs = [self._values[dependency] for dependency in spec.inputs(**params)]
+            params.pop('source', None)
+            self._values[key] = spec.function(*inputs, **params)
+            self.computed += 1
+            if self.cache is not None and key in requested:
+                self.cache.set(self._cache_key(key), self._pack(key, self._values[key]))
+        return {label: self._values[key] for label, key in requests.items()}
+
+    def get(self, name, **params):
+        key = node(name, **params)
+        return self.compute({key: key})[key]
+
+    def arrays(self, requests):
+        """compute(), each value as a read-only NumPy view of the engine's result (no copy)"""
+        return {label: _read_only(value) for label, value in self.compute(requests).items()}
+
+    def _cache_key(self, key):
+        return self._cache_prefix + (key.name, key.params) + self._window
+
+    @staticmethod
+    def _pack(key, value):
+        return tuple(value) if NODES[key.name].result else (np.asarray(value, dtype=np.float64),)
+
+    def _unpack(self, key, arrays):
+        result = NODES[key.name].result
+        if result:
+            return result(*(array.astype(np.float64) for array in arrays))
+        return pd.Series(arrays[0].astype(np.float64), index=self.index)
+
+# Price transforms
+
+@indicator_node('diff', source='close', periods=1)
+def _diff(values, periods):
+    return values.diff(periods)
+
+@indicator_node('returns', source='close')
+def _returns(values):
+    return values.pct_change()
+
+@indicator_node('observations', source='close')
+def _observations(values):
+    """Non-missing values so far, for EMA warm-up"""
+    return values.notna().cumsum()
+
+@indicator_node(
+    'gain',
+    inputs=lambda source: [node('diff', source=source)],
+    source='close'
+)
+def _gain(change):
+    return change.where(change > 0, 0.0)
+
+@indicator_node(
+    'loss',
+    inputs=lambda source: [node('diff', source=source)],
+    source='close'
+)
+def _loss(change):
+    return -change.where(change < 0, 0.0)
+
+# Moving averages and dispersion
+
+@indicator_node('sma', source='close', period=20, min_periods=None)
+def _sma(values, period, min_periods):
+    return pd.Series(rolling.rolling_mean(values.to_numpy(), period, min_periods), index=values.index)
+
+@indicator_node('rolling_std', source='close', period=20, ddof=1)
+def _rolling_std(values, period, ddof):
+    return pd.Series(rolling.rolling_std(values.to_numpy(), period, ddof=ddof), index=values.index)
+
+def _ema_inputs(source, span, alpha, adjust, min_periods):
+    if min_periods == 0:
+        return [_source_key(source)]
+    # Warm-up only masks leading values, so the unmasked EMA is shared
+    return [
+        node('ema', source=source, span=span, alpha=alpha, adjust=adjust),
+        node('observations', source=source)
+    ]
+
+@indicator_node('ema', inputs=_ema_inputs, source='close', span=None, alpha=None, adjust=False, min_periods=0)
+def _ema(values, observations=None, span=None, alpha=None, adjust=False, min_periods=0):
+    if observations is not None:
+        return values.where(observations >= min_periods)
+    return pd.Series(rolling.ewm_mean(values.to_numpy(), span, alpha, adjust), index=values.index)
+
+def _band_inputs(source, period, std, ddof):
+    return [
+        node('sma', source=source, period=period),
+        node('rolling_std', source=source, period=period, ddof=ddof)
+    ]
+
+@indicator_node('bollinger_upper', inputs=_band_inputs, source='close', period=20, std=2, ddof=1)
+def _bollinger_upper(middle, deviation, period, std, ddof):
+    return middle + deviation * std
+
+@indicator_node('bollinger_lower', inputs=_band_inputs, source='close', period=20, std=2, ddof=1)
+def _bollinger_lower(middle, deviation, period, std, ddof):
+    return middle - deviation * std
+
+# Momentum
+
+def _rsi_inputs(source, period, smoothing):
+    if smoothing == 'sma':
+        return [
+            node('sma', source=node('gain', source=source), period=period),
+            node('sma', source=node('loss', source=source), period=period)
+        ]
+    # Wilder smoothing, as the ta library
+    return [
+        node('ema', source=node('gain', source=source), alpha=1 / period, min_periods=period),
+        node('ema', source=node('loss', source=source), alpha=1 / period, min_periods=period)
+    ]
+
+@indicator_node('rsi', inputs=_rsi_inputs, source='close', period=14, smoothing='sma')
+def _rsi(average_gain, average_loss, period, smoothing):
+    rs = average_gain / average_loss
+    if smoothing == 'sma':
+        return 100 - (100 / (1 + rs))
+    return pd.Series(np.where(average_loss == 0, 100, 100 - (100 / (1 + rs))), index=rs.index)
+
+def _macd_inputs(source, fast, slow):
+    return [node('ema', source=source, span=fast), node('ema', source=source, span=slow)]
+
+@indicator_node('macd', inputs=_macd_inputs, source='close', fast=12, slow=26)
+def _macd(fast_ema, slow_ema, fast, slow):
+    return fast_ema - slow_ema
+
+@indicator_node(
+    'macd_signal',
+    inputs=lambda source, fast, slow, signal: [
+        node('ema', source=node('macd', source=source, fast=fast, slow=slow), span=signal)
+    ],
+    source='close', fast=12, slow=26, signal=9
+)
+def _macd_signal(signal_line, fast, slow, signal):
+    return signal_line
+
+@indicator_node(
+    'macd_hist',
+    inputs=lambda source, fast, slow, signal: [
+        node('macd', source=source, fast=fast, slow=slow),
+        node('macd_signal', source=source, fast=fast, slow=slow, signal=signal)
+    ],
+    source='close', fast=12, slow=26, signal=9
+)
+def _macd_hist(macd_line, signal_line, fast, slow, signal):
+    return macd_line - signal_line
+
+@indicator_node('momentum', source='close', period=10)
+def _momentum(values, period):
+    return values.diff(period)
+
+@indicator_node('roc', source='close', period=10)
+def _roc(values, period):
+    previous = values.shift(period)
+    return (values - previous) / previous * 100
+
+@indicator_node('linregress', result=RollingRegression, source='close', period=30)
+def _linregress(values, period):
+    return rolling_linregress(values.to_numpy(), period)
+
+# Volume and range
+
+@indicator_node('obv', inputs=lambda: [node('close'), node('volume')])
+def _obv(close, volume):
+    return pd.Series(obv(close.to_numpy(), volume.to_numpy()), index=close.index)
+
+@indicator_node('volume_delta', inputs=lambda: [node('open'), node('close'), node('volume')])
+def _volume_delta(open_, close, volume):
+    return pd.Series(volume_delta(open_.to_numpy(), close.to_numpy(), volume.to_numpy()), index=close.index)
+
+def _hlcv_inputs(period):
+    return [node('high'), node('low'), node('close'), node('volume')]
+
+@indicator_node('mfi', inputs=_hlcv_inputs, period=14)
+def _mfi(high, low, close, volume, period):
+    values = mfi(high.to_numpy(), low.to_numpy(), close.to_numpy(), volume.to_numpy(), period)
+    return pd.Series(values, index=close.index)
+
+@indicator_node('adx', inputs=lambda period: [node('high'), node('low'), node('close')], period=14)
+def _adx(high, low, close, period):
+    return ta.trend.adx(high, low, close, window=period)
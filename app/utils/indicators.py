@@ -1,7 +1,8 @@
 from dataclasses import dataclass
-from typing import Callable, Dict, Any
+from typing import Callable, Dict, Any, Optional
 import pandas as pd
 import numpy as np
+from app.utils.indicator_engine import IndicatorEngine, node
 
 @dataclass
 class Indicator:
@@ -10,39 +11,42 @@ class Indicator:
     params: Dict[str, Any]
     color: str
     visible: bool = True
+    lookback: int = 0  # Bars of history needed before the first valid value
     
 class TechnicalIndicators:
+    """
+    Chart indicators over a frame with a 'Close' column
+    Pass the same engine for every indicator of one chart to share intermediates
+    """
     @staticmethod
-    def calculate_sma(data: pd.DataFrame, period: int) -> pd.Series:
-        return data['Close'].rolling(window=period).mean()
+    def calculate_sma(data: pd.DataFrame, period: int, engine: Optional[IndicatorEngine] = None) -> pd.Series:
+        return (engine or IndicatorEngine(data)).get('sma', period=period)
     
     @staticmethod
-    def calculate_ema(data: pd.DataFrame, period: int) -> pd.Series:
-        return data['Close'].ewm(span=period, adjust=False).mean()
+    def calculate_ema(data: pd.DataFrame, period: int, engine: Optional[IndicatorEngine] = None) -> pd.Series:
+        return (engine or IndicatorEngine(data)).get('ema', span=period)
     
     @staticmethod
-    def calculate_bollinger_bands(data: pd.DataFrame, period: int = 20, std: int = 2):
-        middle_band = data['Close'].rolling(window=period).mean()
-        std_dev = data['Close'].rolling(window=period).std()
-        upper_band = middle_band + (std_dev * std)
-        lower_band = middle_band - (std_dev * std)
-        return upper_band, middle_band, lower_band
+    def calculate_bollinger_bands(data: pd.DataFrame, period: int = 20, std: int = 2, engine: Optional[IndicatorEngine] = None):
+        bands = (engine or IndicatorEngine(data)).compute({
+            'upper': node('bollinger_upper', period=period, std=std),
+            'middle': node('sma', period=period),
+            'lower': node('bollinger_lower', period=period, std=std)
+        })
+        return bands['upper'], bands['middle'], bands['lower']
     
     @staticmethod
-    def calculate_rsi(data: pd.DataFrame, period: int = 14) -> pd.Series:
-        delta = data['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-        rs = gain / loss
-        return 100 - (100 / (1 + rs))
+    def calculate_rsi(data: pd.DataFrame, period: int = 14, engine: Optional[IndicatorEngine] = None) -> pd.Series:
+        return (engine or IndicatorEngine(data)).get('rsi', period=period)
     
     @staticmethod
-    def calculate_macd(data: pd.DataFrame, fast: int = 12, slow: int = 26, signal: int = 9):
-        exp1 = data['Close'].ewm(span=fast, adjust=False).mean()
-        exp2 = data['Close'].ewm(span=slow, adjust=False).mean()
-        macd = exp1 - exp2
-        signal_line = macd.ewm(span=signal, adjust=False).mean()
-        return macd, signal_line
+    def calculate_macd(data: pd.DataFrame, fast: int = 12, slow: int = 26, signal: int = 9,
+                       engine: Optional[IndicatorEngine] = None):
+        macd = (engine or IndicatorEngine(data)).compute({
+            'line': node('macd', fast=fast, slow=slow),
+            'signal': node('macd_signal', fast=fast, slow=slow, signal=signal)
+        })
+        return macd['line'], macd['signal']
 
 AVAILABLE_INDICATORS = {
     'SMA': {
@@ -51,21 +55,24 @@ AVAILABLE_INDICATORS = {
             function=TechnicalIndicators.calculate_sma,
             params={'period': 20},
             color='#2196F3',
-            visible=True
+            visible=True,
+            lookback=19
         ),
         '50 SMA': Indicator(
             name='50 SMA',
             function=TechnicalIndicators.calculate_sma,
             params={'period': 50},
             color='#FFA726',
-            visible=True
+            visible=True,
+            lookback=49
         ),
         '100 SMA': Indicator(
             name='100 SMA',
             function=TechnicalIndicators.calculate_sma,
             params={'period': 100},
             color='#EF5350',
-            visible=True
+            visible=True,
+            lookback=99
         )
     },
     'Bollinger Bands': {
@@ -74,7 +81,8 @@ AVAILABLE_INDICATORS = {
             function=TechnicalIndicators.calculate_bollinger_bands,
             params={'period': 20, 'std': 2},
             color='#4CAF50',
-            visible=True
+            visible=True,
+            lookback=19
         )
     },
     'RSI': {
@@ -83,7 +91,8 @@ AVAILABLE_INDICATORS = {
             function=TechnicalIndicators.calculate_rsi,
             params={'period': 14},
             color='#9C27B0',
-            visible=True
+            visible=True,
+            lookback=14
         )
     },
     'MACD': {
@@ -92,7 +101,8 @@ AVAILABLE_INDICATORS = {
             function=TechnicalIndicators.calculate_macd,
             params={'fast': 12, 'slow': 26, 'signal': 9},
             color='#FF5722',
-            visible=True
+            visible=True,
+            lookback=33
         )
     }
 } 
\ No newline at end of file
@@ -0,0 +1,160 @@
+from typing import NamedTuple
+import numpy as np
+from app.utils.rolling import rolling_sum
+
+class RollingRegression(NamedTuple):
+    slope: np.ndarray
+    intercept: np.ndarray
+    r2: np.ndarray
+    endpoint: np.ndarray  # Fitted value at the last bar of each window
+
+def _blocked(values, period, n_blocks):
+    """Pad axis 0 to n_blocks * period rows and view it as (n_blocks, period, ...)"""
+    pad = n_blocks * period - values.shape[0]
+    if pad:
+        values = np.concatenate([values, np.zeros((pad,) + values.shape[1:])])
+    return values.reshape((n_blocks, period) + values.shape[1:])
+
+def _prefix_suffix(blocks):
+    """Running sums from each block's start (prefix) and to each block's end (suffix), flattened"""
+    prefix = np.cumsum(blocks, axis=1)
+    suffix = np.cumsum(blocks[:, ::-1], axis=1)[:, ::-1]
+    shape = (-1,) + blocks.shape[2:]
+    return prefix.reshape(shape), suffix.reshape(shape)
+
+def rolling_linregress(y, period):
+    """
+    Least-squares line through every trailing window of period bars
+    x is 0..period-1 within each window, as when fitting each window separately.
+    y is 1D (bars) or 2D (bars x symbols); all windows of all columns are
+    solved at once from window sums of y, x*y and y^2. Sums are built from
+    prefix/suffix sums inside blocks of period bars, each block shifted by
+    its own mean, so rounding stays at the scale of one window however long
+    the series. Windows containing NaN give NaN. R^2 follows scikit-learn's
+    score(): a flat window that the line fits exactly scores 1.0
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = y.shape[0]
+    if period < 2:
+        raise ValueError("period must be at least 2")
+    result_shape = y.shape
+    if n < period:
+        return RollingRegression(*(np.full(result_shape, np.nan) for _ in range(4)))
+
+    n_blocks = -(-n // period)
+    missing = np.isnan(y)
+    blocks = _blocked(np.where(missing, 0.0, y), period, n_blocks)
+    counts = _blocked((~missing).astype(np.float64), period, n_blocks)
+
+    # Per-block shift: the block mean (0 for empty blocks)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offsets = blocks.sum(axis=1) / counts.sum(axis=1)
+    offsets = np.where(np.isfinite(offsets), offsets, 0.0)
+    z = np.where(counts > 0, blocks - offsets[:, None], 0.0)
+
+    local = np.arange(period, dtype=np.float64).reshape((1, period) + (1,) * (y.ndim - 1))
+    pre_z, suf_z = _prefix_suffix(z)
+    pre_zz, suf_zz = _prefix_suffix(z * z)
+    pre_lz, suf_lz = _prefix_suffix(local * z)
+    pre_n, suf_n = _prefix_suffix(counts)
+
+    # Window [s, t]: either exactly block k (r == 0) or the tail of block k from
+    # local index r plus the first r bars of block k + 1
+    t = np.arange(period - 1, n)
+    s = t - period + 1
+    k = s // period
+    r = (s % period).astype(np.float64)
+    expand = (slice(None),) + (None,) * (y.ndim - 1)
+    r = r[expand]
+    whole = r == 0
+
+    base = offsets[k]
+    shift = np.where(whole, 0.0, offsets[np.minimum(k + 1, n_blocks - 1)] - base)
+
+    # Sums of (y - base) over the window and of x * (y - base), x = i - s
+    head_z = pre_z[t]
+    s_y = np.where(whole, head_z, suf_z[s] + head_z + r * shift)
+    s_yy = np.where(
+        whole,
+        pre_zz[t],
+        suf_zz[s] + pre_zz[t] + 2 * shift * head_z + r * shift * shift
+    )
+    s_xy = np.where(
+        whole,
+        pre_lz[t],
+        (suf_lz[s] - r * suf_z[s]) +
+        (pre_lz[t] + (period - r) * head_z + shift * (r * (r - 1) / 2 + (period - r) * r))
+    )
+    present = np.where(whole, pre_n[t], suf_n[s] + pre_n[t])
+
+    s_x = period * (period - 1) / 2
+    sxx = period * (period * period - 1) / 12  # Centered sum of squares of x
+
+    cov = s_xy - s_x * s_y / period
+    slope = cov / sxx
+    intercept = (s_y - slope * s_x) / period + base
+    ss_tot = np.maximum(s_yy - s_y * s_y / period, 0.0)
+    ss_res = np.maximum(ss_tot - slope * cov, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = np.where(ss_tot > 0, 1 - ss_res / ss_tot, 1.0)
+    # Rounding noise on a flat window is a perfect fit, not a poor one
+    r2 = np.where(ss_tot <= 1e-24 * np.maximum(s_yy, 1.0), 1.0, r2)
+
+    complete = present == period
+    out = []
+    for values in (slope, intercept, r2, intercept + slope * (period - 1)):
+        full = np.full(result_shape, np.nan)
+        full[period - 1:] = np.where(complete, values, np.nan)
+        out.append(full)
+    return RollingRegression(*out)
+
+# Volume-flow kernels
+# Inputs are 1D (bars) or 2D (bars x symbols) arrays; results keep the input shape
+
+def _bar_change(values):
+    """Change from the previous bar, 0 on the first bar"""
+    return np.diff(values, axis=0, prepend=values[:1])
+
+def _signed(change, volume):
+    """volume where change > 0, -volume where it is < 0, 0 on flat or missing changes"""
+    direction = np.sign(np.where(np.isnan(change), 0.0, change))
+    return np.where(direction == 0, 0.0, direction * volume)
+
+def signed_volume(close, volume):
+    """Volume signed by the close-to-close move; the first bar has no move and gives 0"""
+    change = _bar_change(np.asarray(close, dtype=np.float64))
+    return _signed(change, np.asarray(volume, dtype=np.float64))
+
+def obv(close, volume):
+    """On-Balance Volume: running total of signed_volume, starting at 0"""
+    # Accumulated in float64 whatever the inputs: a float32 running total of
+    # volumes loses whole shares once it passes 2**24
+    return np.cumsum(signed_volume(close, volume), axis=0, dtype=np.float64)
+
+def volume_delta(open_, close, volume):
+    """Volume signed by the bar's own open-to-close move (buying vs selling pressure)"""
+    change = np.asarray(close, dtype=np.float64) - np.asarray(open_, dtype=np.float64)
+    return _signed(change, np.asarray(volume, dtype=np.float64))
+
+def cumulative_delta(open_, close, volume):
+    """Running total of volume_delta"""
+    return np.cumsum(volume_delta(open_, close, volume), axis=0, dtype=np.float64)
+
+def mfi(high, low, close, volume, period=14):
+    """
+    Money Flow Index over period bars, as ta.volume.money_flow_index
+    Money flow is typical price x volume, positive on bars where the typical
+    price rose and negative where it fell. Windows containing NaN give NaN
+    """
+    typical = (
+        np.asarray(high, dtype=np.float64) +
+        np.asarray(low, dtype=np.float64) +
+        np.asarray(close, dtype=np.float64)
+    ) / 3.0
+    money = typical * np.asarray(volume, dtype=np.float64)
+    flow = np.where(np.isnan(money), np.nan, _signed(_bar_change(typical), money))
+
+    positive = rolling_sum(np.maximum(flow, 0.0), period)
+    negative = -rolling_sum(np.minimum(flow, 0.0), period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 - 100 / (1 + positive / negative)
@@ -0,0 +1,161 @@
+import yfinance as yf
+import pandas as pd
+import requests
+import logging
+from app.utils.cache import provider_cache, InvalidSymbolError
+from app.utils.resilience import CircuitBreaker, ProviderUnavailableError, call_with_deadline
+from app.services.change_events import QUOTE, change_subscriber
+
+logger = logging.getLogger(__name__)
+
+# One breaker for every Yahoo endpoint, they fail together during an incident
+yahoo_breaker = CircuitBreaker('yahoo', failure_threshold=5, reset_timeout=30)
+
+def _invalidate_responses(symbol, kind, last_bar_ts=None):
+    if kind == QUOTE:
+        # Bars are unchanged, only info/quote responses are outdated
+        provider_cache.invalidate_symbol(symbol, call_types=('info', 'quote'))
+    else:
+        provider_cache.invalidate_symbol(symbol)
+
+change_subscriber.register(_invalidate_responses)
+
+YAHOO_SEARCH_URL = "https://query2.finance.yahoo.com/v1/finance/search"
+
+def _info_is_invalid(info):
+    # yfinance returns a near-empty dict instead of raising for unknown symbols
+    return not info or not (
+        info.get('regularMarketPrice') or info.get('currentPrice') or
+        info.get('longName') or info.get('shortName')
+    )
+
+def get_ticker_info(symbol, max_age=None):
+    """Cached yfinance Ticker.info, raises InvalidSymbolError for unknown symbols"""
+    return provider_cache.get_or_fetch(
+        'info', symbol,
+        lambda: call_with_deadline(lambda: yf.Ticker(symbol).info, yahoo_breaker),
+        max_age=max_age,
+        is_invalid=_info_is_invalid
+    )
+
+def get_history(symbol, max_age=None, **params):
+    """
+    Cached yfinance Ticker.history
+    An empty frame is not proof the symbol is unknown (a transient error, a
+    window without bars, period='1d' outside trading hours), so it is cached
+    briefly and returned rather than marking the symbol invalid
+    """
+    hist = provider_cache.get_or_fetch(
+        'history', symbol,
+        lambda: call_with_deadline(lambda: yf.Ticker(symbol).history(**params), yahoo_breaker),
+        params=params,
+        max_age=max_age,
+        is_empty=lambda hist: hist is None or hist.empty
+    )
+    if hist is None:
+        return pd.DataFrame()
+    # Callers reshape the frame, keep the cached copy untouched
+    return hist.copy()
+
+def search_symbols(query):
+    """Cached Yahoo Finance symbol search, returns the raw quote list"""
+    def fetch():
+        params = {
+            'q': query,
+            'quotesCount': 10,
+            'newsCount': 0,
+            'enableFuzzyQuery': True,
+            'quotesQueryId': 'tss_match_phrase_query'
+        }
+        headers = {'User-Agent': 'Mozilla/5.0'}
+        # Connect and read timeouts, the deadline wrapper bounds the total
+        response = requests.get(YAHOO_SEARCH_URL, params=params, headers=headers, timeout=(3, 5))
+        response.raise_for_status()
+        return response.json().get('quotes', [])
+
+    return provider_cache.get_or_fetch(
+        'search', None,
+        lambda: call_with_deadline(fetch, yahoo_breaker),
+        params={'q': query.lower()}
+    )
+
+def _download_quotes(symbols):
+    """Latest daily bar of several symbols from one yfinance call"""
+    # A 5 day window guarantees at least one complete bar over weekends and holidays
+    hist = call_with_deadline(lambda: yf.download(
+        tickers=symbols,
+        period='5d',
+        interval='1d',
+        group_by='ticker',
+        auto_adjust=True,
+        actions=False,
+        progress=False,
+        threads=True
+    ), yahoo_breaker)
+
+    if hist is None or hist.empty:
+        return {}
+
+    quotes = {}
+    for symbol in symbols:
+        try:
+            if isinstance(hist.columns, pd.MultiIndex):
+                if symbol not in hist.columns.get_level_values(0):
+                    continue
+                bars = hist[symbol]
+            else:
+                # Older yfinance versions return flat columns for a single ticker
+                bars = hist
+
+            bars = bars.dropna(subset=['Close'])
+            if bars.empty:
+                continue
+
+            last = bars.iloc[-1]
+            quotes[symbol] = {
+                'price': float(last['Close']),
+                'volume': int(last['Volume']) if pd.notna(last['Volume']) else 0,
+                'date': bars.index[-1].to_pydatetime().replace(tzinfo=None)
+            }
+        except Exception as e:
+            logger.error(f"Error reading quote for {symbol}: {str(e)}")
+            continue
+    return quotes
+
+def download_latest_quotes(symbols):
+    """
+    Latest daily bar for several symbols, through the provider cache's 'quote'
+    entries: cached quotes are served as they are and every miss is fetched in
+    one yfinance call
+    Returns dict symbol -> {'price', 'volume', 'date'} for the symbols that resolved
+    """
+    symbols = [symbol for symbol in dict.fromkeys(symbols) if not provider_cache.is_invalid(symbol)]
+    misses = [symbol for symbol in symbols if provider_cache.peek('quote', symbol) is None]
+
+    fetched = {}
+    error = None
+    if misses:
+        try:
+            fetched = _download_quotes(misses)
+        except Exception as e:
+            error = e
+            logger.warning(f"Batch quote download failed for {len(misses)} symbols: {str(e)}")
+
+    def fetch(symbol):
+        if symbol in fetched:
+            return fetched[symbol]
+        # A symbol missing from a batch answer may be throttled, partially
+        # failed or unparsable; only a single-symbol info lookup
+        # (get_ticker_info) marks a symbol unknown
+        raise error or LookupError(f"No quote for {symbol}")
+
+    quotes = {}
+    for symbol in symbols:
+        if symbol in misses and symbol not in fetched:
+            # Unanswered: callers fall back to their own last known price, marked stale
+            continue
+        try:
+            quotes[symbol] = provider_cache.get_or_fetch('quote', symbol, lambda symbol=symbol: fetch(symbol))
+        except Exception:
+            continue
+    return quotes
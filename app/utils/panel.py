@@ -0,0 +1,184 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List
+import math
+import numpy as np
+import pandas as pd
+from app.database import db
+from app.database.models import Stock, StockHistory
+from app.utils.kernels import obv
+from app.utils import rolling
+from app.utils.precision import feature_dtype
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+@dataclass
+class SymbolPanel:
+    """
+    Daily bars of many symbols aligned on one calendar
+    Every field is a (n_symbols, n_bars) array in the feature dtype, NaN where
+    a symbol has no bar on a calendar day (not yet listed, missing data)
+    """
+    symbols: List[str]
+    stock_ids: List[int]
+    dates: pd.DatetimeIndex
+    fields: Dict[str, np.ndarray]
+
+    @property
+    def open(self):
+        return self.fields['open']
+
+    @property
+    def high(self):
+        return self.fields['high']
+
+    @property
+    def low(self):
+        return self.fields['low']
+
+    @property
+    def close(self):
+        return self.fields['close']
+
+    @property
+    def volume(self):
+        return self.fields['volume']
+
+    @property
+    def shape(self):
+        return len(self.symbols), len(self.dates)
+
+    def _last_bar(self):
+        """Column of each symbol's last bar with a close, and whether it has one"""
+        present = ~np.isnan(self.close)
+        return self.shape[1] - 1 - np.argmax(present[:, ::-1], axis=1), present.any(axis=1)
+
+    def last_valid(self, values):
+        """Each symbol's value at its own last bar with a close"""
+        last, listed = self._last_bar()
+        result = values[np.arange(len(self.symbols)), last]
+        result[~listed] = np.nan
+        return result
+
+    def last_dates(self):
+        """Each symbol's last day with a close, None when it has none"""
+        last, listed = self._last_bar()
+        return [self.dates[column].date() if has_bar else None for column, has_bar in zip(last, listed)]
+
+    def packed(self):
+        """
+        Copy with each symbol's bars moved to the end of its row, in order,
+        so days a symbol has no bar on do not break its rolling windows
+        (as indicators over that symbol's own history). Columns no longer
+        share a date; dates is kept for the last column only
+        """
+        order = np.argsort(~np.isnan(self.close), axis=1, kind='stable')
+        fields = {name: np.take_along_axis(values, order, axis=1) for name, values in self.fields.items()}
+        return SymbolPanel(self.symbols, self.stock_ids, self.dates, fields)
+
+def _daily_frame(rows):
+    """stock_history rows to one OHLCV row per stock and day, as _stored_daily_bars"""
+    df = pd.DataFrame(rows, columns=['stock_id', 'date', 'open', 'high', 'low', 'close', 'volume'])
+    df['day'] = pd.to_datetime(df['date']).dt.normalize()
+    daily = df.sort_values('date').groupby(['stock_id', 'day']).agg({
+        'open': 'first',
+        'high': 'max',
+        'low': 'min',
+        'close': 'last',
+        'volume': 'max'
+    })
+    # Rows saved by quote refreshes only carry a close
+    daily['open'] = daily['open'].fillna(daily['close'])
+    daily['high'] = daily['high'].fillna(daily[['open', 'close']].max(axis=1))
+    daily['low'] = daily['low'].fillna(daily[['open', 'close']].min(axis=1))
+    return daily.dropna(subset=['close'])
+
+def load_daily_panel(stocks, bars):
+    """Panel of the last `bars` trading days of stocks (Stock rows) from stock_history"""
+    stock_ids = [stock.id for stock in stocks]
+    calendar_days = math.ceil(bars * 7 / 5) + 10
+    rows = (
+        db.session.query(
+            StockHistory.stock_id, StockHistory.date, StockHistory.open_price, StockHistory.high_price,
+            StockHistory.low_price, StockHistory.close_price, StockHistory.volume
+        )
+        .filter(
+            StockHistory.stock_id.in_(stock_ids),
+            StockHistory.date >= datetime.now() - timedelta(days=calendar_days)
+        )
+        .all()
+    )
+
+    daily = _daily_frame(rows) if rows else None
+    dates = pd.DatetimeIndex([]) if daily is None else daily.index.get_level_values('day').unique().sort_values()[-bars:]
+    fields = {}
+    for field in FIELDS:
+        if daily is None:
+            fields[field] = np.full((len(stock_ids), 0), np.nan, dtype=feature_dtype())
+            continue
+        wide = daily[field].unstack('day').reindex(index=stock_ids, columns=dates)
+        fields[field] = wide.to_numpy(dtype=feature_dtype())
+    return SymbolPanel([stock.symbol for stock in stocks], stock_ids, dates, fields)
+
+def iter_daily_panels(bars, chunk_size=500, stocks=None):
+    """
+    Panels over the stock universe (or stocks) in chunks of chunk_size
+    symbols, so memory stays at chunk_size x bars per field
+    """
+    stocks = stocks if stocks is not None else Stock.query.order_by(Stock.id).all()
+    for start in range(0, len(stocks), chunk_size):
+        yield load_daily_panel(stocks[start:start + chunk_size], bars)
+
+# Batch indicators: values is (n_symbols, n_bars) or (n_bars,), computed along the last
+# axis with the rolling kernels (which run along axis 0 of the transposed view).
+# Inputs of any float dtype are computed in float64
+
+def rolling_mean(values, period):
+    """Mean of every trailing window; a window containing NaN gives NaN, as pandas"""
+    return rolling.rolling_mean(np.asarray(values, dtype=np.float64).T, period).T
+
+def rolling_std(values, period, ddof=1):
+    return rolling.rolling_std(np.asarray(values, dtype=np.float64).T, period, ddof=ddof).T
+
+def ema(values, span=None, alpha=None, min_periods=0):
+    """EMA as pandas ewm(adjust=False), each series starting at its first value"""
+    values = np.asarray(values, dtype=np.float64)
+    return rolling.ewm_mean(values.T, span, alpha, adjust=False, min_periods=min_periods).T
+
+def rsi(close, period=14, smoothing='sma'):
+    """RSI from simple averages of gains and losses, or Wilder smoothing (smoothing='wilder')"""
+    close = np.asarray(close, dtype=np.float64)
+    change = np.full(close.shape, np.nan)
+    change[..., 1:] = close[..., 1:] - close[..., :-1]
+    # As pandas diff().where(), a series' first change counts as 0; bars without a close stay missing
+    missing = np.isnan(close)
+    gain = np.where(missing, np.nan, np.where(change > 0, change, 0.0))
+    loss = np.where(missing, np.nan, np.where(change < 0, -change, 0.0))
+    if smoothing == 'wilder':
+        average_gain = rolling.wilder(gain.T, period).T
+        average_loss = rolling.wilder(loss.T, period).T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = 100 - 100 / (1 + average_gain / average_loss)
+        return np.where(average_loss == 0, 100.0, values)
+    average_gain = rolling_mean(gain, period)
+    average_loss = rolling_mean(loss, period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 - 100 / (1 + average_gain / average_loss)
+
+def macd(close, fast=12, slow=26, signal=9):
+    """MACD line, signal line and histogram"""
+    line = ema(close, span=fast) - ema(close, span=slow)
+    signal_line = ema(line, span=signal)
+    return line, signal_line, line - signal_line
+
+def bollinger(close, period=20, std=2, ddof=1):
+    """Upper, middle and lower band"""
+    middle = rolling_mean(close, period)
+    deviation = rolling_std(close, period, ddof)
+    return middle + deviation * std, middle, middle - deviation * std
+
+def on_balance_volume(close, volume):
+    """OBV per series; a bar next to a missing one adds nothing"""
+    close = np.asarray(close, dtype=np.float64)
+    # The volume-flow kernels run along axis 0
+    return obv(close.T, np.nan_to_num(np.asarray(volume, dtype=np.float64)).T).T
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+from flask import current_app, has_app_context
+from app.config import Config
+
+# Storage dtype policy for analysis data: feature matrices, indicator columns,
+# symbol panels and cached indicator outputs are kept in FEATURE_DTYPE.
+# Computation is not affected: the kernels upcast their inputs to float64, so
+# running sums (OBV, rolling windows, regressions, EMAs) never accumulate in
+# float32 and only their stored results are narrowed
+FEATURE_DTYPES = {'float32': np.float32, 'float64': np.float64}
+
+def feature_dtype():
+    """Configured storage dtype, from the app config or Config outside an app context"""
+    name = current_app.config.get('FEATURE_DTYPE', Config.FEATURE_DTYPE) if has_app_context() else Config.FEATURE_DTYPE
+    if name not in FEATURE_DTYPES:
+        raise ValueError(f"FEATURE_DTYPE must be one of {sorted(FEATURE_DTYPES)}, not {name!r}")
+    return FEATURE_DTYPES[name]
+
+def compact(values):
+    """values (Series or array) stored in the feature dtype; a Series keeps its index"""
+    if isinstance(values, pd.Series):
+        return values.astype(feature_dtype(), copy=False)
+    return np.asarray(values, dtype=feature_dtype())
+
+def compact_frame(df):
+    """Float columns of df converted to the feature dtype in place; returns df"""
+    dtype = feature_dtype()
+    columns = [column for column, kind in df.dtypes.items() if kind.kind == 'f' and kind != dtype]
+    for column in columns:
+        df[column] = df[column].astype(dtype)
+    return df
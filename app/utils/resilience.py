@@ -0,0 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from flask import current_app, g, has_app_context
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CALL_TIMEOUT = 5
+DEFAULT_REQUEST_BUDGET = 10
+
+class ProviderUnavailableError(RuntimeError):
+    """Raised when a provider call times out, the request budget is spent or the circuit is open"""
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+    After failure_threshold failures in a row the circuit opens and calls fail
+    at once for reset_timeout seconds; then one trial call is let through
+    (half-open) and its outcome closes or re-opens the circuit
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_running = False
+        return self._state
+
+    def allow(self):
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit {self.name} closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"Circuit {self.name} opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self._current_state(),
+                'consecutive_failures': self._failures,
+                'rejected': self.rejected
+            }
+
+# Dedicated pool: provider calls made from shared-pool workers must not wait on that pool
+_call_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='provider-call')
+
+def _config(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+def remaining_budget():
+    """
+    Seconds left in the current request's provider budget, None outside an app context
+    The budget starts with the first provider call of the request
+    """
+    if not has_app_context():
+        return None
+    deadline = g.get('provider_deadline')
+    if deadline is None:
+        deadline = time.monotonic() + _config('PROVIDER_REQUEST_BUDGET', DEFAULT_REQUEST_BUDGET)
+        g.provider_deadline = deadline
+    return deadline - time.monotonic()
+
+def call_with_deadline(fn, breaker, timeout=None):
+    """
+    Run fn() with a timeout bounded by the request budget and guarded by breaker
+    Raises ProviderUnavailableError without calling fn when the circuit is open
+    or the budget is spent. A timed out call is abandoned, not interrupted
+    """
+    timeout = timeout or _config('PROVIDER_CALL_TIMEOUT', DEFAULT_CALL_TIMEOUT)
+    budget = remaining_budget()
+    if budget is not None:
+        if budget <= 0:
+            raise ProviderUnavailableError("Request deadline exceeded")
+        timeout = min(timeout, budget)
+
+    if not breaker.allow():
+        raise ProviderUnavailableError(f"Provider {breaker.name} unavailable (circuit open)")
+
+    future = _call_executor.submit(fn)
+    try:
+        result = future.result(timeout=timeout)
+    except FuturesTimeoutError:
+        breaker.record_failure()
+        raise ProviderUnavailableError(f"Provider {breaker.name} did not answer within {timeout:.1f}s")
+    except Exception:
+        breaker.record_failure()
+        raise
+
+    breaker.record_success()
+    return result
@@ -0,0 +1,246 @@
+import math
+import numpy as np
+
+# Rolling-window and exponentially weighted kernels on raw arrays, matching
+# pandas .rolling() and .ewm() without building Series or DataFrames.
+# values is 1D (bars) or 2D (bars x symbols) and is reduced along axis 0;
+# results keep the input shape. min_periods follows pandas: a window with
+# fewer non-NaN values than min_periods gives NaN (None: the full period),
+# and bars before the first full window use the bars so far. out is an
+# optional preallocated float64 array of the input's shape for the result
+
+# Largest growth of the block-local weights in the EMA recursion; bounds the
+# rounding of the blocked sums to about 1e-13 of the values' scale
+_MAX_GROWTH = 1e3
+
+def _output(out, shape):
+    if out is None:
+        return np.empty(shape)
+    if out.shape != shape or out.dtype != np.float64:
+        raise ValueError(f"out must be a float64 array of shape {shape}")
+    return out
+
+def _min_periods(period, min_periods):
+    if period < 1:
+        raise ValueError("period must be at least 1")
+    return period if min_periods is None else min_periods
+
+def _expand(array, ndim):
+    """1D array along axis 0, broadcastable against an ndim array"""
+    return array.reshape((-1,) + (1,) * (ndim - 1))
+
+def _blocks(values, length, fill):
+    """Pad axis 0 with fill to whole blocks and view it as (n_blocks, length, ...)"""
+    n_blocks = -(-values.shape[0] // length)
+    pad = n_blocks * length - values.shape[0]
+    if pad:
+        values = np.concatenate([values, np.full((pad,) + values.shape[1:], fill)])
+    return values.reshape((n_blocks, length) + values.shape[1:])
+
+def _windows(values, period, ufunc, fill):
+    """
+    ufunc (np.add, np.minimum, np.maximum) reduced over the trailing window
+    of every bar, the first period - 1 bars over the bars so far
+    Van Herk / Gil-Werman: running results from each block start (prefix)
+    and to each block end (suffix) within blocks of period bars, so window
+    [s, t] is the suffix at s combined with the prefix at t. Every window
+    costs O(1) whatever the period, and sums never subtract, so they stay
+    at the scale of one window
+    """
+    n = values.shape[0]
+    blocks = _blocks(values, period, fill)
+    shape = (-1,) + values.shape[1:]
+    prefix = ufunc.accumulate(blocks, axis=1).reshape(shape)[:n]
+    suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(shape)[:n]
+    start = np.maximum(np.arange(n) - period + 1, 0)
+    # A window starting on a block boundary is that block's prefix alone
+    whole = _expand(start % period == 0, values.ndim)
+    return np.where(whole, prefix, ufunc(suffix[start], prefix))
+
+def _finish(result, counts, required, out):
+    """result where the window has at least required values, NaN elsewhere"""
+    out[...] = np.where(counts >= required, result, np.nan)
+    return out
+
+def _filled(values, fill):
+    """values with NaN replaced by fill, and the non-NaN count of every trailing window"""
+    missing = np.isnan(values)
+    if not missing.any():
+        # Complete series: counts grow to the period and stay there
+        return values, lambda period: _expand(np.minimum(np.arange(1.0, values.shape[0] + 1), period), values.ndim)
+    present = (~missing).astype(np.float64)
+    return np.where(missing, fill, values), lambda period: _windows(present, period, np.add, 0.0)
+
+def rolling_count(values, period):
+    """Non-NaN values in every trailing window"""
+    values = np.asarray(values, dtype=np.float64)
+    return np.broadcast_to(_filled(values, 0.0)[1](period), values.shape).copy()
+
+def rolling_sum(values, period, min_periods=None, out=None):
+    values = np.asarray(values, dtype=np.float64)
+    min_periods = _min_periods(period, min_periods)
+    out = _output(out, values.shape)
+    if not values.shape[0]:
+        return out
+    filled, counts = _filled(values, 0.0)
+    return _finish(_windows(filled, period, np.add, 0.0), counts(period), min_periods, out)
+
+def rolling_mean(values, period, min_periods=None, out=None):
+    values = np.asarray(values, dtype=np.float64)
+    min_periods = _min_periods(period, min_periods)
+    out = _output(out, values.shape)
+    if not values.shape[0]:
+        return out
+    filled, counts = _filled(values, 0.0)
+    counts = counts(period)
+    sums = _windows(filled, period, np.add, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = sums / counts
+    return _finish(means, counts, max(min_periods, 1), out)
+
+def rolling_var(values, period, min_periods=None, ddof=1, out=None):
+    values = np.asarray(values, dtype=np.float64)
+    min_periods = _min_periods(period, min_periods)
+    out = _output(out, values.shape)
+    if not values.shape[0]:
+        return out
+    present = ~np.isnan(values)
+    # Shifted by each series' mean, so the sum of squares stays near the
+    # windows' own scale instead of the prices'
+    count = present.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = np.where(count > 0, np.where(present, values, 0.0).sum(axis=0) / count, 0.0)
+    shifted = np.where(present, values - offset, 0.0)
+
+    counts = _filled(values, 0.0)[1](period)
+    sums = _windows(shifted, period, np.add, 0.0)
+    squares = _windows(shifted * shifted, period, np.add, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m2 = squares - sums * sums / counts
+        # Rounding noise on a flat window is no variance
+        m2 = np.where(m2 <= 1e-14 * squares, 0.0, m2)
+        variance = m2 / (counts - ddof)
+    return _finish(np.where(counts > ddof, variance, np.nan), counts, max(min_periods, 1), out)
+
+def rolling_std(values, period, min_periods=None, ddof=1, out=None):
+    out = rolling_var(values, period, min_periods, ddof, out)
+    return np.sqrt(out, out=out)
+
+def _extreme(values, period, min_periods, out, ufunc, fill):
+    values = np.asarray(values, dtype=np.float64)
+    min_periods = _min_periods(period, min_periods)
+    out = _output(out, values.shape)
+    if not values.shape[0]:
+        return out
+    filled, counts = _filled(values, fill)
+    return _finish(_windows(filled, period, ufunc, fill), counts(period), max(min_periods, 1), out)
+
+def rolling_min(values, period, min_periods=None, out=None):
+    return _extreme(values, period, min_periods, out, np.minimum, np.inf)
+
+def rolling_max(values, period, min_periods=None, out=None):
+    return _extreme(values, period, min_periods, out, np.maximum, -np.inf)
+
+# Exponentially weighted means
+
+def _alpha(span, alpha):
+    if (span is None) == (alpha is None):
+        raise ValueError("Pass exactly one of span and alpha")
+    alpha = alpha if alpha is not None else 2 / (span + 1)
+    if not 0 < alpha <= 1:
+        raise ValueError("alpha must be in (0, 1]")
+    return alpha
+
+def _decayed_sums(x, decay, scale, carry):
+    """
+    s[t] = decay * s[t-1] + scale * x[t] from s[-1] = carry, without a loop
+    over bars: each block of bars is solved from a cumulative sum of its
+    values reweighted by decay ** -i (kept below _MAX_GROWTH), and only the
+    value carried into each block is chained block by block
+    """
+    if decay == 0:
+        return scale * x
+    n = x.shape[0]
+    length = max(1, min(n, int(math.log(_MAX_GROWTH) / -math.log(decay))))
+    blocks = _blocks(x, length, 0.0)
+    j = _expand(np.arange(length, dtype=np.float64), x.ndim)
+    # Block results as if nothing was carried in
+    local = scale * decay ** j * np.cumsum(blocks * decay ** -j, axis=1)
+
+    carries = np.empty((blocks.shape[0],) + x.shape[1:])
+    current = np.broadcast_to(carry, x.shape[1:]).astype(np.float64)
+    tail = decay ** length
+    for block in range(blocks.shape[0]):
+        carries[block] = current
+        current = tail * current + local[block, -1]
+    result = local + decay ** (j + 1) * carries[:, None]
+    return result.reshape((-1,) + x.shape[1:])[:n]
+
+def _ewm_dense(values, present, started, alpha, adjust):
+    """
+    EMA of series with no missing value after their first observation
+    Averaged as deviations from each series' first observation, so a flat
+    series keeps exactly its value
+    """
+    decay = 1 - alpha
+    first = started.argmax(axis=0)
+    seed = np.take_along_axis(values, np.expand_dims(first, 0), axis=0)
+    deviations = np.where(present, values - seed, 0.0)
+    if adjust:
+        numerator = _decayed_sums(deviations, decay, 1.0, 0.0)
+        age = _expand(np.arange(values.shape[0]), values.ndim) - first
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Sum of the weights decay ** i over the observations so far
+            weights = (1 - decay ** (age + 1)) / alpha
+            return seed + numerator / weights
+    # The first observation seeds the average, as if it had always been there
+    return seed + _decayed_sums(deviations, decay, alpha, 0.0)
+
+def _ewm_sparse(values, alpha, adjust):
+    """pandas' recursion bar by bar (vectorized across series), for series with gaps"""
+    decay = 1 - alpha
+    new_weight = 1.0 if adjust else alpha
+    result = np.empty(values.shape)
+    weighted = np.array(values[0], dtype=np.float64)
+    old_weight = np.ones(values.shape[1:])
+    result[0] = weighted
+    for t in range(1, values.shape[0]):
+        current = values[t]
+        present = ~np.isnan(current)
+        started = ~np.isnan(weighted)
+        # Missing bars still age the earlier weights
+        old_weight = np.where(started, old_weight * decay, old_weight)
+        update = started & present
+        with np.errstate(invalid='ignore'):
+            mixed = (old_weight * weighted + new_weight * current) / (old_weight + new_weight)
+        weighted = np.where(update, mixed, np.where(present, current, weighted))
+        if adjust:
+            old_weight = np.where(update, old_weight + new_weight, old_weight)
+        else:
+            old_weight = np.where(update, 1.0, old_weight)
+        result[t] = weighted
+    return result
+
+def ewm_mean(values, span=None, alpha=None, adjust=True, min_periods=0, out=None):
+    """Exponentially weighted mean, as pandas ewm(span or alpha, adjust, min_periods).mean()"""
+    values = np.asarray(values, dtype=np.float64)
+    alpha = _alpha(span, alpha)
+    out = _output(out, values.shape)
+    if not values.shape[0]:
+        return out
+    present = ~np.isnan(values)
+    observations = np.cumsum(present, axis=0)
+    started = observations > 0
+    if (present | ~started).all():
+        result = _ewm_dense(values, present, started, alpha, adjust)
+    else:
+        result = _ewm_sparse(values, alpha, adjust)
+    return _finish(result, observations, max(min_periods, 1), out)
+
+def wilder(values, period, min_periods=None, out=None):
+    """
+    Wilder's smoothing (RSI, ATR and ADX averages): an EMA with alpha 1 / period
+    seeded by the first value, as the ta library's ewm(alpha=1/period, adjust=False)
+    """
+    min_periods = period if min_periods is None else min_periods
+    return ewm_mean(values, alpha=1 / period, adjust=False, min_periods=min_periods, out=out)
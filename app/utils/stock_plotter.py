@@ -1,56 +1,116 @@
 from app.utils.indicators import AVAILABLE_INDICATORS, TechnicalIndicators
+from app.utils.indicator_engine import IndicatorEngine
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from plotly.utils import PlotlyJSONEncoder
 import pandas as pd
-import yfinance as yf
+import json
+from app.utils.market_data import get_history, InvalidSymbolError, ProviderUnavailableError
+from app.utils.stock_utils import load_daily_bars
+from app.utils.cache import TieredCache
+from app.services.change_events import HISTORY, change_subscriber
+from app.utils.downsampling import lttb, downsample_ohlc
+
+# Upper bound on points per trace sent to the browser
+DEFAULT_MAX_POINTS = 1000
+
+# Serialized chart fragments keyed by symbol, period, indicator and last bar,
+# so a new bar invalidates them naturally
+chart_cache = TieredCache(maxsize=1024, namespace='chart')
+
+def _invalidate_charts(symbol, kind, last_bar_ts=None):
+    # Rewritten bars keep their timestamp, so drop the symbol's fragments outright
+    if kind == HISTORY:
+        chart_cache.invalidate_where(lambda key: key[1] == symbol, tag=symbol)
+
+change_subscriber.register(_invalidate_charts)
+
+def _to_json(obj):
+    return json.dumps(obj, cls=PlotlyJSONEncoder, separators=(',', ':'))
+
+# Bars shown per period; None shows the whole history
+DISPLAY_BARS = {
+    '1mo': 30,
+    '3mo': 90,
+    '6mo': 180,
+    '1y': 365,
+    'max': None
+}
 
 class StockPlotter:
-    def __init__(self, symbol, period='1mo'):
+    def __init__(self, symbol, period='1mo', max_points=DEFAULT_MAX_POINTS):
         self.symbol = symbol
         self.period = period
-        self.data = None
+        self.max_points = max_points
         self.active_indicators = {}
-        self.load_data()
+        # Loaded on first use, once the active indicators (and their warm-up) are known
+        self._history = None
+        self._data = None
+        self._engine = None
+        self._loaded_lookback = 0
+
+    @property
+    def lookback(self):
+        """Warm-up bars needed by the active indicators"""
+        return max((indicator.lookback for indicator in self.active_indicators.values()), default=0)
+
+    @property
+    def history(self):
+        """Displayed bars plus the warm-up bars before them"""
+        if self._history is None:
+            self.load_data()
+        return self._history
+
+    @property
+    def data(self):
+        """Displayed bars"""
+        if self._data is None:
+            self.load_data()
+        return self._data
+
+    @property
+    def engine(self):
+        """Indicator engine over history, shared by the active indicators"""
+        if self._engine is None:
+            self._engine = IndicatorEngine(self.history, symbol=self.symbol, resolution='1d')
+        return self._engine
         
     def load_data(self):
         try:
-            ticker = yf.Ticker(self.symbol)
-            
-            period_mapping = {
-                '1mo': ('6mo', 30),
-                '3mo': ('1y', 90),
-                '6mo': ('2y', 180),
-                '1y': ('2y', 365),
-                'max': ('max', None)
-            }
-            
-            fetch_period, days_to_show = period_mapping.get(self.period, ('1y', 90))
-            
-            # Fetch data
-            self.data = ticker.history(
-                period=fetch_period,
-                interval='1d',
-                actions=False,
-                auto_adjust=True
-            )
+            display_bars = DISPLAY_BARS.get(self.period, 90)
+            lookback = self.lookback
+
+            if display_bars is None:
+                history = get_history(
+                    self.symbol,
+                    period='max',
+                    interval='1d',
+                    actions=False,
+                    auto_adjust=True
+                )
+            else:
+                history = load_daily_bars(self.symbol, display_bars + lookback)
             
-            if self.data.empty:
+            if history is None or history.empty:
                 raise ValueError(f"No data available for {self.symbol}")
             
             # Ensure index is datetime and timezone-naive
-            if self.data.index.tz is not None:
-                self.data.index = self.data.index.tz_localize(None)
+            if history.index.tz is not None:
+                history.index = history.index.tz_localize(None)
             
+            self._history = history
+            self._engine = None
+            self._loaded_lookback = lookback
             # Trim to the requested period if needed
-            if days_to_show:
-                self.data = self.data.tail(days_to_show)
+            self._data = history.tail(display_bars) if display_bars else history
                 
             print(f"Data loaded successfully.")
-            print(f"Index type: {type(self.data.index)}")
-            print(f"First date: {self.data.index[0]}")
-            print(f"Last date: {self.data.index[-1]}")
-            print(f"Number of rows: {len(self.data)}")
+            print(f"First date: {self._data.index[0]}")
+            print(f"Last date: {self._data.index[-1]}")
+            print(f"Number of rows: {len(self._data)} shown, {len(history)} loaded")
             
+        except (InvalidSymbolError, ProviderUnavailableError):
+            raise
         except Exception as e:
             print(f"Error in load_data: {str(e)}")
             raise Exception(f"Error loading data for {self.symbol}: {str(e)}")
@@ -58,207 +118,345 @@ class StockPlotter:
     def add_indicator(self, indicator_type: str, indicator_name: str):
         key = f"{indicator_type}:{indicator_name}"
         if indicator_type in AVAILABLE_INDICATORS and indicator_name in AVAILABLE_INDICATORS[indicator_type]:
-            self.active_indicators[key] = AVAILABLE_INDICATORS[indicator_type][indicator_name]
+            indicator = AVAILABLE_INDICATORS[indicator_type][indicator_name]
+            self.active_indicators[key] = indicator
+            if self._history is not None and indicator.lookback > self._loaded_lookback:
+                # Loaded without enough warm-up for this indicator
+                self._history = None
+                self._data = None
+                self._engine = None
             
-    def create_plot(self):
-        try:
-            fig = make_subplots(
-                rows=1, 
-                cols=1, 
-                shared_xaxes=True,
-                subplot_titles=[f'{self.symbol} Stock Price']
+    @property
+    def last_bar(self):
+        return self.data.index[-1].isoformat()
+
+    @property
+    def downsampled(self):
+        return bool(self.max_points) and len(self.data) > self.max_points
+
+    def _line(self, values):
+        """x and y for a line trace, reduced with LTTB when the series is too long"""
+        if not self.downsampled:
+            return self.data.index, values
+        return lttb(self.data.index.values, values.to_numpy(), self.max_points)
+
+    def _candlestick_trace(self):
+        # Long ranges are aggregated into OHLC buckets rather than thinned
+        bars = downsample_ohlc(self.data, self.max_points) if self.downsampled else self.data
+        return go.Candlestick(
+            x=bars.index,
+            open=bars['Open'],
+            high=bars['High'],
+            low=bars['Low'],
+            close=bars['Close'],
+            name=self.symbol,
+            increasing_line_color='#26a69a',
+            decreasing_line_color='#ef5350'
+        )
+
+    def _indicator_values(self, key, indicator):
+        """Indicator series in trace order, cached until the next bar"""
+        indicator_type, name = key.split(':')
+        params = tuple(sorted(indicator.params.items()))
+        cache_key = ('values', self.symbol, self.period, key, params, self.last_bar)
+        values = chart_cache.get(cache_key)
+        if values is not None:
+            return values
+
+        # Computed over the warm-up bars too, then cut to the displayed window
+        if indicator_type == 'SMA':
+            period = indicator.params['period']
+            values = [self.engine.get('sma', period=period, min_periods=1)]
+        elif 'Bollinger' in name:
+            upper, middle, lower = indicator.function(self.history, engine=self.engine, **indicator.params)
+            values = [lower, upper, middle]
+        else:
+            values = []
+        values = [series.iloc[-len(self.data):] for series in values]
+
+        chart_cache.set(cache_key, values)
+        return values
+
+    def _indicator_traces(self, key, indicator):
+        indicator_type, name = key.split(':')
+        values = self._indicator_values(key, indicator)
+        
+        if indicator_type == 'SMA':
+            sma_x, sma_y = self._line(values[0])
+            
+            sma_trace = go.Scatter(
+                x=sma_x,
+                y=sma_y,
+                name=f'{name}',
+                line=dict(color=indicator.color, width=1.5)
             )
+            return [sma_trace]
+        
+        elif 'Bollinger' in name:
+            (lower_x, lower_y), (upper_x, upper_y), (middle_x, middle_y) = [self._line(v) for v in values]
+            
+            # Add traces in specific order: lower, upper, middle
+            # This ensures proper fill
+            lower_trace = go.Scatter(
+                x=lower_x,
+                y=lower_y,
+                name='Lower Band',
+                line=dict(color=indicator.color, width=1, dash='dash'),
+                opacity=0.7,
+                showlegend=True
+            )
+            
+            upper_trace = go.Scatter(
+                x=upper_x,
+                y=upper_y,
+                name='Upper Band',
+                line=dict(color=indicator.color, width=1, dash='dash'),
+                fill='tonexty',  # Fill to the lower band
+                fillcolor='rgba(76, 175, 80, 0.1)',  # Light green with transparency
+                opacity=0.7,
+                showlegend=True
+            )
+            
+            middle_trace = go.Scatter(
+                x=middle_x,
+                y=middle_y,
+                name='Middle Band',
+                line=dict(color=indicator.color, width=1.5),
+                showlegend=True
+            )
+            
+            return [lower_trace, upper_trace, middle_trace]
 
+        return []
+
+    def create_figure(self, include_traces=True):
+        fig = make_subplots(
+            rows=1, 
+            cols=1, 
+            shared_xaxes=True,
+            subplot_titles=[f'{self.symbol} Stock Price']
+        )
+
+        if include_traces:
             # Add candlestick
-            candlestick = go.Candlestick(
-                x=self.data.index,
-                open=self.data['Open'],
-                high=self.data['High'],
-                low=self.data['Low'],
-                close=self.data['Close'],
-                name=self.symbol,
-                increasing_line_color='#26a69a',
-                decreasing_line_color='#ef5350'
-            )
-            fig.add_trace(candlestick)
+            fig.add_trace(self._candlestick_trace())
 
             # Add all active indicators
             for key, indicator in self.active_indicators.items():
-                indicator_type, name = key.split(':')
-                
-                if indicator_type == 'SMA':
-                    period = indicator.params['period']
-                    sma = self.data['Close'].rolling(window=period, min_periods=1).mean()
-                    
-                    sma_trace = go.Scatter(
-                        x=self.data.index,
-                        y=sma,
-                        name=f'{name}',
-                        line=dict(color=indicator.color, width=1.5)
-                    )
-                    fig.add_trace(sma_trace)
-                
-                elif 'Bollinger' in name:
-                    upper, middle, lower = indicator.function(self.data, **indicator.params)
-                    
-                    # Add traces in specific order: lower, upper, middle
-                    # This ensures proper fill
-                    lower_trace = go.Scatter(
-                        x=self.data.index,
-                        y=lower,
-                        name='Lower Band',
-                        line=dict(color=indicator.color, width=1, dash='dash'),
-                        opacity=0.7,
-                        showlegend=True
-                    )
-                    
-                    upper_trace = go.Scatter(
-                        x=self.data.index,
-                        y=upper,
-                        name='Upper Band',
-                        line=dict(color=indicator.color, width=1, dash='dash'),
-                        fill='tonexty',  # Fill to the lower band
-                        fillcolor='rgba(76, 175, 80, 0.1)',  # Light green with transparency
-                        opacity=0.7,
-                        showlegend=True
-                    )
-                    
-                    middle_trace = go.Scatter(
-                        x=self.data.index,
-                        y=middle,
-                        name='Middle Band',
-                        line=dict(color=indicator.color, width=1.5),
-                        showlegend=True
-                    )
-                    
-                    # Add traces in specific order
-                    fig.add_trace(lower_trace)
-                    fig.add_trace(upper_trace)
-                    fig.add_trace(middle_trace)
-
-            # Configure tick settings based on period
-            if self.period == '1mo':
-                dtick = 'W1'
-                tickformat = '%Y-%m-%d'
-            elif self.period == '3mo' or self.period == '6mo':
-                dtick = 'M1'
-                tickformat = '%Y-%m-%d'
-            elif self.period == '1y':
-                dtick = 'M1'
-                tickformat = '%Y-%m'
-            else:  # max
-                dtick = 'M4'
-                tickformat = '%Y-%m'
-
-            # Update layout with dynamic tick settings
-            fig.update_layout(
-                xaxis=dict(
-                    title=dict(
-                        text='Date',
-                        font=dict(size=16, color='white'),
-                        standoff=20
-                    ),
-                    showgrid=True,
-                    gridcolor='rgba(128,128,128,0.2)',
-                    gridwidth=1,
-                    tickfont=dict(size=12, color='white'),
-                    rangeslider=dict(visible=False),
-                    type='date',
-                    dtick=dtick,
-                    tickformat=tickformat,
-                    showticklabels=True,
-                    side='bottom',
-                    showline=True,
-                    linecolor='rgba(128,128,128,0.4)',
-                    linewidth=2,
-                    fixedrange=False,
-                    automargin=True,
-                    tickangle=45
-                ),
-                yaxis=dict(
-                    title=dict(
-                        text='Price ($)',
-                        font=dict(size=16, color='white'),
-                        standoff=20
-                    ),
-                    showgrid=True,
-                    gridcolor='rgba(128,128,128,0.2)',
-                    gridwidth=1,
-                    tickfont=dict(size=12, color='white'),
-                    tickprefix='$',
-                    tickformat=',.2f',
-                    showticklabels=True,
-                    side='left',
-                    showline=True,
-                    linecolor='rgba(128,128,128,0.4)',
-                    linewidth=2
-                ),
-                template='plotly_dark',
-                showlegend=True,
-                legend=dict(
-                    yanchor="top",
-                    y=0.99,
-                    xanchor="left",
-                    x=0.01,
-                    bgcolor='rgba(0,0,0,0.5)',
-                    font=dict(color='white', size=12)
-                ),
-            )
+                for trace in self._indicator_traces(key, indicator):
+                    fig.add_trace(trace)
 
-            # Force axis labels to be visible
-            fig.update_xaxes(
-                title_standoff=25,  # Increase space between axis and its label
-                showspikes=True,
-                spikecolor='gray',
-                spikesnap='cursor',
-                spikemode='across',
-                spikethickness=1,
-                showline=True,
+        self._apply_layout(fig)
+        return fig
+
+    def plot_config(self):
+        return {
+            'displayModeBar': True,
+            'scrollZoom': True,
+            'modeBarButtonsToAdd': ['drawline', 'drawopenpath', 'eraseshape'],
+            'displaylogo': False,
+            'showAxisDragHandles': True,
+            'showAxisRangeEntryBoxes': True,
+            'showTips': True,
+            'modeBarButtonsToRemove': [],
+            'toImageButtonOptions': {
+                'format': 'png',
+                'filename': f'{self.symbol}_chart',
+                'height': 1000,
+                'width': 1200,
+                'scale': 2
+            }
+        }
+
+    def chart_data(self, include_base=True):
+        """
+        Figure data as a JSON string: candlestick, layout and one trace list per
+        active indicator. Every fragment is cached separately, so toggling an
+        indicator only serializes that indicator's traces
+        """
+        last_bar = self.last_bar
+        parts = [
+            f'"symbol":{json.dumps(self.symbol)}',
+            f'"period":{json.dumps(self.period)}',
+            f'"last_bar":{json.dumps(last_bar)}',
+            f'"downsampled":{json.dumps(self.downsampled)}'
+        ]
+
+        if include_base:
+            base_key = ('base', self.symbol, self.period, self.max_points, last_bar)
+            base = chart_cache.get(base_key)
+            if base is None:
+                base = _to_json(self._candlestick_trace().to_plotly_json())
+                chart_cache.set(base_key, base)
+
+            layout_key = ('layout', self.symbol, self.period)
+            layout = chart_cache.get(layout_key)
+            if layout is None:
+                layout = _to_json(self.create_figure(include_traces=False).layout.to_plotly_json())
+                chart_cache.set(layout_key, layout)
+
+            parts.append(f'"base":{base}')
+            parts.append(f'"layout":{layout}')
+            parts.append(f'"config":{_to_json(self.plot_config())}')
+
+        indicator_parts = []
+        for key, indicator in self.active_indicators.items():
+            params = tuple(sorted(indicator.params.items()))
+            trace_key = ('indicator', self.symbol, self.period, self.max_points, key, params, last_bar)
+            traces = chart_cache.get(trace_key)
+            if traces is None:
+                traces = _to_json([trace.to_plotly_json() for trace in self._indicator_traces(key, indicator)])
+                chart_cache.set(trace_key, traces)
+            indicator_parts.append(f'{json.dumps(key)}:{traces}')
+
+        parts.append('"indicators":{' + ','.join(indicator_parts) + '}')
+        return '{' + ','.join(parts) + '}'
+
+    def chart_delta(self, since):
+        """
+        Bars at or after since (the client's last bar, which may have been
+        updated) plus the matching tail of every active indicator trace
+        The tails are cut from the same cached indicator values the full chart
+        uses, not read from indicator_states: those hold one latest value over
+        stored daily bars, while the chart's series follow its own period,
+        interval and downsampling, so the two would not line up
+        """
+        since = pd.Timestamp(since)
+        if since.tz is not None:
+            since = since.tz_convert(None)
+        mask = self.data.index >= since
+        bars = self.data[mask]
+
+        indicators = {}
+        for key, indicator in self.active_indicators.items():
+            indicators[key] = [values[mask] for values in self._indicator_values(key, indicator)]
+
+        return _to_json({
+            'symbol': self.symbol,
+            'period': self.period,
+            'last_bar': self.last_bar,
+            'bars': {
+                'x': bars.index,
+                'open': bars['Open'],
+                'high': bars['High'],
+                'low': bars['Low'],
+                'close': bars['Close']
+            },
+            'indicators': indicators
+        })
+
+    def _apply_layout(self, fig):
+        # Configure tick settings based on period
+        if self.period == '1mo':
+            dtick = 'W1'
+            tickformat = '%Y-%m-%d'
+        elif self.period == '3mo' or self.period == '6mo':
+            dtick = 'M1'
+            tickformat = '%Y-%m-%d'
+        elif self.period == '1y':
+            dtick = 'M1'
+            tickformat = '%Y-%m'
+        else:  # max
+            dtick = 'M4'
+            tickformat = '%Y-%m'
+
+        # Update layout with dynamic tick settings
+        fig.update_layout(
+            xaxis=dict(
+                title=dict(
+                    text='Date',
+                    font=dict(size=16, color='white'),
+                    standoff=20
+                ),
                 showgrid=True,
+                gridcolor='rgba(128,128,128,0.2)',
+                gridwidth=1,
+                tickfont=dict(size=12, color='white'),
+                rangeslider=dict(visible=False),
+                type='date',
+                dtick=dtick,
+                tickformat=tickformat,
                 showticklabels=True,
-                ticks='outside',
-                ticklen=8,  # Increase tick length
-                tickwidth=2,  # Increase tick width
-                tickcolor='white'
-            )
-            
-            fig.update_yaxes(
-                title_standoff=25,  # Increase space between axis and its label
-                showspikes=True,
-                spikecolor='gray',
-                spikesnap='cursor',
-                spikemode='across',
-                spikethickness=1,
+                side='bottom',
                 showline=True,
+                linecolor='rgba(128,128,128,0.4)',
+                linewidth=2,
+                fixedrange=False,
+                automargin=True,
+                tickangle=45
+            ),
+            yaxis=dict(
+                title=dict(
+                    text='Price ($)',
+                    font=dict(size=16, color='white'),
+                    standoff=20
+                ),
                 showgrid=True,
+                gridcolor='rgba(128,128,128,0.2)',
+                gridwidth=1,
+                tickfont=dict(size=12, color='white'),
+                tickprefix='$',
+                tickformat=',.2f',
                 showticklabels=True,
-                ticks='outside',
-                ticklen=8,  # Increase tick length
-                tickwidth=2,  # Increase tick width
-                tickcolor='white'
-            )
+                side='left',
+                showline=True,
+                linecolor='rgba(128,128,128,0.4)',
+                linewidth=2
+            ),
+            template='plotly_dark',
+            showlegend=True,
+            legend=dict(
+                yanchor="top",
+                y=0.99,
+                xanchor="left",
+                x=0.01,
+                bgcolor='rgba(0,0,0,0.5)',
+                font=dict(color='white', size=12)
+            ),
+        )
+
+        # Force axis labels to be visible
+        fig.update_xaxes(
+            title_standoff=25,  # Increase space between axis and its label
+            showspikes=True,
+            spikecolor='gray',
+            spikesnap='cursor',
+            spikemode='across',
+            spikethickness=1,
+            showline=True,
+            showgrid=True,
+            showticklabels=True,
+            ticks='outside',
+            ticklen=8,  # Increase tick length
+            tickwidth=2,  # Increase tick width
+            tickcolor='white'
+        )
+        
+        fig.update_yaxes(
+            title_standoff=25,  # Increase space between axis and its label
+            showspikes=True,
+            spikecolor='gray',
+            spikesnap='cursor',
+            spikemode='across',
+            spikethickness=1,
+            showline=True,
+            showgrid=True,
+            showticklabels=True,
+            ticks='outside',
+            ticklen=8,  # Increase tick length
+            tickwidth=2,  # Increase tick width
+            tickcolor='white'
+        )
+
+    def create_plot(self):
+        try:
+            fig = self.create_figure()
 
             # Create the plot HTML with custom CSS for modebar
             plot_html = fig.to_html(
                 full_html=False,
                 include_plotlyjs='cdn',
-                config={
-                    'displayModeBar': True,
-                    'scrollZoom': True,
-                    'modeBarButtonsToAdd': ['drawline', 'drawopenpath', 'eraseshape'],
-                    'displaylogo': False,
-                    'showAxisDragHandles': True,
-                    'showAxisRangeEntryBoxes': True,
-                    'showTips': True,
-                    'modeBarButtonsToRemove': [],
-                    'toImageButtonOptions': {
-                        'format': 'png',
-                        'filename': f'{self.symbol}_chart',
-                        'height': 1000,
-                        'width': 1200,
-                        'scale': 2
-                    }
-                }
+                config=self.plot_config()
             )
 
             # Add custom CSS to force modebar styling
@@ -1,6 +1,205 @@
 import yfinance as yf
+import math
+import pandas as pd
 from datetime import datetime, timedelta
 from app.database.models import Stock, StockHistory, db
+from app.utils.market_data import download_latest_quotes, get_ticker_info, get_history
+from app.utils.validators import validate_stock_symbol
+from flask import current_app
+from app.utils.concurrency import SingleFlight, fan_out
+from app.services.change_events import HISTORY, QUOTE, publish
+from app.services import indicator_state_service
+from app.services.portfolio_snapshot_service import portfolio_snapshots
+
+# Quotes younger than this are served from the database without hitting the provider
+QUOTE_MAX_AGE = timedelta(minutes=15)
+# Older quotes are still served at once while a background refresh runs; past this, callers wait
+QUOTE_HARD_MAX_AGE = timedelta(hours=4)
+
+# One provider refresh per symbol at a time, shared by waiting and background callers
+_stock_refreshes = SingleFlight()
+
+def _quote_age(stock, now):
+    if not stock or not stock.last_updated:
+        return None
+    return now - stock.last_updated
+
+def _fetch_stock_data(symbol, max_age):
+    """Provider calls for one symbol, safe to run off the request thread"""
+    info = get_ticker_info(symbol, max_age=max_age)
+    try:
+        # Get 1 month of daily data
+        hist = get_history(symbol, max_age=max_age, period='1mo', interval='1d')
+    except Exception as hist_error:
+        print(f"Error fetching historical data: {hist_error}")
+        hist = None
+    return info, hist
+
+def _apply_stock_data(symbol, stock, info, hist, now):
+    """Write fetched provider data to the stocks and stock_history tables"""
+    # Get current price and other market data
+    current_price = info.get('regularMarketPrice') or info.get('currentPrice')
+    if not current_price:
+        raise ValueError("Unable to get current price")
+
+    if not stock:
+        # Create new stock
+        stock = Stock(
+            symbol=symbol,
+            name=info.get('longName') or info.get('shortName', symbol),
+            type='stock',
+            current_price=current_price
+        )
+        db.session.add(stock)
+        db.session.flush()  # Get the stock.id before adding history
+
+    else:
+        # Update existing stock
+        stock.current_price = current_price
+        stock.name = info.get('longName') or info.get('shortName', stock.name)
+
+    if hist is not None and not hist.empty:
+        # Upsert by date: only the bars that changed or are new are written
+        dates = [date.to_pydatetime().replace(tzinfo=None) for date in hist.index]
+        existing = {
+            row.date: row for row in StockHistory.query.filter(
+                StockHistory.stock_id == stock.id,
+                StockHistory.date >= min(dates)
+            ).all()
+        }
+
+        newest = db.session.query(db.func.max(StockHistory.date)).filter(
+            StockHistory.stock_id == stock.id
+        ).scalar()
+
+        # Indicator states past a changed bar, or a new one behind newer bars, are rebuilt
+        rewritten_from = None
+        for date, (_, row) in zip(dates, hist.iterrows()):
+            values = {
+                'open_price': float(row['Open']),
+                'high_price': float(row['High']),
+                'low_price': float(row['Low']),
+                'close_price': float(row['Close']),
+                'volume': int(row['Volume'])
+            }
+            history = existing.get(date)
+            if history is None:
+                db.session.add(StockHistory(stock_id=stock.id, date=date, **values))
+                if newest is not None and date < newest:
+                    rewritten_from = min(rewritten_from or date, date)
+            elif any(getattr(history, column) != value for column, value in values.items()):
+                for column, value in values.items():
+                    setattr(history, column, value)
+                rewritten_from = min(rewritten_from or date, date)
+        indicator_state_service.indicator_states.advance(stock.id, rewritten_from=rewritten_from)
+    else:
+        # Add at least today's data point
+        history = StockHistory(
+            stock_id=stock.id,
+            date=now,
+            close_price=current_price,
+            volume=info.get('volume', 0)
+        )
+        db.session.add(history)
+        indicator_state_service.indicator_states.advance(stock.id)
+
+    stock.last_updated = now
+    # Holders' snapshots were valued at the previous price
+    portfolio_snapshots.mark_stale(stock_id=stock.id)
+    publish(
+        symbol,
+        HISTORY,
+        last_bar_ts=dates[-1] if hist is not None and not hist.empty else now
+    )
+    return stock
+
+def _refresh_stock(app, symbol, max_age):
+    """Fetch and store one symbol in its own app context, returns the stock id"""
+    with app.app_context():
+        try:
+            info, hist = _fetch_stock_data(symbol, max_age)
+            stock = Stock.query.filter_by(symbol=symbol).first()
+            stock = _apply_stock_data(symbol, stock, info, hist, datetime.utcnow())
+            db.session.commit()
+            return stock.id
+        except Exception:
+            db.session.rollback()
+            raise
+
+def get_or_update_stocks(symbols, force_update=False, timeout=None):
+    """
+    Get several stocks with stale-while-revalidate refreshes
+    Quotes younger than QUOTE_MAX_AGE are returned as is. Older ones, up to
+    QUOTE_HARD_MAX_AGE, are returned at once while a background refresh runs.
+    Missing stocks, quotes past the ceiling and forced updates wait for the
+    provider, in parallel and under one overall deadline (seconds, by default
+    PROVIDER_FANOUT_TIMEOUT). Concurrent callers share a single refresh per symbol
+    Returns dict symbol -> (stock, status, error_message) with status one of
+    'cached', 'stale', 'updated', 'invalid', 'error' or 'timeout'. A timed out
+    or failed symbol still returns its last stored stock, if any
+    """
+    results = {}
+    formatted = []
+    for symbol in dict.fromkeys(symbols):
+        # Validate and format symbol
+        formatted_symbol, is_valid = validate_stock_symbol(symbol)
+        if not is_valid:
+            results[symbol] = (None, 'invalid', f"Invalid symbol format: {symbol}")
+        else:
+            formatted.append(formatted_symbol)
+
+    if not formatted:
+        return results
+
+    now = datetime.utcnow()
+    stocks = {}
+    for stock in Stock.query.filter(Stock.symbol.in_(formatted)).all():
+        stocks.setdefault(stock.symbol, stock)
+
+    app = current_app._get_current_object()
+    # Fetch from yfinance, reusing provider responses younger than the refresh interval
+    max_age = 0 if force_update else QUOTE_MAX_AGE.total_seconds()
+
+    blocking = []
+    for symbol in formatted:
+        stock = stocks.get(symbol)
+        age = _quote_age(stock, now)
+        if not force_update and age is not None and age <= QUOTE_MAX_AGE:
+            results[symbol] = (stock, 'cached', None)
+        elif not force_update and age is not None and age <= QUOTE_HARD_MAX_AGE:
+            # Serve the stored quote now, revalidate in the background
+            _stock_refreshes.submit(symbol, _refresh_stock, app, symbol, max_age)
+            results[symbol] = (stock, 'stale', None)
+        else:
+            blocking.append(symbol)
+
+    if not blocking:
+        return results
+
+    if timeout is None:
+        timeout = current_app.config.get('PROVIDER_FANOUT_TIMEOUT', 8)
+    fetched = fan_out(
+        lambda symbol: _refresh_stock(app, symbol, max_age),
+        blocking,
+        timeout=timeout,
+        single_flight=_stock_refreshes
+    )
+
+    for symbol, result in fetched.items():
+        stock = stocks.get(symbol)
+        if not result.ok:
+            print(f"Error updating stock {symbol}: {result.error}")
+            results[symbol] = (stock, result.status, result.error)
+            continue
+
+        # Written by the worker's session, reload it here
+        if stock is not None:
+            db.session.refresh(stock)
+        else:
+            stock = db.session.get(Stock, result.value)
+        results[symbol] = (stock, 'updated', None)
+
+    return results
 
 def get_or_update_stock(symbol, force_update=False):
     """
@@ -9,100 +208,13 @@ def get_or_update_stock(symbol, force_update=False):
     """
     try:
         # Validate and format symbol
-        formatted_symbol, is_valid = is_valid_symbol(symbol)
+        formatted_symbol, is_valid = validate_stock_symbol(symbol)
         if not is_valid:
             return None, False, f"Invalid symbol format: {symbol}"
-        
-        symbol = formatted_symbol
-        stock = Stock.query.filter_by(symbol=symbol).first()
-        now = datetime.utcnow()
-
-        # Check if we need to update the stock data
-        needs_update = (
-            force_update or
-            not stock or
-            not stock.last_updated or
-            (now - stock.last_updated) > timedelta(minutes=15)
-        )
-
-        if needs_update:
-            # Fetch from yfinance
-            ticker = yf.Ticker(symbol)
-            
-            # Get ticker info
-            info = ticker.info
-            if not info:
-                return None, False, "Unable to fetch stock data"
-
-            # Get current price and other market data
-            current_price = info.get('regularMarketPrice') or info.get('currentPrice')
-            if not current_price:
-                return None, False, "Unable to get current price"
-
-            if not stock:
-                # Create new stock
-                stock = Stock(
-                    symbol=symbol,
-                    name=info.get('longName') or info.get('shortName', symbol),
-                    type='stock',
-                    current_price=current_price,
-                    market_cap=info.get('marketCap', 0),
-                    volume=info.get('volume', 0),
-                    avg_volume=info.get('averageVolume', 0)
-                )
-                db.session.add(stock)
-                db.session.flush()  # Get the stock.id before adding history
-
-            else:
-                # Update existing stock
-                stock.current_price = current_price
-                stock.name = info.get('longName') or info.get('shortName', stock.name)
-                stock.market_cap = info.get('marketCap', 0)
-                stock.volume = info.get('volume', 0)
-                stock.avg_volume = info.get('averageVolume', 0)
-
-            # Get historical data
-            try:
-                # Get 1 month of daily data
-                hist = ticker.history(period='1mo', interval='1d')
-                
-                if not hist.empty:
-                    # Delete existing history for this period to avoid duplicates
-                    start_date = hist.index.min()
-                    StockHistory.query.filter(
-                        StockHistory.stock_id == stock.id,
-                        StockHistory.date >= start_date
-                    ).delete()
-
-                    # Add new history records
-                    for date, row in hist.iterrows():
-                        history = StockHistory(
-                            stock_id=stock.id,
-                            date=date,
-                            open_price=float(row['Open']),
-                            high_price=float(row['High']),
-                            low_price=float(row['Low']),
-                            close_price=float(row['Close']),
-                            volume=int(row['Volume']),
-                            adjusted_close=float(row['Close'])
-                        )
-                        db.session.add(history)
-
-            except Exception as hist_error:
-                print(f"Error fetching historical data: {hist_error}")
-                # Add at least today's data point
-                history = StockHistory(
-                    stock_id=stock.id,
-                    date=now,
-                    close_price=current_price,
-                    volume=info.get('volume', 0),
-                    adjusted_close=current_price
-                )
-                db.session.add(history)
-
-            stock.last_updated = now
-            db.session.commit()
 
+        stock, status, error = get_or_update_stocks([formatted_symbol], force_update)[formatted_symbol]
+        if status not in ('cached', 'stale', 'updated'):
+            return None, False, error or "Unable to fetch stock data"
         return stock, True, None
 
     except Exception as e:
@@ -178,8 +290,7 @@ def get_stock_history(symbol, period='1mo', interval='1d'):
                 return history_data, True, None
 
         # If not in database or different interval needed, fetch from yfinance
-        ticker = yf.Ticker(symbol)
-        hist = ticker.history(period=period, interval=interval)
+        hist = get_history(symbol, period=period, interval=interval)
         
         if hist.empty:
             return None, False, "No historical data available"
@@ -198,4 +309,131 @@ def get_stock_history(symbol, period='1mo', interval='1d'):
 
     except Exception as e:
         print(f"Error fetching history for {symbol}: {str(e)}")
-        return None, False, str(e) 
\ No newline at end of file
+        return None, False, str(e) 
+
+def get_latest_quotes(symbols):
+    """
+    Resolve the latest price for several symbols in one pass
+    Fresh prices come from the stocks table, every miss is fetched in a single
+    batched provider call and written back so the next caller hits the database
+    Returns dict symbol -> {'price', 'updated', 'stale'} (None when unresolved)
+    """
+    symbols = list(dict.fromkeys(symbols))
+    quotes = {symbol: None for symbol in symbols}
+    if not symbols:
+        return quotes
+
+    now = datetime.utcnow()
+    stocks = {}
+    for stock in Stock.query.filter(Stock.symbol.in_(symbols)).all():
+        stocks.setdefault(stock.symbol, stock)
+
+    misses = []
+    for symbol in symbols:
+        stock = stocks.get(symbol)
+        if (stock and stock.current_price and stock.last_updated and
+                now - stock.last_updated <= QUOTE_MAX_AGE):
+            quotes[symbol] = {
+                'price': stock.current_price,
+                'updated': stock.last_updated.isoformat(),
+                'stale': False
+            }
+        else:
+            misses.append(symbol)
+
+    if not misses:
+        return quotes
+
+    try:
+        fetched = download_latest_quotes(misses)
+    except Exception as e:
+        print(f"Error fetching quotes for {misses}: {str(e)}")
+        fetched = {}
+
+    for symbol in misses:
+        stock = stocks.get(symbol)
+        quote = fetched.get(symbol)
+        if quote:
+            if stock:
+                stock.current_price = quote['price']
+                stock.last_updated = now
+                portfolio_snapshots.mark_stale(stock_id=stock.id)
+                publish(symbol, QUOTE, last_bar_ts=quote['date'])
+            quotes[symbol] = {
+                'price': quote['price'],
+                'updated': now.isoformat(),
+                'stale': False
+            }
+        elif stock and stock.current_price:
+            # Provider miss: fall back to the last known price
+            quotes[symbol] = {
+                'price': stock.current_price,
+                'updated': stock.last_updated.isoformat() if stock.last_updated else None,
+                'stale': True
+            }
+
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error saving quotes: {str(e)}")
+
+    return quotes
+
+def _stored_daily_bars(symbol, bars):
+    """Last `bars` daily bars from the stock_history table, one row per day"""
+    stock = Stock.query.filter_by(symbol=symbol).first()
+    if not stock:
+        return None
+
+    # Intraday refreshes store several rows per day, so read a little extra
+    rows = (
+        StockHistory.query
+        .with_entities(
+            StockHistory.date, StockHistory.open_price, StockHistory.high_price,
+            StockHistory.low_price, StockHistory.close_price, StockHistory.volume
+        )
+        .filter(StockHistory.stock_id == stock.id)
+        .order_by(StockHistory.date.desc())
+        .limit(bars * 2)
+        .all()
+    )
+    if not rows:
+        return None
+
+    df = pd.DataFrame(rows, columns=['Date', 'Open', 'High', 'Low', 'Close', 'Volume'])
+    df = df.sort_values('Date')
+    df['Date'] = pd.to_datetime(df['Date']).dt.normalize()
+    daily = df.groupby('Date').agg({
+        'Open': 'first',
+        'High': 'max',
+        'Low': 'min',
+        'Close': 'last',
+        'Volume': 'max'
+    })
+    # Rows saved by quote refreshes only carry a close
+    daily['Open'] = daily['Open'].fillna(daily['Close'])
+    daily['High'] = daily['High'].fillna(daily[['Open', 'Close']].max(axis=1))
+    daily['Low'] = daily['Low'].fillna(daily[['Open', 'Close']].min(axis=1))
+    return daily.dropna(subset=['Close']).tail(bars)
+
+def load_daily_bars(symbol, bars):
+    """
+    Return the last `bars` daily OHLCV bars for symbol
+    The stock_history table is used when it holds enough recent bars, otherwise
+    only the calendar range covering `bars` trading days is requested from the
+    provider instead of a fixed, longer period
+    """
+    try:
+        stored = _stored_daily_bars(symbol, bars)
+        last_session = (pd.Timestamp.now().normalize() - pd.offsets.BDay(1))
+        if stored is not None and len(stored) >= bars and stored.index[-1] >= last_session:
+            return stored
+    except Exception as e:
+        print(f"Error reading stored history for {symbol}: {str(e)}")
+
+    # Roughly 5 trading days per 7 calendar days, plus room for holidays
+    calendar_days = math.ceil(bars * 7 / 5) + 10
+    start = (datetime.now() - timedelta(days=calendar_days)).strftime('%Y-%m-%d')
+    hist = get_history(symbol, start=start, interval='1d', actions=False, auto_adjust=True)
+    return hist.tail(bars)
@@ -0,0 +1,357 @@
+import math
+
+# Exact recomputation of a window's mean and variance after this many updates,
+# so rounding from the running updates cannot build up on long streams
+RESYNC_INTERVAL = 1000
+
+def _number(value):
+    """JSON-safe output: None for missing or non-finite values"""
+    return value if value is not None and math.isfinite(value) else None
+
+class RollingWindow:
+    """
+    Ring buffer of the last period values with a running mean and sum of
+    squared deviations (Welford), so mean and variance cost O(1) per value.
+    A window containing NaN has no mean, as a pandas rolling window
+    """
+    def __init__(self, period):
+        self.period = period
+        self.values = []
+        self.position = 0
+        self.missing = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.updates = 0
+
+    def push(self, value):
+        if len(self.values) < self.period:
+            self.values.append(value)
+        else:
+            old = self.values[self.position]
+            self.values[self.position] = value
+            self._remove(old)
+        self.position = (self.position + 1) % self.period
+        self._add(value)
+
+        self.updates += 1
+        if self.updates % RESYNC_INTERVAL == 0:
+            self._resync()
+
+    def _add(self, value):
+        if math.isnan(value):
+            self.missing += 1
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def _remove(self, value):
+        if math.isnan(value):
+            self.missing -= 1
+            return
+        if self.count == 1:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        previous_mean = self.mean
+        self.mean = (self.count * previous_mean - value) / (self.count - 1)
+        self.m2 = max(self.m2 - (value - self.mean) * (value - previous_mean), 0.0)
+        self.count -= 1
+
+    def _resync(self):
+        present = [value for value in self.values if not math.isnan(value)]
+        self.count = len(present)
+        self.mean = sum(present) / self.count if present else 0.0
+        self.m2 = sum((value - self.mean) ** 2 for value in present)
+
+    @property
+    def full(self):
+        return len(self.values) == self.period and not self.missing
+
+    def average(self):
+        return self.mean if self.full else None
+
+    def std(self, ddof=1):
+        if not self.full or self.count <= ddof:
+            return None
+        return math.sqrt(self.m2 / (self.count - ddof))
+
+    def state(self):
+        return {
+            'values': [None if math.isnan(value) else value for value in self.values],
+            'position': self.position,
+            'updates': self.updates
+        }
+
+    def load(self, state):
+        self.values = [math.nan if value is None else value for value in state['values']]
+        self.position = state['position']
+        self.updates = state['updates']
+        self.missing = sum(1 for value in self.values if math.isnan(value))
+        self._resync()
+
+class RecursiveEMA:
+    """
+    Exponential moving average updated one value at a time, as pandas ewm
+    With adjust=False the first value seeds the average; with adjust=True
+    the weighted sum and the sum of weights are carried instead
+    """
+    def __init__(self, span=None, alpha=None, adjust=False):
+        self.alpha = alpha if alpha is not None else 2 / (span + 1)
+        self.adjust = adjust
+        self.numerator = None
+        self.denominator = 0.0
+        self.observations = 0
+
+    def push(self, value):
+        decay = 1 - self.alpha
+        if math.isnan(value):
+            if self.numerator is not None and self.adjust:
+                # Missing values still age the earlier weights
+                self.numerator *= decay
+                self.denominator *= decay
+            return
+        self.observations += 1
+        if self.numerator is None:
+            self.numerator, self.denominator = value, 1.0
+        elif self.adjust:
+            self.numerator = self.numerator * decay + value
+            self.denominator = self.denominator * decay + 1
+        else:
+            self.numerator = self.numerator * decay + value * self.alpha
+
+    @property
+    def value(self):
+        if self.numerator is None:
+            return None
+        return self.numerator / self.denominator if self.adjust else self.numerator
+
+    def state(self):
+        return {
+            'numerator': self.numerator,
+            'denominator': self.denominator,
+            'observations': self.observations
+        }
+
+    def load(self, state):
+        self.numerator = state['numerator']
+        self.denominator = state['denominator']
+        self.observations = state['observations']
+
+class StreamingIndicator:
+    """
+    Indicator advanced one bar at a time with O(1) work per bar
+    Subclasses list their stateful parts in components and any scalar state
+    in fields; state() and load() round-trip through JSON
+    """
+    components = ()
+    fields = ()
+
+    def update(self, close, volume=None):
+        raise NotImplementedError
+
+    def values(self):
+        raise NotImplementedError
+
+    def state(self):
+        state = {name: getattr(self, name).state() for name in self.components}
+        state.update({name: getattr(self, name) for name in self.fields})
+        return state
+
+    def load(self, state):
+        for name in self.components:
+            getattr(self, name).load(state[name])
+        for name in self.fields:
+            setattr(self, name, state[name])
+        return self
+
+class StreamingSMA(StreamingIndicator):
+    components = ('window',)
+
+    def __init__(self, period=20):
+        self.window = RollingWindow(period)
+
+    def update(self, close, volume=None):
+        self.window.push(close)
+
+    def values(self):
+        return {'value': _number(self.window.average())}
+
+class StreamingEMA(StreamingIndicator):
+    components = ('ema',)
+
+    def __init__(self, span=20):
+        self.ema = RecursiveEMA(span=span)
+
+    def update(self, close, volume=None):
+        self.ema.push(close)
+
+    def values(self):
+        return {'value': _number(self.ema.value)}
+
+class StreamingBollinger(StreamingIndicator):
+    components = ('window',)
+
+    def __init__(self, period=20, std=2, ddof=1):
+        self.window = RollingWindow(period)
+        self.std = std
+        self.ddof = ddof
+
+    def update(self, close, volume=None):
+        self.window.push(close)
+
+    def values(self):
+        middle = self.window.average()
+        deviation = self.window.std(self.ddof)
+        if middle is None or deviation is None:
+            return {'upper': None, 'middle': None, 'lower': None}
+        return {
+            'upper': _number(middle + deviation * self.std),
+            'middle': _number(middle),
+            'lower': _number(middle - deviation * self.std)
+        }
+
+class StreamingRSI(StreamingIndicator):
+    """
+    RSI from simple averages of gains and losses (the chart's RSI) or with
+    Wilder smoothing (smoothing='wilder', as the ta library)
+    """
+    components = ('gains', 'losses')
+    fields = ('previous_close', 'bars')
+
+    def __init__(self, period=14, smoothing='sma'):
+        self.period = period
+        self.smoothing = smoothing
+        if smoothing == 'wilder':
+            self.gains = RecursiveEMA(alpha=1 / period)
+            self.losses = RecursiveEMA(alpha=1 / period)
+        else:
+            self.gains = RollingWindow(period)
+            self.losses = RollingWindow(period)
+        self.previous_close = None
+        self.bars = 0
+
+    def update(self, close, volume=None):
+        # The first bar has no change and counts as neither gain nor loss
+        change = 0.0 if self.previous_close is None else close - self.previous_close
+        change = 0.0 if math.isnan(change) else change
+        self.gains.push(max(change, 0.0))
+        self.losses.push(max(-change, 0.0))
+        self.previous_close = close
+        self.bars += 1
+
+    def values(self):
+        if self.smoothing == 'wilder':
+            if self.bars < self.period:
+                return {'value': None}
+            gain, loss = self.gains.value, self.losses.value
+            return {'value': 100.0 if loss == 0 else _number(100 - 100 / (1 + gain / loss))}
+
+        gain, loss = self.gains.average(), self.losses.average()
+        if gain is None or loss is None or (gain == 0 and loss == 0):
+            return {'value': None}
+        return {'value': 100.0 if loss == 0 else _number(100 - 100 / (1 + gain / loss))}
+
+class StreamingMACD(StreamingIndicator):
+    components = ('fast', 'slow', 'signal')
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast = RecursiveEMA(span=fast)
+        self.slow = RecursiveEMA(span=slow)
+        self.signal = RecursiveEMA(span=signal)
+
+    def update(self, close, volume=None):
+        self.fast.push(close)
+        self.slow.push(close)
+        if self.fast.value is not None:
+            self.signal.push(self.fast.value - self.slow.value)
+
+    def values(self):
+        if self.signal.value is None:
+            return {'macd': None, 'signal': None, 'histogram': None}
+        macd = self.fast.value - self.slow.value
+        return {
+            'macd': _number(macd),
+            'signal': _number(self.signal.value),
+            'histogram': _number(macd - self.signal.value)
+        }
+
+class StreamingOBV(StreamingIndicator):
+    fields = ('previous_close', 'total')
+
+    def __init__(self):
+        self.previous_close = None
+        self.total = 0.0
+
+    def update(self, close, volume=None):
+        if self.previous_close is not None and volume is not None:
+            if close > self.previous_close:
+                self.total += volume
+            elif close < self.previous_close:
+                self.total -= volume
+        self.previous_close = close
+
+    def values(self):
+        return {'value': _number(self.total)}
+
+class StreamingAVSO(StreamingIndicator):
+    """Adaptive Volatility Scaled Oscillator, as AdvancedIndicatorsService.calculate_avso"""
+    components = ('returns', 'average', 'oscillators')
+    fields = ('previous_close', 'avso')
+
+    def __init__(self, window=14, alpha=0.1):
+        self.returns = RollingWindow(window)
+        self.average = RecursiveEMA(alpha=alpha, adjust=True)
+        self.oscillators = RollingWindow(window)
+        self.previous_close = None
+        self.avso = None
+
+    def update(self, close, volume=None):
+        change = math.nan if self.previous_close is None else close / self.previous_close - 1
+        self.returns.push(change)
+        self.previous_close = close
+
+        volatility = self.returns.std()
+        avso = math.nan
+        if volatility is not None:
+            upper = close + volatility * close
+            lower = close - volatility * close
+            if upper != lower:
+                avso = (close - lower) / (upper - lower)
+        self.avso = None if math.isnan(avso) else avso
+        self.average.push(avso)
+        self.oscillators.push(avso)
+
+    def values(self):
+        average = self.average.value
+        deviation = self.oscillators.std()
+        if self.avso is None or average is None or deviation is None:
+            upper = lower = None
+            signal = 0
+        else:
+            upper = average + 2 * deviation
+            lower = average - 2 * deviation
+            signal = -1 if self.avso > upper else 1 if self.avso < lower else 0
+        return {
+            'avso': _number(self.avso),
+            'avso_ma': _number(average),
+            'avso_upper': _number(upper),
+            'avso_lower': _number(lower),
+            'signal': signal
+        }
+
+STREAMING_INDICATORS = {
+    'sma': StreamingSMA,
+    'ema': StreamingEMA,
+    'bollinger': StreamingBollinger,
+    'rsi': StreamingRSI,
+    'macd': StreamingMACD,
+    'obv': StreamingOBV,
+    'avso': StreamingAVSO
+}
+
+def create_indicator(name, params, state=None):
+    """Streaming indicator name with params, restored from state when given"""
+    indicator = STREAMING_INDICATORS[name](**params)
+    return indicator.load(state) if state is not None else indicator
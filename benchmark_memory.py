@@ -0,0 +1,83 @@
+"""
+Memory used by the analysis feature pipelines under each FEATURE_DTYPE
+
+Builds synthetic daily histories and keeps the output of
+AIAnalysisService.prepare_data (scaled feature matrix and indicator frame,
+including the ML lag features) for every symbol, as when many symbols are
+analyzed in one process, once per dtype. Reports the size of the kept
+frames and matrices, all memory still held afterwards (fitted models
+included) and the peak while building, plus how far the float32 results
+drift from the float64 ones.
+
+    python benchmark_memory.py --symbols 20 --bars 750
+"""
+import argparse
+import logging
+import tracemalloc
+import numpy as np
+import pandas as pd
+from flask import Flask
+from app.services.ai_analysis_service import AIAnalysisService
+
+def synthetic_history(bars, seed):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, bars)))
+    open_ = close * (1 + rng.normal(0, 0.004, bars))
+    return pd.DataFrame({
+        'date': pd.bdate_range(end='2024-12-31', periods=bars),
+        'open_price': open_,
+        'high_price': np.maximum(open_, close) * (1 + rng.uniform(0, 0.01, bars)),
+        'low_price': np.minimum(open_, close) * (1 - rng.uniform(0, 0.01, bars)),
+        'close_price': close,
+        'volume': rng.integers(1e5, 5e7, bars)
+    })
+
+def run(dtype, histories):
+    app = Flask(__name__)
+    app.config['FEATURE_DTYPE'] = dtype
+    with app.app_context():
+        service = AIAnalysisService()
+        tracemalloc.start()
+        kept = []
+        for history in histories:
+            kept.append(service.prepare_data(history.copy()))
+        held, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    # Frames and matrices alone, without the fitted models held by the service
+    data = sum(df.memory_usage(deep=True).sum() + features.nbytes for features, df in kept)
+    return kept, held, peak, data
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--symbols', type=int, default=20)
+    parser.add_argument('--bars', type=int, default=750)
+    args = parser.parse_args()
+    # Model training messages are not part of the report
+    logging.disable(logging.CRITICAL)
+
+    histories = [synthetic_history(args.bars, seed) for seed in range(args.symbols)]
+    results = {dtype: run(dtype, histories) for dtype in ('float64', 'float32')}
+
+    print(f"{args.symbols} symbols x {args.bars} bars")
+    print(f"{'dtype':<10}{'data MB':>10}{'held MB':>10}{'peak MB':>10}")
+    for dtype, (_, held, peak, data) in results.items():
+        print(f"{dtype:<10}{data / 2**20:>10.1f}{held / 2**20:>10.1f}{peak / 2**20:>10.1f}")
+    wide, compact = results['float64'], results['float32']
+    print(
+        f"reduction: data {1 - compact[3] / wide[3]:.0%}, held {1 - compact[1] / wide[1]:.0%}, "
+        f"peak {1 - compact[2] / wide[2]:.0%}"
+    )
+
+    # Precision: scaled features and the float64-accumulated OBV column
+    feature_drift = max(
+        np.nanmax(np.abs(single[0].astype(np.float64) - double[0]))
+        for single, double in zip(results['float32'][0], results['float64'][0])
+    )
+    obv_drift = max(
+        np.nanmax(np.abs(single[1]['OBV'] - double[1]['OBV']) / np.maximum(np.abs(double[1]['OBV']), 1))
+        for single, double in zip(results['float32'][0], results['float64'][0])
+    )
+    print(f"max scaled feature difference: {feature_drift:.2e}, max relative OBV difference: {obv_drift:.2e}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Filter expressions parse with the documented precedence and evaluate with NaN-safe semantics"""
+import numpy as np
+import pytest
+from app.utils.filter_expressions import MAX_DEPTH, MAX_PERIOD, ExpressionError, compile_expression
+
+def evaluate(text, boolean=True, **values):
+    """text over columns given by term label, e.g. evaluate('RSI() < 30', **{'RSI(14)': [...]})"""
+    expression = compile_expression(text, boolean=boolean)
+    columns = {term: np.asarray(values[term.label], dtype=np.float64) for term in expression.terms}
+    return expression.evaluate(columns)
+
+def labels(text, boolean=True):
+    return [term.label for term in compile_expression(text, boolean=boolean).terms]
+
+@pytest.mark.parametrize('text, expected', [
+    ('1 + 2 * 3', 7),
+    ('(1 + 2) * 3', 9),
+    ('10 - 4 - 3', 3),
+    ('12 / 3 / 2', 2),
+    ('-2 * 3 + 10', 4),
+    ('- (1 + 2)', -3)
+])
+def test_arithmetic_precedence(text, expected):
+    assert evaluate(text, boolean=False) == expected
+
+@pytest.mark.parametrize('text, expected', [
+    # and binds tighter than or, not tighter than and
+    ('1 < 2 or 1 > 2 and 1 > 2', True),
+    ('(1 < 2 or 1 > 2) and 1 > 2', False),
+    ('not 1 > 2 and 1 < 2', True),
+    ('not (1 < 2 and 1 > 2)', True),
+    ('not not 1 < 2', True),
+    ('1 + 1 == 2 * 1', True)
+])
+def test_boolean_precedence(text, expected):
+    assert bool(evaluate(text)) is expected
+
+def test_chained_comparison_holds_pairwise():
+    rsi = [10, 30, 50, 70, 90]
+    assert evaluate('30 < RSI() < 70', **{'RSI(14)': rsi}).tolist() == [False, False, True, False, False]
+    assert evaluate('30 <= RSI() <= 70', **{'RSI(14)': rsi}).tolist() == [False, True, True, True, False]
+    assert evaluate('10 < 20 > 15')
+
+def test_terms_are_distinct_in_order_of_appearance():
+    assert labels('close > SMA(200) and RSI() < 30 and close < sma(200)') == ['close', 'SMA(200)', 'RSI(14)']
+
+def test_defaults_and_labels():
+    assert labels('RSI() < 30') == ['RSI(14)']
+    assert labels('MACD() > MACD_SIGNAL(5)') == ['MACD(12, 26, 9)', 'MACD_SIGNAL(5, 26, 9)']
+    assert labels('close > BB_UPPER(20, 2.5)') == ['close', 'BB_UPPER(20, 2.5)']
+
+def test_sma_of_volume_is_labelled_with_its_source():
+    expression = compile_expression('volume > 2 * SMA(volume, 20) and close > SMA(20)')
+    sma_volume, sma_close = expression.terms[1], expression.terms[3]
+    assert [term.label for term in expression.terms] == ['volume', 'SMA(volume, 20)', 'close', 'SMA(20)']
+    assert dict(sma_volume.params) == {'period': 20, 'source': 'volume'}
+    assert dict(sma_close.params) == {'period': 20, 'source': 'close'}
+    assert sma_volume != sma_close
+
+@pytest.mark.parametrize('text, position', [
+    ('RSI() < 30 $', 11),
+    ('RSI() <', 7),
+    ('close >> 5', 7),
+    ('RSI(14 < 30', 7),
+    ('foo > 5', 0),
+    ('close(5) > 1', 5),
+    ('(close > 5', 10),
+    ('close > 5 and 3', 14),
+    ('close and 1 < 2', 6)
+])
+def test_error_positions(text, position):
+    with pytest.raises(ExpressionError, match=f'position {position}'):
+        compile_expression(text)
+
+@pytest.mark.parametrize('text', [
+    '',
+    '   ',
+    'close + 1',
+    f'SMA({MAX_PERIOD + 1}) > 1',
+    'SMA(2.5) > 1',
+    'BB_UPPER(20, 0) > 1',
+    'RSI(1, 2) > 1',
+    'RSI(volume) > 1'
+])
+def test_invalid_expressions(text):
+    with pytest.raises(ExpressionError):
+        compile_expression(text)
+
+def test_sort_expressions_must_be_numbers():
+    assert labels('close / SMA(50)', boolean=False) == ['close', 'SMA(50)']
+    with pytest.raises(ExpressionError, match='Expected a number'):
+        compile_expression('close > 1', boolean=False)
+
+def test_nesting_is_capped():
+    nested = '(' * MAX_DEPTH + 'close' + ')' * MAX_DEPTH + ' > 1'
+    assert labels(nested) == ['close']
+    for text in (
+        '(' * (MAX_DEPTH + 1) + 'close' + ')' * (MAX_DEPTH + 1) + ' > 1',
+        'not ' * (MAX_DEPTH + 1) + 'close > 1',
+        '-' * (MAX_DEPTH + 1) + 'close > 1',
+        '(' * 10000
+    ):
+        with pytest.raises(ExpressionError, match=f'deeper than {MAX_DEPTH}'):
+            compile_expression(text)
+
+RSI = {'RSI(14)': [10, 50, np.nan]}
+
+@pytest.mark.parametrize('text, expected', [
+    ('RSI() < 30', [True, False, False]),
+    ('not RSI() < 30', [False, True, False]),
+    ('not not RSI() < 30', [True, False, False]),
+    ('RSI() != 10', [False, True, False]),
+    ('not RSI() == 10', [False, True, False]),
+    ('RSI() * 2 > 0', [True, True, False])
+])
+def test_missing_values_never_match(text, expected):
+    assert evaluate(text, **RSI).tolist() == expected
+
+def test_missing_values_in_and_or():
+    values = {'RSI(14)': [np.nan, np.nan, np.nan, 10], 'close': [3, 6, np.nan, 6]}
+    # The other side decides where it can, whatever the missing value
+    assert evaluate('RSI() < 30 or close > 5', **values).tolist() == [False, True, False, True]
+    assert evaluate('not (RSI() < 30 and close > 5)', **values).tolist() == [True, False, False, False]
+    assert evaluate('not (RSI() < 30 or close > 5)', **values).tolist() == [False, False, False, False]
+    assert evaluate('not (RSI() < 30 or close < 5)', **values).tolist() == [False, False, False, False]
+
+def test_division_by_zero_does_not_warn():
+    with np.errstate(all='raise'):
+        assert evaluate('close / volume > 1', close=[1, 1], volume=[0, 2]).tolist() == [True, False]
@@ -0,0 +1,131 @@
+"""Stored indicator states advance on one bar per day and match a rebuild from the full history"""
+from datetime import datetime, timedelta
+import pandas as pd
+import pytest
+from flask import Flask
+from app.database import db
+from app.database.models import IndicatorState, Stock, StockHistory
+from app.services.indicator_state_service import indicator_states
+from app.utils.stock_utils import _apply_stock_data
+
+START = datetime(2024, 1, 1)
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def stock(app):
+    stock = Stock(symbol='TEST', name='Test', type='stock')
+    db.session.add(stock)
+    db.session.commit()
+    return stock
+
+def close_on(day):
+    return 100 + day + (day % 3)
+
+def add_daily_bars(stock, days):
+    for day in days:
+        db.session.add(StockHistory(
+            stock_id=stock.id, date=START + timedelta(days=day), close_price=close_on(day), volume=1000 + day
+        ))
+
+def states(stock):
+    rows = IndicatorState.query.filter_by(stock_id=stock.id).all()
+    return {(row.indicator, row.params): (row.value, row.last_bar_ts, row.bars) for row in rows}
+
+def assert_matches_rebuild(stock):
+    advanced = states(stock)
+    indicator_states.reset(stock.id)
+    db.session.expunge_all()
+    indicator_states.advance(stock.id)
+    db.session.commit()
+    rebuilt = states(stock)
+    assert advanced.keys() == rebuilt.keys()
+    for key, (value, last_bar_ts, bars) in advanced.items():
+        assert (last_bar_ts, bars) == rebuilt[key][1:]
+        assert value == pytest.approx(rebuilt[key][0], rel=1e-9), key
+
+def sma(stock):
+    return IndicatorState.query.filter_by(stock_id=stock.id, indicator='sma', params='{"period":20}').one()
+
+def test_intraday_rows_advance_one_bar_per_day(stock):
+    add_daily_bars(stock, range(30))
+    indicator_states.advance(stock.id)
+    db.session.commit()
+
+    # Hourly bars and a close-only quote row on the next day
+    day = START + timedelta(days=30)
+    for hour, close in ((10, 120.0), (11, 121.0), (14, 122.5)):
+        db.session.add(StockHistory(stock_id=stock.id, date=day.replace(hour=hour), close_price=close, volume=500))
+    db.session.add(StockHistory(stock_id=stock.id, date=day.replace(hour=14, minute=5), close_price=123.0))
+    indicator_states.advance(stock.id)
+    db.session.commit()
+
+    state = sma(stock)
+    assert state.last_bar_ts == day
+    assert state.bars == 31
+    closes = [close_on(day) for day in range(30)] + [123.0]
+    assert state.value['value'] == pytest.approx(pd.Series(closes).rolling(20).mean().iloc[-1])
+
+    assert_matches_rebuild(stock)
+
+def test_revised_day_is_fed_again(stock):
+    add_daily_bars(stock, range(30))
+    indicator_states.advance(stock.id)
+    db.session.commit()
+
+    last = StockHistory.query.filter_by(stock_id=stock.id).order_by(StockHistory.date.desc()).first()
+    last.close_price += 5
+    indicator_states.advance(stock.id)
+    db.session.commit()
+
+    assert sma(stock).bars == 30
+    assert_matches_rebuild(stock)
+
+def test_intraday_state_is_rebuilt_on_daily_bars(stock):
+    add_daily_bars(stock, range(30))
+    indicator_states.advance(stock.id)
+    db.session.commit()
+    # As saved before states advanced on daily bars
+    state = sma(stock)
+    state.last_bar_ts = state.last_bar_ts.replace(hour=14, minute=5)
+    state.bars = 45
+
+    indicator_states.advance(stock.id)
+    db.session.commit()
+
+    assert sma(stock).bars == 30
+    assert sma(stock).last_bar_ts == START + timedelta(days=29)
+
+def test_bar_inserted_behind_newer_rows_rebuilds(stock):
+    add_daily_bars(stock, range(30))
+    # A quote refresh stored a close-only row late on day 31, skipping day 30
+    db.session.add(StockHistory(
+        stock_id=stock.id, date=START + timedelta(days=31, hours=14, minutes=5), close_price=140.0
+    ))
+    indicator_states.advance(stock.id)
+    db.session.commit()
+    assert sma(stock).bars == 31
+
+    # The provider's daily bars for days 30 and 31 arrive afterwards
+    dates = pd.DatetimeIndex([START + timedelta(days=30), START + timedelta(days=31)])
+    hist = pd.DataFrame({
+        'Open': [130.0, 138.0], 'High': [131.0, 141.0], 'Low': [129.0, 137.0],
+        'Close': [130.5, 140.0], 'Volume': [2000, 3000]
+    }, index=dates)
+    _apply_stock_data('TEST', stock, {'regularMarketPrice': 140.0}, hist, datetime.utcnow())
+    db.session.commit()
+
+    assert sma(stock).bars == 32
+    closes = [close_on(day) for day in range(30)] + [130.5, 140.0]
+    assert sma(stock).value['value'] == pytest.approx(pd.Series(closes).rolling(20).mean().iloc[-1])
+    assert_matches_rebuild(stock)
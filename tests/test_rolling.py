@@ -0,0 +1,145 @@
+"""The rolling-window and EWM kernels match pandas' .rolling() and .ewm() results"""
+import numpy as np
+import pandas as pd
+import pytest
+from app.utils import rolling
+
+PERIODS = [1, 3, 20]
+
+def assert_matches(actual, expected):
+    np.testing.assert_allclose(actual, np.asarray(expected, dtype=np.float64), rtol=1e-9, atol=1e-7, equal_nan=True)
+
+@pytest.fixture
+def prices():
+    rng = np.random.default_rng(7)
+    return 100 + np.cumsum(rng.normal(0, 1, 250))
+
+@pytest.fixture
+def gappy(prices):
+    """Leading NaNs, scattered gaps and a NaN run longer than any window"""
+    values = prices.copy()
+    values[:5] = np.nan
+    values[[30, 31, 77, 140]] = np.nan
+    values[180:205] = np.nan
+    return values
+
+@pytest.fixture
+def panel(prices, gappy):
+    """bars x symbols: a complete column, a gappy one and an all-NaN one"""
+    return np.column_stack([prices, gappy, np.full(len(prices), np.nan)])
+
+ROLLING = [
+    (rolling.rolling_sum, 'sum'),
+    (rolling.rolling_mean, 'mean'),
+    (rolling.rolling_std, 'std'),
+    (rolling.rolling_var, 'var'),
+    (rolling.rolling_min, 'min'),
+    (rolling.rolling_max, 'max')
+]
+
+@pytest.mark.parametrize('kernel, method', ROLLING)
+@pytest.mark.parametrize('period', PERIODS)
+@pytest.mark.parametrize('min_periods', [None, 1, 2])
+def test_rolling_matches_pandas_1d(gappy, kernel, method, period, min_periods):
+    if min_periods is not None and min_periods > period:
+        pytest.skip("pandas requires min_periods <= period")
+    expected = getattr(pd.Series(gappy).rolling(period, min_periods=min_periods), method)()
+    assert_matches(kernel(gappy, period, min_periods=min_periods), expected)
+
+@pytest.mark.parametrize('kernel, method', ROLLING)
+@pytest.mark.parametrize('period', PERIODS)
+def test_rolling_matches_pandas_2d(panel, kernel, method, period):
+    expected = getattr(pd.DataFrame(panel).rolling(period, min_periods=1), method)()
+    result = kernel(panel, period, min_periods=1)
+    assert result.shape == panel.shape
+    assert_matches(result, expected)
+
+@pytest.mark.parametrize('kernel, method', ROLLING)
+def test_rolling_shorter_than_period(prices, kernel, method):
+    short = prices[:7]
+    for min_periods in (None, 3):
+        expected = getattr(pd.Series(short).rolling(20, min_periods=min_periods), method)()
+        assert_matches(kernel(short, 20, min_periods=min_periods), expected)
+
+@pytest.mark.parametrize('kernel, method', ROLLING)
+def test_rolling_all_nan_windows(gappy, kernel, method):
+    result = kernel(gappy, 10, min_periods=1)
+    # Windows wholly inside the NaN run have nothing to reduce
+    assert np.isnan(result[190:205]).all()
+    assert_matches(result, getattr(pd.Series(gappy).rolling(10, min_periods=1), method)())
+
+@pytest.mark.parametrize('ddof', [0, 1])
+def test_rolling_std_ddof(gappy, ddof):
+    expected = pd.Series(gappy).rolling(20, min_periods=2).std(ddof=ddof)
+    assert_matches(rolling.rolling_std(gappy, 20, min_periods=2, ddof=ddof), expected)
+
+def test_rolling_std_flat_series_is_zero():
+    flat = np.full(50, 123.456)
+    assert (rolling.rolling_std(flat, 10)[9:] == 0).all()
+
+def test_rolling_count(gappy):
+    expected = pd.Series(gappy).notna().astype(float).rolling(10, min_periods=1).sum()
+    assert_matches(rolling.rolling_count(gappy, 10), expected)
+
+@pytest.mark.parametrize('adjust', [True, False])
+@pytest.mark.parametrize('span', [2, 12, 26])
+@pytest.mark.parametrize('min_periods', [0, 5])
+def test_ewm_mean_matches_pandas(prices, gappy, adjust, span, min_periods):
+    # Complete and leading-NaN series take the blocked path, gappy ones the bar-by-bar one
+    leading = prices.copy()
+    leading[:10] = np.nan
+    for values in (prices, leading, gappy):
+        expected = pd.Series(values).ewm(span=span, adjust=adjust, min_periods=min_periods).mean()
+        assert_matches(rolling.ewm_mean(values, span=span, adjust=adjust, min_periods=min_periods), expected)
+
+@pytest.mark.parametrize('adjust', [True, False])
+def test_ewm_mean_alpha_2d(panel, adjust):
+    expected = pd.DataFrame(panel).ewm(alpha=0.05, adjust=adjust).mean()
+    assert_matches(rolling.ewm_mean(panel, alpha=0.05, adjust=adjust), expected)
+
+def test_ewm_mean_long_series():
+    # Long enough for many blocks of the blocked recursion
+    values = 50 + np.cumsum(np.random.default_rng(3).normal(0, 1, 5000))
+    for adjust in (True, False):
+        expected = pd.Series(values).ewm(span=200, adjust=adjust).mean()
+        assert_matches(rolling.ewm_mean(values, span=200, adjust=adjust), expected)
+
+def test_ewm_mean_requires_one_of_span_and_alpha(prices):
+    with pytest.raises(ValueError):
+        rolling.ewm_mean(prices)
+    with pytest.raises(ValueError):
+        rolling.ewm_mean(prices, span=10, alpha=0.1)
+
+@pytest.mark.parametrize('period', [3, 14])
+def test_wilder_matches_pandas(prices, panel, period):
+    for values in (prices, panel):
+        expected = pd.DataFrame(values).ewm(alpha=1 / period, adjust=False, min_periods=period).mean()
+        assert_matches(rolling.wilder(values, period).reshape(expected.shape), expected)
+
+def test_one_and_two_dimensional_agree(panel):
+    result = rolling.rolling_mean(panel, 20, min_periods=1)
+    for column in range(panel.shape[1]):
+        assert_matches(rolling.rolling_mean(panel[:, column], 20, min_periods=1), result[:, column])
+
+@pytest.mark.parametrize('kernel', [kernel for kernel, _ in ROLLING])
+def test_out_buffer_is_filled_and_returned(panel, kernel):
+    out = np.empty(panel.shape)
+    result = kernel(panel, 5, out=out)
+    assert result is out
+    assert_matches(out, kernel(panel, 5))
+
+def test_ewm_out_buffer_is_filled_and_returned(panel):
+    out = np.empty(panel.shape)
+    assert rolling.ewm_mean(panel, span=10, out=out) is out
+    assert rolling.wilder(panel, 14, out=out) is out
+
+@pytest.mark.parametrize('out', [np.empty((10, 2)), np.empty((250, 3), dtype=np.float32)])
+def test_out_buffer_shape_and_dtype_are_checked(panel, out):
+    with pytest.raises(ValueError):
+        rolling.rolling_mean(panel, 5, out=out)
+    with pytest.raises(ValueError):
+        rolling.ewm_mean(panel, span=5, out=out)
+
+def test_empty_input():
+    assert rolling.rolling_mean(np.empty(0), 5).shape == (0,)
+    assert rolling.ewm_mean(np.empty((0, 3)), span=5).shape == (0, 3)